@@ -1,5 +1,6 @@
 import os
 import re
+import sys
 import json
 import time
 import logging
@@ -482,3 +483,1523 @@ def test_extended_compat():
 
     assert 'full_text' in next(T.timeline(screen_name="BarackObama"))
     assert 'text' in next(t_compat.timeline(screen_name="BarackObama"))
+
+
+def test_fanout():
+    import socket
+    from twarc.fanout import FanoutServer
+
+    server = FanoutServer("127.0.0.1:0", buffer_size=10)
+    server.listen()
+    port = server.sock.getsockname()[1]
+
+    client = socket.create_connection(("127.0.0.1", port))
+    for i in range(50):
+        if server.subscribers:
+            break
+        time.sleep(0.1)
+    assert len(server.subscribers) == 1
+
+    # raw lines from the stream are passed on untouched
+    raw = '{"id_str":"3",  "text":"caf\\u00e9"}'
+    server.serve(iter([{"id_str": "1"}, {"id_str": "2"}, raw]))
+    lines = client.makefile().read().splitlines()
+    assert [json.loads(l)["id_str"] for l in lines] == ["1", "2", "3"]
+    assert lines[2] == raw
+
+
+def test_fanout_unix_socket(tmpdir):
+    import socket
+    from twarc.fanout import FanoutServer
+
+    path = str(tmpdir.join("fanout.sock"))
+    address = "unix:" + path
+
+    # a file that isn't a socket is left alone
+    tmpdir.join("fanout.sock").write("data")
+    with pytest.raises(ValueError):
+        FanoutServer(address).listen()
+    assert tmpdir.join("fanout.sock").read() == "data"
+    os.remove(path)
+
+    # so is a socket that a server is listening on
+    server = FanoutServer(address)
+    server.listen()
+    with pytest.raises(ValueError):
+        FanoutServer(address).listen()
+
+    # but a socket left behind by a server that went away is replaced
+    server.sock.close()
+    server = FanoutServer(address)
+    server.listen()
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.connect(path)
+    client.close()
+    server.close()
+    assert not os.path.exists(path)
+
+
+@patch("twarc.client.OAuth1Session", autospec=True)
+def test_raw_stream(oauth1session_class):
+    session = MagicMock(spec=OAuth1Session)
+    oauth1session_class.return_value = session
+    line = b'{"id_str": "1",  "text": "hi"}'
+    session.post.return_value = MagicMock(
+        status_code=200, headers={},
+        iter_lines=lambda chunk_size=None: [b"", line])
+
+    t = twarc.Twarc(token_set=0)
+    assert next(t.sample(raw=True)) == line.decode("utf8")
+    assert next(t.filter(track="hi", raw=True)) == line.decode("utf8")
+    assert next(t.sample()) == {"id_str": "1", "text": "hi"}
+
+
+def test_fanout_slow_subscriber():
+    from twarc.fanout import Subscriber
+
+    s = Subscriber(MagicMock(), "test", buffer_size=2)
+    for i in range(5):
+        s.put(b"line\n")
+    assert s.dropped == 3
+
+
+def test_spool(tmpdir):
+    from twarc.spool import Spool
+    from twarc.command import get_argparser
+
+    tweets = [{"id_str": str(i)} for i in range(1000)]
+    spool = Spool(iter(tweets), str(tmpdir), memory_size=10,
+                  segment_size=1024)
+    results = []
+    for tweet in spool:
+        # stall the consumer until the reader has finished
+        if not results:
+            spool.thread.join()
+            assert spool.spilled > 0
+        results.append(tweet)
+
+    assert results == tweets
+    assert os.listdir(str(tmpdir)) == []
+
+    # the oldest segments are dropped once there are max_segments of them
+    spool = Spool(iter(tweets), str(tmpdir), memory_size=10,
+                  segment_size=1024, max_segments=2)
+    results = []
+    for tweet in spool:
+        if not results:
+            spool.thread.join()
+            assert len(os.listdir(str(tmpdir))) == 2
+        results.append(tweet)
+
+    assert spool.discarded > 0
+    assert results[:10] == tweets[:10]
+    assert results[-1] == tweets[-1]
+    assert len(results) < len(tweets)
+    assert get_argparser().parse_args(
+        ["filter", "cats", "0"]).spool_segments == 160
+
+
+def test_aho_corasick():
+    from twarc.matcher import AhoCorasick
+
+    ac = AhoCorasick(["he", "she", "his", "hers"])
+    found = [(pos, ac.keywords[i]) for pos, i in ac.search("ushers")]
+    assert sorted(found) == [(3, "he"), (3, "she"), (5, "hers")]
+
+
+def test_matching_rules():
+    from twarc.matcher import RuleMatcher
+
+    matcher = RuleMatcher(track="obama,white house,blm",
+                          follow="759251",
+                          locations="-74,40,-73,41")
+    tweet = {
+        "id_str": "1",
+        "full_text": "Obama at the White House",
+        "user": {"id_str": "12"},
+        "entities": {"hashtags": [{"text": "BLM"}]},
+        "coordinates": {"coordinates": [-73.5, 40.5]},
+        "in_reply_to_user_id_str": "759251"
+    }
+    assert matcher.match(tweet) == [
+        "obama", "white house", "blm", "follow:759251",
+        "locations:-74,40,-73,41"
+    ]
+
+    # words have to match whole tokens and every word in a phrase
+    tweet = {"id_str": "2", "text": "obamacare in the house", "user": {}}
+    assert matcher.match(tweet) == []
+
+    things = list(matcher.annotate([tweet, {"limit": {"track": 1}}]))
+    assert things[0]["matching_rules"] == []
+    assert "matching_rules" not in things[1]
+
+
+def test_token_pool_rate_limit():
+    from twarc.scheduler import TokenPool
+
+    pool = TokenPool([0, 1])
+    resp = MagicMock(status_code=429, headers={
+        "x-rate-limit-remaining": "0",
+        "x-rate-limit-reset": str(int(time.time()) + 900)
+    })
+    pool.update(0, "/search/tweets", resp)
+    assert pool.acquire("/search/tweets") == 1
+    # other resources are limited separately
+    assert pool.acquire("/users/lookup") in (0, 1)
+
+
+def test_token_pool_reserve():
+    import threading
+    from twarc.scheduler import TokenPool, Job, BULK, INTERACTIVE
+
+    pool = TokenPool([0], reserve=1)
+    resp = MagicMock(status_code=200, headers={
+        "x-rate-limit-remaining": "2",
+        "x-rate-limit-reset": str(int(time.time()) + 900)
+    })
+    pool.update(0, "/statuses/lookup", resp)
+
+    bulk = Job(None, priority=BULK)
+    assert pool.acquire("/statuses/lookup", bulk) == 0
+
+    # the last call is held back for higher priority jobs
+    got = []
+    thread = threading.Thread(
+        target=lambda: got.append(pool.acquire("/statuses/lookup", bulk)))
+    thread.daemon = True
+    thread.start()
+    thread.join(0.5)
+    assert got == []
+
+    interactive = Job(None, priority=INTERACTIVE)
+    assert pool.acquire("/statuses/lookup", interactive) == 0
+
+
+def test_token_pool_resources():
+    import threading
+    from twarc.scheduler import TokenPool
+
+    pool = TokenPool([0])
+    reset = str(int(time.time()) + 900)
+    pool.update(0, "/statuses/lookup", MagicMock(status_code=200, headers={
+        "x-rate-limit-remaining": "0", "x-rate-limit-reset": reset}))
+    pool.update(0, "/search/tweets", MagicMock(status_code=200, headers={
+        "x-rate-limit-remaining": "180", "x-rate-limit-reset": reset}))
+
+    # a job waiting for a resource that has run out
+    blocked = threading.Thread(
+        target=lambda: pool.acquire("/statuses/lookup"))
+    blocked.daemon = True
+    blocked.start()
+    time.sleep(0.2)
+
+    # doesn't hold up one of the same priority that wants another resource
+    got = []
+    thread = threading.Thread(
+        target=lambda: got.append(pool.acquire("/search/tweets")))
+    thread.daemon = True
+    thread.start()
+    thread.join(2)
+    assert got == [0]
+    assert blocked.is_alive()
+
+
+@patch("twarc.client.OAuth1Session", autospec=True)
+def test_scheduler(oauth1session_class):
+    from twarc.scheduler import TokenPool, Scheduler
+
+    session = MagicMock(spec=OAuth1Session)
+    oauth1session_class.return_value = session
+    session.get.return_value = MagicMock(
+        status_code=200, headers={}, json=lambda: [{"id_str": "1"}])
+
+    results = []
+    scheduler = Scheduler(TokenPool([0, 1]), workers=2)
+    jobs = [
+        scheduler.submit(lambda t: t.retweets("123"),
+                         callback=lambda job, tweet: results.append(tweet))
+        for i in range(4)
+    ]
+    scheduler.join()
+    scheduler.shutdown()
+
+    assert [job.status for job in jobs] == ["done"] * 4
+    assert len(results) == 4
+
+
+@patch("twarc.client.OAuth1Session", autospec=True)
+def test_batch(oauth1session_class, tmpdir, capsys):
+    from twarc.batch import run_batch
+    from twarc.command import get_argparser
+    from twarc.scheduler import TokenPool
+
+    session = MagicMock(spec=OAuth1Session)
+    oauth1session_class.return_value = session
+    session.get.return_value = MagicMock(
+        status_code=200, headers={}, json=lambda: [{"id_str": "1"}])
+
+    jobfile = tmpdir.join("jobs.jsonl")
+    jobfile.write("\n".join([
+        '{"command": "retweets", "query": "123"}',
+        '{"command": "retweets", "query": "456", "output": "%s"}' %
+        tmpdir.join("456.jsonl"),
+        '{"command": "replies", "query": "789"}'
+    ]))
+    args = get_argparser().parse_args(["batch", str(jobfile), "0"])
+
+    # the replies job fails because the tweet can't be found
+    session.post.return_value = MagicMock(
+        status_code=200, headers={}, json=lambda: {"id": {"789": None}})
+    assert run_batch(str(jobfile), args, TokenPool([0])) == 1
+
+    statuses = [json.loads(l) for l in capsys.readouterr().out.splitlines()]
+    assert [s["status"] for s in statuses] == ["done", "done", "error"]
+    assert tmpdir.join("jobs-0001.jsonl").read().strip() == '{"id_str": "1"}'
+    assert tmpdir.join("456.jsonl").read().strip() == '{"id_str": "1"}'
+
+    # streams never finish, so they can't be run in a batch
+    jobfile.write('{"command": "filter", "query": "cats"}')
+    with pytest.raises(ValueError):
+        run_batch(str(jobfile), args, TokenPool([0]))
+
+
+@patch("twarc.client.OAuth1Session", autospec=True)
+def test_batch_job_options(oauth1session_class, tmpdir, capsys):
+    from twarc.batch import run_batch
+    from twarc.command import get_argparser
+    from twarc.scheduler import TokenPool
+
+    session = MagicMock(spec=OAuth1Session)
+    oauth1session_class.return_value = session
+    requested = {}
+
+    def get(url, params=None, **kwargs):
+        if "max_id" in params:
+            tweets = []
+        else:
+            requested[params["screen_name"]] = dict(params)
+            tweets = [{"id_str": "5", "full_text": "hi", "user": {}}]
+        return MagicMock(status_code=200, headers={}, json=lambda: tweets)
+
+    session.get.side_effect = get
+
+    # the job's options are used for its requests, the global ones for
+    # the rest
+    jobfile = tmpdir.join("jobs.jsonl")
+    jobfile.write("\n".join([
+        '{"command": "timeline", "query": "a", "trim_user": true, '
+        '"fields": "id_str", "tweet_mode": "compat"}',
+        '{"command": "timeline", "query": "b"}'
+    ]))
+    args = get_argparser().parse_args(["batch", str(jobfile), "0",
+                                       "--no_entities"])
+    assert run_batch(str(jobfile), args, TokenPool([0])) == 0
+
+    assert requested["a"]["trim_user"] == "true"
+    assert requested["a"]["tweet_mode"] == "compat"
+    assert "trim_user" not in requested["b"]
+    assert requested["b"]["tweet_mode"] == "extended"
+    assert requested["b"]["include_entities"] == "false"
+    assert json.loads(tmpdir.join("jobs-0001.jsonl").read()) == \
+        {"id_str": "5"}
+    assert "full_text" in json.loads(tmpdir.join("jobs-0002.jsonl").read())
+
+
+@patch("twarc.client.OAuth1Session", autospec=True)
+def test_daemon(oauth1session_class, tmpdir):
+    import threading
+    from twarc.command import get_argparser
+    from twarc.daemon import Daemon, DaemonServer
+    from twarc.scheduler import TokenPool
+    try:
+        from urllib.request import urlopen, Request
+    except ImportError:
+        from urllib2 import urlopen, Request
+
+    session = MagicMock(spec=OAuth1Session)
+    oauth1session_class.return_value = session
+    session.post.return_value = MagicMock(
+        status_code=200, headers={},
+        json=lambda: {"id": {"1": {"id_str": "1"}, "2": {"id_str": "2"}}})
+
+    args = get_argparser().parse_args(["daemon", str(tmpdir), "0"])
+    daemon = Daemon(str(tmpdir), args, TokenPool([0]))
+    server = DaemonServer(("127.0.0.1", 0), daemon)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    url = "http://127.0.0.1:%s/jobs" % server.server_address[1]
+
+    req = Request(url, data=b'{"command": "hydrate", "ids": ["1", "2"]}')
+    job = json.loads(urlopen(req).read().decode("utf8"))
+    assert job["id"] == 1
+
+    results = urlopen(url + "/1/results").read().decode("utf8")
+    assert [json.loads(l)["id_str"] for l in results.splitlines()] == \
+        ["1", "2"]
+    status = json.loads(urlopen(url + "/1").read().decode("utf8"))
+    assert status["status"] == "done"
+    assert status["count"] == 2
+
+    server.shutdown()
+    daemon.stop()
+
+
+@patch("twarc.client.OAuth1Session", autospec=True)
+def test_daemon_since_id(oauth1session_class, tmpdir):
+    from twarc.command import get_argparser
+    from twarc.daemon import Daemon
+    from twarc.scheduler import TokenPool
+
+    session = MagicMock(spec=OAuth1Session)
+    oauth1session_class.return_value = session
+    fail = [True]
+
+    def get(url, params=None, **kwargs):
+        if "max_id" not in params:
+            statuses = [{"id_str": "10"}]
+        elif fail[0]:
+            raise ValueError("second page failed")
+        else:
+            statuses = []
+        return MagicMock(status_code=200, headers={},
+                         json=lambda: {"statuses": statuses})
+
+    session.get.side_effect = get
+
+    args = get_argparser().parse_args(["daemon", str(tmpdir), "0"])
+    daemon = Daemon(str(tmpdir), args, TokenPool([0]))
+
+    # a run that fails part way doesn't move since_id on
+    job = daemon.submit({"command": "search", "query": "x", "every": 3600})
+    job.scheduled.wait()
+    assert job.scheduled.status == "error"
+    assert job.since_id is None
+
+    while job.runs == 0:
+        time.sleep(0.01)
+    fail[0] = False
+    job.status = "pending"
+    job.next_run = time.time()
+    daemon.start_due()
+    job.scheduled.wait()
+    assert job.scheduled.status == "done"
+    assert job.since_id == "10"
+    daemon.stop()
+
+
+def test_trim_error(tmpdir):
+    from twarc.batch import run_batch
+    from twarc.command import get_argparser, trim_error
+    from twarc.daemon import Daemon
+    from twarc.scheduler import TokenPool
+
+    parse = get_argparser().parse_args
+    assert trim_error("search", parse(["search", "x", "0"])) is None
+    assert trim_error("search", parse(["search", "x", "0", "--trim_user"])) \
+        is None
+    assert trim_error("replies", parse(["replies", "1", "0", "--no_entities"]))
+    assert trim_error("search", parse(["search", "x", "0", "--fields", "id",
+                                       "--format", "csv"]))
+    assert trim_error("search_users", parse(["search_users", "x", "0",
+                                             "--fields", "id"]))
+
+    # batch and daemon jobs are checked too
+    jobfile = tmpdir.join("jobs.jsonl")
+    jobfile.write('{"command": "search", "query": "x", "format": "csv"}')
+    args = parse(["batch", str(jobfile), "0", "--trim_user"])
+    with pytest.raises(ValueError):
+        run_batch(str(jobfile), args, TokenPool([0]))
+
+    args = parse(["daemon", str(tmpdir), "0", "--trim_user"])
+    daemon = Daemon(str(tmpdir), args, TokenPool([0]))
+    with pytest.raises(ValueError):
+        daemon.submit({"command": "search", "query": "x", "format": "csv"})
+    daemon.stop()
+
+
+@patch("twarc.client.OAuth1Session", autospec=True)
+def test_timelines(oauth1session_class, tmpdir):
+    from twarc.scheduler import TokenPool
+    from twarc.timelines import SinceIdStore, harvest
+
+    session = MagicMock(spec=OAuth1Session)
+    oauth1session_class.return_value = session
+
+    def get(url, params=None, **kwargs):
+        if params.get("max_id") or params["screen_name"] == "quiet":
+            statuses = []
+        elif params.get("since_id"):
+            statuses = [{"id_str": "30"}]
+        else:
+            statuses = [{"id_str": "20"}, {"id_str": "10"}]
+        return MagicMock(status_code=200, headers={}, json=lambda: statuses)
+    session.get.side_effect = get
+
+    store = SinceIdStore(str(tmpdir.join("state.db")))
+    tweets = []
+    pool = TokenPool([0])
+    assert harvest(["deray", "quiet"], store, pool, tweets.append) == 2
+    assert sorted(t["id_str"] for t in tweets) == ["10", "20"]
+    assert store.get("deray")[0] == "20"
+    assert store.get("quiet")[2] == 0
+
+    # only new tweets are fetched and quiet users are left alone
+    tweets = []
+    assert harvest(["deray", "quiet"], store, pool, tweets.append,
+                   cooloff=3600) == 1
+    assert [t["id_str"] for t in tweets] == ["30"]
+    assert store.get("deray")[0] == "30"
+
+
+def test_delta_encoding():
+    from twarc.ids import delta_encode, delta_decode, encode_varint
+
+    assert encode_varint(300) == b"\xac\x02"
+    ids = [936704697473302528, 12, 759251, 12]
+    encoded = delta_encode(ids)
+    assert delta_decode(encoded) == [12, 759251, 936704697473302528]
+    assert len(encoded) < 16
+
+
+@patch("twarc.client.OAuth1Session", autospec=True)
+def test_graph_crawl(oauth1session_class, tmpdir):
+    from twarc.graph import GraphCrawler
+    from twarc.ids import EdgeWriter, read_edges
+    from twarc.scheduler import TokenPool
+
+    # 1 and 2 follow each other and both follow 3
+    friends = {"1": [2, 3], "2": [1, 3], "3": []}
+    session = MagicMock(spec=OAuth1Session)
+    oauth1session_class.return_value = session
+    session.get.side_effect = lambda url, params=None, **kwargs: MagicMock(
+        status_code=200, headers={},
+        json=lambda: {"ids": friends[params["user_id"]], "next_cursor": 0})
+
+    crawler = GraphCrawler(str(tmpdir.join("graph.db")), TokenPool([0]),
+                           level=3, workers=2)
+    crawler.seed(["1"])
+    writer = EdgeWriter(str(tmpdir.join("graph.edges")))
+    crawler.crawl(writer)
+    writer.close()
+
+    edges = dict(read_edges(str(tmpdir.join("graph.edges"))))
+    assert edges == {1: [2, 3], 2: [1, 3], 3: []}
+    # each user was only fetched once
+    assert session.get.call_count == 3
+    assert crawler.counts() == {"done": 3}
+
+
+def test_graph_resume(tmpdir):
+    from twarc.graph import GraphCrawler
+    from twarc.scheduler import TokenPool
+
+    pages = {-1: ([5, 4], 10), 10: ([3, 2], 20), 20: ([1], 0)}
+    cursors = []
+
+    class Pages(object):
+        def __init__(self, fail_at=None):
+            self.fail_at = fail_at
+
+        def id_pages(self, relation, user, cursor=-1):
+            while cursor:
+                cursors.append(cursor)
+                if cursor == self.fail_at:
+                    raise IOError("interrupted")
+                page, cursor = pages[cursor]
+                yield page, cursor
+
+    crawler = GraphCrawler(str(tmpdir.join("graph.db")), TokenPool([0]))
+    with pytest.raises(IOError):
+        crawler._fetch(Pages(fail_at=20), 1)
+    # each page that was fetched is saved on its own
+    assert crawler.db.execute("SELECT cursor FROM pages").fetchall() == \
+        [(10,), (20,)]
+
+    del cursors[:]
+    assert sorted(crawler._fetch(Pages(), 1)) == [1, 2, 3, 4, 5]
+    assert cursors == [20]
+    crawler.close()
+
+
+def test_snapshots(tmpdir):
+    from twarc.snapshots import SnapshotStore
+
+    store = SnapshotStore(str(tmpdir))
+    old = [5, 1, 3, 900000000000000000]
+    new = [1, 2, 3, 900000000000000001]
+    store.save("deray", "followers", old, "20180101T000000Z")
+    store.save("deray", "followers", new, "20180102T000000Z")
+
+    assert store.timestamps("deray", "followers") == \
+        ["20180101T000000Z", "20180102T000000Z"]
+    assert store.load("deray", "followers", "20180101T000000Z") == \
+        [1, 3, 5, 900000000000000000]
+    added, removed = store.diff("deray", "followers", "20180101T000000Z",
+                                "20180102T000000Z")
+    assert added == [2, 900000000000000001]
+    assert removed == [5, 900000000000000000]
+
+    # snapshots taken in the same second don't overwrite each other, and
+    # sort after ones named to the second
+    first = store.save("deray", "followers", [1])
+    second = store.save("deray", "followers", [2])
+    assert first != second
+    assert re.match(r"^\d{8}T\d{6}\.\d{6}Z$", first)
+    assert store.timestamps("deray", "followers")[-2:] == [first, second]
+    assert store.load("deray", "followers", first) == [1]
+    assert store.load("deray", "followers", second) == [2]
+    with patch("time.time", return_value=1514764800.0):
+        assert store.save("deray", "followers", [3]) == \
+            "20180101T000000.000000Z"
+        assert store.save("deray", "followers", [4]) == \
+            "20180101T000000.000001Z"
+    assert store.timestamps("deray", "followers")[:3] == \
+        ["20180101T000000Z", "20180101T000000.000000Z",
+         "20180101T000000.000001Z"]
+
+
+@patch("twarc.client.OAuth1Session", autospec=True)
+def test_follower_users_pipeline(oauth1session_class):
+    from twarc.pipeline import follower_users
+    from twarc.scheduler import TokenPool
+
+    session = MagicMock(spec=OAuth1Session)
+    oauth1session_class.return_value = session
+
+    def get(url, params=None, **kwargs):
+        if "followers/ids" in url:
+            cursor = params["cursor"]
+            data = {
+                "ids": list(range(cursor * 150, (cursor + 1) * 150)),
+                "next_cursor": 0 if cursor == 1 else 1
+            } if cursor >= 0 else {
+                "ids": list(range(150)), "next_cursor": 1
+            }
+        else:
+            data = [{"id_str": i} for i in params["user_id"].split(",")]
+        return MagicMock(status_code=200, headers={}, json=lambda: data)
+    session.get.side_effect = get
+
+    users = list(follower_users("deray", TokenPool([0])))
+    assert len(users) == 300
+    lookups = [c for c in session.get.call_args_list
+               if "users/lookup" in c[0][0]]
+    assert len(lookups) == 3
+
+
+def test_cache(tmpdir):
+    from twarc.cache import Cache
+
+    cache = Cache(str(tmpdir.join("cache.db")), ttl=60, max_size=10)
+    cache.put_many("tweet", [{"id_str": str(i)} for i in range(10)])
+    assert cache.get("tweet", "1") == {"id_str": "1"}
+    assert cache.get("user", "1") is None
+
+    # the least recently used entries are evicted first
+    cache.put("tweet", "10", {"id_str": "10"})
+    assert cache.get("tweet", "1") == {"id_str": "1"}
+    assert cache.get("tweet", "10") == {"id_str": "10"}
+    assert len(cache.get_many("tweet", range(11))) == 9
+
+    cache.ttl = -1
+    assert cache.get("tweet", "1") is None
+
+
+@patch("twarc.client.OAuth1Session", autospec=True)
+def test_hydrate_cache(oauth1session_class, tmpdir):
+    from twarc.cache import Cache
+
+    session = MagicMock(spec=OAuth1Session)
+    oauth1session_class.return_value = session
+    session.post.side_effect = lambda url, data=None, **kwargs: MagicMock(
+        status_code=200, headers={},
+        json=lambda: {"id": dict((i, {"id_str": i})
+                                 for i in data["id"].split(","))})
+
+    t = twarc.Twarc(token_set=0, cache=Cache(str(tmpdir.join("cache.db"))))
+    assert len(list(t.hydrate(["1", "2"]))) == 2
+    assert [tw["id_str"] for tw in t.hydrate(["1", "2", "3"])] == \
+        ["1", "2", "3"]
+    assert session.post.call_args[1]["data"]["id"] == "3"
+    list(t.hydrate(["3", "2"]))
+    assert session.post.call_count == 2
+
+
+@patch("twarc.client.OAuth1Session", autospec=True)
+def test_hydrate_unavailable(oauth1session_class):
+    session = MagicMock(spec=OAuth1Session)
+    oauth1session_class.return_value = session
+    session.post.side_effect = lambda url, data=None, **kwargs: MagicMock(
+        status_code=200, headers={},
+        json=lambda: {"id": dict(
+            (i, {"id_str": i} if int(i) % 2 else None)
+            for i in data["id"].split(","))})
+
+    t = twarc.Twarc(token_set=0)
+    ids = [str(i) for i in range(1, 151)] * 2
+    missing = []
+    tweets = list(t.hydrate(iter(ids), unavailable=missing.append))
+    assert len(tweets) == 75
+    assert len(missing) == 75
+    assert missing[0] == "2"
+    # duplicate ids were only looked up once
+    assert session.post.call_count == 2
+    assert session.post.call_args[1]["data"]["map"] == "true"
+
+
+def test_id_filter():
+    from twarc.ids import IdFilter
+
+    # ids past the exact limit are kept exactly on disk
+    f = IdFilter(exact_limit=10)
+    assert [f.add(i) for i in range(2000)] == [True] * 2000
+    assert [f.add(i) for i in range(2000)] == [False] * 2000
+    assert 5 in f and 1500 in f and 3000 not in f
+    f.close()
+
+    # unless a bloom filter is asked for, which counts what it skips
+    f = IdFilter(exact_limit=10, bloom_capacity=1000)
+    assert [f.add(i) for i in range(20)] == [True] * 20
+    assert [f.add(i) for i in range(20)] == [False] * 20
+    assert 5 in f and 15 in f and 2000 not in f
+    assert f.skipped == 10
+
+
+@patch("twarc.client.OAuth1Session", autospec=True)
+def test_hydrate_bad_ids(oauth1session_class):
+    from twarc.ids import IdFilter
+
+    session = MagicMock(spec=OAuth1Session)
+    oauth1session_class.return_value = session
+    session.post.side_effect = lambda url, data=None, **kwargs: MagicMock(
+        status_code=200, headers={},
+        json=lambda: {"id": dict((i, {"id_str": i})
+                                 for i in data["id"].split(","))})
+
+    # lines that aren't ids are skipped, and the filter is closed after
+    t = twarc.Twarc(token_set=0)
+    with patch.object(IdFilter, "close", autospec=True) as close:
+        tweets = list(t.hydrate(iter(["1\n", "id_str\n", "2", "1", "x 3"])))
+    assert [tweet["id_str"] for tweet in tweets] == ["1", "2"]
+    assert close.call_count == 1
+
+
+@patch("twarc.client.OAuth1Session", autospec=True)
+def test_trimmed_hydrate(oauth1session_class):
+    session = MagicMock(spec=OAuth1Session)
+    oauth1session_class.return_value = session
+    session.post.side_effect = lambda url, data=None, **kwargs: MagicMock(
+        status_code=200, headers={},
+        json=lambda: {"id": dict(
+            (i, {"id": int(i), "id_str": i, "full_text": "hi",
+                 "retweet_count": 3, "user": {"id_str": "12"}})
+            for i in data["id"].split(","))})
+
+    t = twarc.Twarc(token_set=0, trim_user=True, include_entities=False,
+                    fields=["retweet_count", "user.id_str", "missing.field"])
+    tweets = list(t.hydrate(iter(["1", "2"])))
+    assert tweets[0] == {"id": 1, "id_str": "1", "retweet_count": 3,
+                         "user": {"id_str": "12"}}
+    data = session.post.call_args[1]["data"]
+    assert data["trim_user"] == "true"
+    assert data["include_entities"] == "false"
+
+
+def test_id_files(tmpdir):
+    from twarc.ids import IdWriter, is_id_file, read_ids
+    from twarc.command import id_input
+
+    ids = [1018000000000000000 - i * 7919 for i in range(100000)] + [5, 5]
+    for compress in (False, True):
+        path = str(tmpdir.join("ids-%s.bin" % compress))
+        # compressed ids are sorted in runs that are merged at the end
+        writer = IdWriter(path, compress=compress, run_size=30000)
+        for i in ids:
+            writer.write(i)
+        writer.close()
+        assert is_id_file(path)
+        expected = sorted(set(ids)) if compress else ids
+        assert list(read_ids(path)) == expected
+        assert next(id_input(path)) == str(expected[0])
+
+    text = tmpdir.join("ids.txt")
+    text.write("1\n2\n")
+    assert not is_id_file(str(text))
+    assert [i.strip() for i in id_input(str(text))] == ["1", "2"]
+
+
+@patch("twarc.client.OAuth1Session", autospec=True)
+def test_coordinator(oauth1session_class, tmpdir):
+    from twarc.coordinator import Coordinator
+
+    session = MagicMock(spec=OAuth1Session)
+    oauth1session_class.return_value = session
+    session.post.side_effect = lambda url, data=None, **kwargs: MagicMock(
+        status_code=200, headers={},
+        json=lambda: {"id": dict(
+            (i, {"id_str": i} if int(i) % 3 else None)
+            for i in data["id"].split(","))})
+
+    class Collect(object):
+        def __init__(self):
+            self.things = []
+
+        def write(self, thing):
+            self.things.append(thing)
+
+    coordinator = Coordinator(str(tmpdir), [0, 1], batch_size=50)
+    assert coordinator.load(str(i) for i in list(range(1, 301)) * 2) == 6
+    output = Collect()
+    unavailable = Collect()
+    assert coordinator.run(output, unavailable, poll=0.1) == 0
+    coordinator.close()
+    assert len(output.things) == 200
+    assert len(set(t["id_str"] for t in output.things)) == 200
+    assert len(unavailable.things) == 100
+    assert tmpdir.listdir() == []
+
+
+@patch("twarc.client.OAuth1Session", autospec=True)
+def test_coordinator_failed(oauth1session_class, tmpdir):
+    from twarc.coordinator import Coordinator
+
+    session = MagicMock(spec=OAuth1Session)
+    oauth1session_class.return_value = session
+
+    def post(url, data=None, **kwargs):
+        ids = data["id"].split(",")
+        if "3" in ids:
+            raise ValueError("bad range")
+        return MagicMock(status_code=200, headers={},
+                         json=lambda: {"id": dict((i, {"id_str": i})
+                                                  for i in ids)})
+    session.post.side_effect = post
+
+    coordinator = Coordinator(str(tmpdir), [0], batch_size=2,
+                              max_attempts=2)
+    coordinator.load(str(i) for i in range(1, 6))
+    output = MagicMock()
+    assert coordinator.run(output, poll=0.1) == 1
+    coordinator.close()
+    assert output.write.call_count == 3
+
+    # the failed range's ids are kept, and so is the queue
+    assert tmpdir.join("failed-ids.txt").read().split() == ["3", "4"]
+    assert tmpdir.join("queue.db").exists()
+
+
+def test_work_queue_requeue(tmpdir):
+    from twarc.coordinator import WorkQueue, RUNNING
+
+    queue = WorkQueue(str(tmpdir))
+    queue.add(1, [3, 1, 2])
+    assert queue.claim(100, 60) == (1, [1, 2, 3])
+    assert queue.claim(200, 60) is None
+    # worker 100 died, so worker 200 gets the range
+    assert queue.requeue(100) == 1
+    assert queue.claim(200, 60) == (1, [1, 2, 3])
+    tmp = tmpdir.join("late.tmp")
+    tmp.write("")
+    assert not queue.finish(1, 100, [(str(tmp), str(tmpdir.join("x")))])
+    assert not tmp.exists()
+    assert queue.counts() == {RUNNING: 1}
+
+
+@patch("twarc.client.OAuth1Session", autospec=True)
+def test_replies_memoized(oauth1session_class):
+    session = MagicMock(spec=OAuth1Session)
+    oauth1session_class.return_value = session
+
+    def tweet(id, screen_name, reply_to=None, quote=None):
+        return {"id_str": str(id), "user": {"screen_name": screen_name},
+                "in_reply_to_status_id_str": reply_to and str(reply_to),
+                "quoted_status_id_str": quote and str(quote)}
+
+    # 10 is a reply to 5 and quotes 3; 11 and 12 reply to 10, 13 to 11
+    tweets = {
+        3: tweet(3, "carol"),
+        5: tweet(5, "alice"),
+        10: tweet(10, "bob", reply_to=5, quote=3),
+        11: tweet(11, "alice", reply_to=10),
+        12: tweet(12, "carol", reply_to=10),
+        13: tweet(13, "bob", reply_to=11),
+    }
+
+    def get(url, params=None, **kwargs):
+        screen_name = params["q"][3:]
+        since_id = int(params.get("since_id", 0))
+        max_id = int(params.get("max_id", 1 << 62))
+        statuses = [t for i, t in sorted(tweets.items(), reverse=True)
+                    if since_id < i <= max_id and t["in_reply_to_status_id_str"]
+                    and tweets[int(t["in_reply_to_status_id_str"])]["user"]
+                    ["screen_name"] == screen_name]
+        return MagicMock(status_code=200, headers={},
+                         json=lambda: {"statuses": statuses})
+
+    session.get.side_effect = get
+    session.post.side_effect = lambda url, data=None, **kwargs: MagicMock(
+        status_code=200, headers={},
+        json=lambda: {"id": dict((i, tweets[int(i)])
+                                 for i in data["id"].split(","))})
+
+    t = twarc.Twarc(token_set=0)
+    found = [r["id_str"] for r in t.replies(tweets[10], recursive=True)]
+    assert sorted(found) == ["10", "11", "12", "13", "3", "5"]
+    assert found[0] == "10"
+    # 5 and 3 were looked up together
+    assert session.post.call_count == 1
+    # every author is searched for once, except alice whose older tweet 5
+    # turned up after 11 had been searched for (each search ends with an
+    # empty page)
+    searched = [c[1]["params"]["q"] for c in session.get.call_args_list]
+    assert len(searched) == 2 * 4
+
+
+def test_geosweep_grid(tmpdir):
+    from twarc.geosweep import grid, parse_area, intersects, distance
+
+    cells = grid((-1, -1, 1, 1), 50)
+    assert len(cells) == 25
+    for cell in cells:
+        lat, lon, radius = cell.geocode().split(",")
+        assert 28 < float(radius[:-2]) < 32
+    assert len(cells[0].split()) == 4
+
+    triangle = tmpdir.join("triangle.geojson")
+    triangle.write(json.dumps({"type": "Feature", "geometry": {
+        "type": "Polygon",
+        "coordinates": [[[-1, -1], [1, -1], [-1, 1], [-1, -1]]]}}))
+    bbox, polygons = parse_area(str(triangle))
+    assert bbox == (-1, -1, 1, 1)
+    inside = [c for c in cells if intersects(c, polygons)]
+    assert 10 < len(inside) < 25
+    assert 110 < distance(0, 0, 1, 0) < 112
+
+
+@patch("twarc.client.OAuth1Session", autospec=True)
+def test_geosweep(oauth1session_class):
+    from twarc.geosweep import sweep
+    from twarc.scheduler import TokenPool
+
+    session = MagicMock(spec=OAuth1Session)
+    oauth1session_class.return_value = session
+    geocodes = []
+
+    def get(url, params=None, **kwargs):
+        # every circle finds tweet 1, the south west cell also finds a
+        # page of 100 busy tweets
+        geocodes.append((params["geocode"], params.get("max_id")))
+        lat, lon, radius = params["geocode"].split(",")
+        statuses = []
+        if "max_id" not in params:
+            statuses = [{"id_str": "1"}]
+            if float(lat) < 0 and float(lon) < 0 and \
+                    float(radius[:-2]) > 50:
+                statuses = [{"id_str": str(i)} for i in range(200, 100, -1)]
+        return MagicMock(status_code=200, headers={},
+                         json=lambda: {"statuses": statuses})
+
+    session.get.side_effect = get
+    found = []
+    searched = sweep("pizza", "-1,-1,1,1", TokenPool([0]), found.append,
+                     cell_size=120, cell_tweets=100)
+    # four cells, one of which was split into four
+    assert searched == 8
+    assert sorted(found, key=lambda t: int(t["id_str"]))[0]["id_str"] == "1"
+    assert len(found) == 101
+    assert ("-0.500000,-0.500000,78.626km", None) in geocodes
+    assert sum(1 for g, max_id in geocodes if max_id == "100") == 4
+
+
+def test_query_packing():
+    from twarc.packing import QueryPacker, pack_query, encoded_length
+    from twarc.packing import pack as pack_queries
+
+    queries = ["cats", "red pandas", "#caturday", "from:edsu", "cats"]
+    queries += ["word%s" % i for i in range(100)]
+    packer = QueryPacker(queries, max_length=100)
+    assert len(packer.queries) == 104
+    assert packer.packs[0][:3] == ["cats", "red pandas", "#caturday"]
+    assert pack_query(packer.packs[0]).startswith(
+        "cats OR (red pandas) OR #caturday OR word0")
+    assert all(encoded_length(pack_query(p)) <= 100 for p in packer.packs)
+    assert packer.packs[-1] == ["from:edsu"]
+    assert 10 < len(packer.packs) < 20
+
+    pack = packer.packs[0]
+    tweet = {"id_str": "5", "full_text": "Red and giant pandas #caturday"}
+    assert packer.attribute(tweet, pack) == ["red pandas", "#caturday"]
+    assert packer.attribute({"id_str": "6", "full_text": "?"}, pack) == pack
+
+    assert packer.since_id(pack) is None
+    packer.update(pack, "100", 5)
+    assert packer.since_id(pack) == "100"
+    packer.update(pack, "200", 1000)
+    assert packer.packs[0] == pack[:len(pack) // 2]
+
+    # the limit is checked after the query is URL encoded
+    assert encoded_length(u"#caf\xe9 OR (red pandas)") == 38
+    packs = pack_queries([u"caf\xe9 %s" % i for i in range(100)])
+    assert all(encoded_length(pack_query(p)) <= 500 for p in packs)
+    assert max(len(pack_query(p)) for p in packs) < 300
+
+
+@patch("twarc.client.OAuth1Session", autospec=True)
+def test_search_packed(oauth1session_class, tmpdir):
+    from twarc.packing import QueryPacker, search_packed
+    from twarc.scheduler import TokenPool
+
+    session = MagicMock(spec=OAuth1Session)
+    oauth1session_class.return_value = session
+    tweets = [{"id_str": "3", "full_text": "dogs and cats"},
+              {"id_str": "2", "full_text": "cats"}]
+
+    def get(url, params=None, **kwargs):
+        if params["q"] == "ducks":
+            raise requests.exceptions.RetryError("search failed")
+        statuses = []
+        if "max_id" not in params and "since_id" not in params:
+            statuses = [t for t in tweets if
+                        any(w in t["full_text"] for w in params["q"].split())]
+        return MagicMock(status_code=200, headers={},
+                         json=lambda: {"statuses": statuses})
+
+    session.get.side_effect = get
+    packer = QueryPacker(["cats", "dogs", "emus", "from:edsu"])
+    found = []
+    assert search_packed(packer, TokenPool([0]), found.append) == (2, [])
+    assert len(found) == 2
+    found = dict((t["id_str"], t["matching_queries"]) for t in found)
+    assert found == {"3": ["cats", "dogs"], "2": ["cats"]}
+    # one call per pack and one more for the pack that found something
+    assert session.get.call_count == 3
+
+    state = str(tmpdir.join("state.json"))
+    packer.save(state)
+    packer = QueryPacker(["cats", "dogs", "emus", "ducks"])
+    packer.load(state)
+    assert packer.packs == [["cats", "dogs", "emus"], ["ducks"]]
+    assert packer.since_id(packer.packs[0]) == "3"
+
+    # failed searches are reported, and tried from scratch the next time
+    assert search_packed(packer, TokenPool([0]), [].append) == \
+        (0, ["ducks"])
+    assert packer.since_id(["ducks"]) is None
+
+
+@patch("twarc.client.OAuth1Session", autospec=True)
+def test_poller(oauth1session_class, tmpdir):
+    import gzip
+    from twarc.polling import QueryStore, Poller, Locked, lock, query_dir
+    from twarc.scheduler import TokenPool
+
+    session = MagicMock(spec=OAuth1Session)
+    oauth1session_class.return_value = session
+
+    def get(url, params=None, **kwargs):
+        statuses = []
+        if params["q"] == "cats" and "max_id" not in params:
+            since_id = int(params.get("since_id", 0))
+            statuses = [{"id_str": str(i)} for i in (3, 2, 1) if i > since_id]
+        return MagicMock(status_code=200, headers={},
+                         json=lambda: {"statuses": statuses})
+
+    session.get.side_effect = get
+    store = QueryStore(str(tmpdir.join("poll.db")))
+    store.add("cats", 60)
+    store.add("from:dogs", 60)
+    archive = str(tmpdir.join("archive"))
+    poller = Poller(store, archive, TokenPool([0]))
+    with pytest.raises(Locked):
+        Poller(store, archive, TokenPool([0]))
+
+    assert poller.poll() == 2
+    assert store.get("cats")[0] == "3"
+    assert store.get("from:dogs")[4] == 0
+    assert store.due() == []
+    cats = query_dir(archive, "cats")
+    assert cats.endswith("cats")
+    assert os.path.basename(query_dir(archive, "from:dogs")).startswith(
+        "from_dogs-")
+    with gzip.open(os.path.join(cats, "tweets-0001.jsonl.gz"), "rt") as fh:
+        assert len(fh.readlines()) == 3
+
+    # the next poll only asks for newer tweets, so nothing new is written
+    assert poller.poll(now=time.time() + 120) == 2
+    cat_calls = [c[1]["params"] for c in session.get.call_args_list
+                 if c[1]["params"]["q"] == "cats"]
+    assert cat_calls[-1]["since_id"] == "3"
+    assert sorted(os.listdir(cats)) == ["lockfile", "tweets-0001.jsonl.gz"]
+
+    # a query whose archive is locked by another process is skipped
+    held = lock(os.path.join(cats, "lockfile"))
+    store.add("cats", 60)
+    assert poller.poll(now=time.time() + 240) == 2
+    held.close()
+    poller.close()
+    lock(os.path.join(archive, "poll.lock")).close()
+
+
+@patch("twarc.client.OAuth1Session", autospec=True)
+def test_trends_watch(oauth1session_class, tmpdir):
+    from twarc.cache import Cache
+    from twarc.scheduler import TokenPool
+    from twarc.trends import TrendStore, resolve_places, collect
+
+    session = MagicMock(spec=OAuth1Session)
+    oauth1session_class.return_value = session
+    current = {"2487956": ["#a", "#b", "#c"]}
+
+    def get(url, params=None, **kwargs):
+        if url.endswith("available.json"):
+            result = [{"name": "San Francisco", "woeid": 2487956}]
+        elif url.endswith("closest.json"):
+            result = [{"name": "Ferguson", "woeid": 1}]
+        else:
+            names = current.get(str(params["id"]), [])
+            result = [{"as_of": "now", "trends": [
+                {"name": n, "tweet_volume": 10} for n in names]}]
+        return MagicMock(status_code=200, headers={}, json=lambda: result)
+
+    session.get.side_effect = get
+    cache = Cache(str(tmpdir.join("trends.db")))
+    t = twarc.Twarc(token_set=0, cache=cache)
+    places = ["san francisco", "38.7,-90.3", "1", "2487956"]
+    assert resolve_places(t, places) == [2487956, 1]
+    assert resolve_places(t, places) == [2487956, 1]
+    # the catalogue and closest place came from the cache the second time
+    assert session.get.call_count == 2
+
+    store = TrendStore(str(tmpdir.join("trends.db")))
+    found = []
+    pool = TokenPool([0])
+    assert collect([2487956], store, pool, found.append) == 3
+    assert collect([2487956], store, pool, found.append) == 0
+    current["2487956"] = ["#b", "#a", "#d"]
+    found = []
+    assert collect([2487956], store, pool, found.append) == 4
+    found = dict((c["name"], (c["change"], c["rank"], c["old_rank"]))
+                 for c in found)
+    assert found == {"#b": ("moved", 1, 2), "#a": ("moved", 2, 1),
+                     "#d": ("new", 3, None), "#c": ("dropped", None, 3)}
+
+
+@patch("twarc.client.OAuth1Session", autospec=True)
+def test_engagement_tracker(oauth1session_class, tmpdir):
+    import threading
+    from twarc.engagement import Tracker, read_samples, tweet_time
+
+    session = MagicMock(spec=OAuth1Session)
+    oauth1session_class.return_value = session
+    deleted = set(["1000000000000000000"])
+
+    def post(url, data=None, **kwargs):
+        ids = data["id"].split(",")
+        return MagicMock(status_code=200, headers={}, json=lambda: {
+            "id": dict((i, None if i in deleted else
+                        {"id_str": i, "retweet_count": 5,
+                         "favorite_count": 7, "quote_count": 1})
+                       for i in ids)})
+
+    session.post.side_effect = post
+    t = twarc.Twarc(token_set=0, trim_user=True, include_entities=False)
+    tracker = Tracker(str(tmpdir))
+    # tweets from 2018, one of which has been deleted
+    ids = ["1000000000000000000", "1000000000000000001"]
+    assert 1527253553 < tweet_time(ids[0]) < 1527253554
+    now = tweet_time(ids[1]) + 3600
+    tracker.watch(ids, now=now)
+    assert tracker.check(t, now=now) == (2, 1)
+    assert session.post.call_args[1]["data"]["trim_user"] == "true"
+    assert tracker.unavailable() == [(int(ids[0]), now)]
+
+    # young tweets are checked hourly, older ones less often
+    assert tracker.due(now + 3599) == []
+    assert tracker.check(t, now=now + 3600) == (1, 0)
+    later = now + 20 * 86400
+    tracker.check(t, now=later)
+    assert tracker.interval(ids[1], later) == 86400
+
+    samples = read_samples(str(tmpdir))
+    assert samples["id"] == [int(ids[1])] * 3
+    assert samples["retweet_count"] == [5, 5, 5]
+    assert samples["reply_count"] == [-1, -1, -1]
+    assert samples["quote_count"] == [1, 1, 1]
+    assert os.path.getsize(str(tmpdir.join("id.col"))) == 3 * 8
+
+    # a crash part way through an append is repaired when it's reopened
+    tracker.close()
+    with open(str(tmpdir.join("id.col")), "ab") as fh:
+        fh.write(b"\0" * 12)
+    tracker = Tracker(str(tmpdir))
+    assert os.path.getsize(str(tmpdir.join("id.col"))) == 3 * 8
+    tracker.check(t, now=later + 86400)
+    samples = read_samples(str(tmpdir))
+    assert samples["id"] == [int(ids[1])] * 4
+    assert os.path.getsize(str(tmpdir.join("time.col"))) == 4 * 4
+
+    # with reload it keeps going while there's nothing to check
+    event = threading.Event()
+    reloads = []
+
+    def reload():
+        reloads.append(1)
+        if len(reloads) == 3:
+            event.set()
+
+    empty = Tracker(str(tmpdir.join("empty")))
+    empty.run(t, event=event, reload=reload, reload_interval=0.01)
+    assert len(reloads) == 3
+    tracker.close()
+
+
+def load_util(name):
+    """
+    Imports one of the scripts in utils, which isn't a package.
+    """
+    utils = os.path.join(os.path.dirname(os.path.abspath(__file__)), "utils")
+    if utils not in sys.path:
+        sys.path.insert(0, utils)
+    return __import__(name)
+
+
+def test_deletes():
+    import collections
+    from twarc.scheduler import TokenPool, Scheduler
+    from twarc.transport import MockTransport
+    deletes = load_util("deletes")
+
+    live_users = {"1": False, "2": True}
+    live_tweets = set(["101", "103"])
+    show = {"3": (404, 50), "4": (403, 63), "5": (404, 50), "6": (403, 63)}
+    calls = collections.Counter()
+    lookup_fails = []
+
+    def handler(method, url, kwargs):
+        if "users/lookup" in url:
+            calls["users/lookup"] += 1
+            users = [{"id_str": i, "protected": live_users.get(i, False)}
+                     for i in kwargs["params"]["user_id"].split(",")
+                     if i in live_users or int(i) >= 1000]
+            return users or (404, {"errors": [{"code": 17}]})
+        if "statuses/lookup" in url:
+            calls["statuses/lookup"] += 1
+            if lookup_fails:
+                raise requests.exceptions.RetryError("lookup failed")
+            return {"id": dict((i, {"id_str": i} if i in live_tweets or
+                                int(i) >= 1000 else None)
+                               for i in kwargs["data"]["id"].split(","))}
+        if "users/show" in url:
+            calls["users/show"] += 1
+            status, code = show[kwargs["params"]["user_id"]]
+            return status, {"errors": [{"code": code}]}
+        if "statuses/show" in url:
+            calls["statuses/show"] += 1
+            if kwargs["params"]["id"] in live_tweets:
+                return {"id_str": kwargs["params"]["id"]}
+        return 404, {"errors": [{"code": 34}]}
+
+    def tweet(tweet_id, user_id, retweet=None):
+        t = {"id_str": tweet_id, "user": {"id_str": user_id}}
+        if retweet:
+            t["retweeted_status"] = retweet
+        return t
+
+    scheduler = Scheduler(TokenPool([0]), workers=2,
+                          transport=MockTransport(handler), trim_user=True)
+    deletes.t = scheduler.twarc()
+    deletes.users.clear()
+    deletes.tweets.clear()
+
+    # users and tweets are looked up 100 at a time, and only the users that
+    # users/lookup leaves out are looked up one at a time
+    chunk = [
+        tweet("101", "1"),
+        tweet("102", "1"),
+        tweet("103", "2"),
+        tweet("104", "3"),
+        tweet("105", "4"),
+        tweet("106", "1", retweet=tweet("107", "1")),
+    ]
+    chunk += [tweet(str(1000 + i), str(1000 + i)) for i in range(150)]
+    deletes.check(chunk, scheduler)
+    assert calls == {"users/lookup": 2, "statuses/lookup": 2,
+                     "users/show": 2}
+    assert [deletes.examine(t) for t in chunk[:6]] == [
+        deletes.TWEET_OK,
+        deletes.TWEET_DELETED,
+        deletes.USER_PROTECTED,
+        deletes.USER_DELETED,
+        deletes.USER_SUSPENDED,
+        deletes.ORIGINAL_TWEET_DELETED,
+    ]
+    assert all(deletes.examine(t) == deletes.TWEET_OK for t in chunk[6:])
+    # examine() had everything it needed already
+    assert calls["users/show"] == 2
+
+    # when none of a batch's users can be found they're all shown one by one,
+    # and users that are already known aren't looked up again
+    calls.clear()
+    chunk = [tweet("201", "5"), tweet("202", "6"), tweet("203", "1")]
+    deletes.check(chunk, scheduler)
+    assert calls == {"users/lookup": 1, "users/show": 2,
+                     "statuses/lookup": 1}
+    assert [deletes.examine(t) for t in chunk] == [
+        deletes.USER_DELETED, deletes.USER_SUSPENDED, deletes.TWEET_DELETED]
+
+    # tweets that a failed batch didn't settle are shown one by one
+    calls.clear()
+    lookup_fails.append(True)
+    live_tweets.add("301")
+    chunk = [tweet("301", "1"), tweet("302", "1")]
+    deletes.check(chunk, scheduler)
+    assert [deletes.examine(t) for t in chunk] == [
+        deletes.TWEET_OK, deletes.TWEET_DELETED]
+    assert calls == {"statuses/lookup": 1, "statuses/show": 2}
+    scheduler.shutdown()
+
+
+def test_rotating_file(tmpdir):
+    RotatingFile = load_util("tweet_compliance").RotatingFile
+
+    path = str(tmpdir.join("out.jsonl"))
+    out = RotatingFile(path, 2)
+    for line in ["a", "b", "c"]:
+        out.write(line)
+    position = out.position()
+    assert position[:2] == [2, 1]
+    # lines written after the position was saved are lost on resume
+    out.write("d")
+    out.write("e")
+    out.close()
+
+    out = RotatingFile(path, 2, position)
+    out.write("f")
+    out.close()
+    assert tmpdir.join("out-001.jsonl").read() == "a\nb\n"
+    assert tmpdir.join("out-002.jsonl").read() == "c\nf\n"
+    assert tmpdir.join("out-003.jsonl").read() == "e\n"
+
+
+@patch("twarc.client.OAuth1Session", autospec=True)
+def test_tweet_compliance(oauth1session_class, tmpdir):
+    from twarc.scheduler import TokenPool
+    tweet_compliance = load_util("tweet_compliance")
+
+    session = MagicMock(spec=OAuth1Session)
+    oauth1session_class.return_value = session
+    deleted = set(["2", "5"])
+    broken = set()
+
+    def post(url, data=None, **kwargs):
+        ids = data["id"].split(",")
+        if broken.intersection(ids):
+            raise ValueError("lookup failed")
+        return MagicMock(status_code=200, headers={}, json=lambda: {
+            "id": dict((i, None if i in deleted else {"id_str": i})
+                       for i in ids)})
+
+    session.post.side_effect = post
+
+    infile = tmpdir.join("ids.txt")
+    infile.write("\n".join(str(i) for i in range(1, 8)) + "\n")
+    paths = dict(
+        available_path=str(tmpdir.join("available.jsonl")),
+        unavailable_path=str(tmpdir.join("unavailable.jsonl")),
+        state_path=str(tmpdir.join("state.json")))
+
+    def results():
+        available = tmpdir.join("available-001.jsonl").read().splitlines()
+        unavailable = tmpdir.join("unavailable-001.jsonl").read().split()
+        return (sorted(json.loads(l)["id_str"] for l in available),
+                sorted(unavailable))
+
+    # a failed lookup stops the run after the last chunk that finished
+    broken.add("5")
+    with pytest.raises(ValueError):
+        tweet_compliance.main([str(infile)], TokenPool([0]), workers=2,
+                              chunk_size=2, **paths)
+    state = json.loads(tmpdir.join("state.json").read())
+    assert state["lines"] == 4
+    assert results() == (["1", "3", "4"], ["2"])
+
+    # the next run carries on from there and clears the state at the end
+    broken.clear()
+    tweet_compliance.main([str(infile)], TokenPool([0]), workers=2,
+                          chunk_size=2, **paths)
+    assert not tmpdir.join("state.json").exists()
+    assert results() == (["1", "3", "4", "6", "7"], ["2", "5"])
+
+    # so a later sweep checks everything again
+    deleted.add("7")
+    tweet_compliance.main([str(infile)], TokenPool([0]), workers=2,
+                          chunk_size=2, **paths)
+    assert results() == (["1", "3", "4", "6"], ["2", "5", "7"])
+
+
+@patch("twarc.client.OAuth1Session", autospec=True)
+def test_rehydrate_diff(oauth1session_class, tmpdir):
+    from twarc.rehydrate import rehydrate
+
+    session = MagicMock(spec=OAuth1Session)
+    oauth1session_class.return_value = session
+
+    def tweet(i, retweets=0, text="hi", screen_name="edsu"):
+        return {"id_str": str(i), "full_text": text,
+                "retweet_count": retweets, "favorite_count": 1,
+                "user": {"screen_name": screen_name, "followers_count": 10}}
+
+    current = dict((str(i), tweet(i)) for i in range(1, 251))
+    session.post.side_effect = lambda url, data=None, **kwargs: MagicMock(
+        status_code=200, headers={},
+        json=lambda: {"id": dict((i, current.get(i))
+                                 for i in data["id"].split(","))})
+
+    # the cache has the tweets as they were when they were archived, so
+    # it mustn't be used to look for changes
+    from twarc.cache import Cache
+    t = twarc.Twarc(token_set=0, cache=Cache(str(tmpdir.join("cache.db"))))
+    assert len(list(t.lookup(["5", "6", "7"]))) == 3
+    session.post.reset_mock()
+
+    current["5"] = tweet(5, retweets=3)
+    current["6"] = tweet(6, text="hi!", screen_name="ed")
+    del current["7"]
+    archive = [json.dumps(tweet(i)) for i in range(1, 251)]
+    archive.append(json.dumps(tweet(5)))
+    changes = list(rehydrate(t, iter(archive)))
+    assert changes == [
+        {"id_str": "5", "change": "changed",
+         "delta": {"retweet_count": [0, 3]}},
+        {"id_str": "6", "change": "changed",
+         "delta": {"user.screen_name": ["edsu", "ed"], "text": ["hi", "hi!"]}},
+        {"id_str": "7", "change": "unavailable"},
+    ]
+    assert session.post.call_count == 3
+
+
+def test_rehydrate_output():
+    import io
+    from twarc.command import Output
+
+    # change records aren't tweets, so they're always written as JSON
+    fh = io.StringIO()
+    output = Output(format="csv", fh=fh)
+    change = {"id_str": "7", "change": "unavailable"}
+    output.write(change)
+    assert json.loads(fh.getvalue().splitlines()[1]) == change
+
+
+@patch("twarc.client.OAuth1Session", autospec=True)
+def test_connection_reuse(oauth1session_class):
+    session = MagicMock(spec=OAuth1Session)
+    oauth1session_class.return_value = session
+    ok = MagicMock(status_code=200, headers={}, json=lambda: [])
+    session.get.side_effect = [requests.exceptions.ConnectionError,
+                               requests.exceptions.ReadTimeout, ok]
+
+    t = twarc.Twarc(token_set=0)
+    assert t.get("https://api.twitter.com/1.1/statuses/retweets/123.json") \
+        == ok
+    assert session.get.call_count == 3
+
+    # the session and its pooled connections survive the errors
+    assert oauth1session_class.call_count == 1
+    assert not session.close.called
+    adapter = session.mount.call_args[0][1]
+    assert adapter.max_retries.connect == 3
+
+    # a new connection only hangs up on the last response
+    t.connect()
+    assert ok.close.called
+    assert not session.close.called
+    assert oauth1session_class.call_count == 1
+
+
+@patch("twarc.client.OAuth1Session", autospec=True)
+def test_shared_transport(oauth1session_class):
+    from twarc.command import get_argparser
+    from twarc.scheduler import TokenPool, Scheduler
+
+    session = MagicMock(spec=OAuth1Session)
+    oauth1session_class.return_value = session
+    session.get.return_value = MagicMock(
+        status_code=200, headers={}, json=lambda: [{"id_str": "1"}])
+
+    # the workers share one session per token, with a connection each
+    scheduler = Scheduler(TokenPool([0]), workers=12)
+    jobs = [scheduler.submit(lambda t: t.retweets("123")) for i in range(24)]
+    scheduler.join()
+    assert [job.status for job in jobs] == ["done"] * 24
+    assert oauth1session_class.call_count == 1
+    assert session.mount.call_args[0][1]._pool_maxsize == 12
+
+    # reconnecting one of them leaves the others' connections alone
+    t = scheduler.twarc()
+    t.retweets("123")
+    t.connect()
+    assert not session.close.called
+    scheduler.shutdown()
+    assert session.close.called
+
+    args = get_argparser().parse_args(["hydrate", "ids.txt", "0",
+                                       "--pool_size", "32"])
+    assert args.pool_size == 32
+
+
+@patch("twarc.client.OAuth1Session", autospec=True)
+def test_stream_reconnect(oauth1session_class):
+    session = MagicMock(spec=OAuth1Session)
+    oauth1session_class.return_value = session
+
+    def broken(chunk_size=None):
+        raise requests.exceptions.ChunkedEncodingError("stream broke")
+        yield
+
+    broken_stream = MagicMock(status_code=200, headers={},
+                              iter_lines=broken)
+    session.post.side_effect = [
+        broken_stream,
+        MagicMock(status_code=200, headers={},
+                  iter_lines=lambda chunk_size=None: [b'{"id_str": "1"}'])
+    ]
+    t = twarc.Twarc(token_set=0)
+    assert next(t.sample())["id_str"] == "1"
+
+    # the broken stream was hung up on, but the session is kept
+    assert broken_stream.close.called
+    assert not session.close.called
+    assert oauth1session_class.call_count == 1
+
+
+def test_mock_transport():
+    from twarc.scheduler import TokenPool, Scheduler
+    from twarc.transport import MockTransport
+
+    def handler(method, url, kwargs):
+        if "statuses/lookup" in url:
+            ids = kwargs["data"]["id"].split(",")
+            return {"id": dict((i, {"id_str": i} if int(i) % 2 else None)
+                               for i in ids)}
+        return 404, {"errors": [{"code": 34}]}
+
+    transport = MockTransport(handler)
+    results = []
+    scheduler = Scheduler(TokenPool([0, 1]), workers=2, transport=transport)
+    for i in range(4):
+        ids = [str(n) for n in range(i * 100, i * 100 + 100)]
+        scheduler.submit(lambda t, ids=ids: t.hydrate(iter(ids)),
+                         callback=lambda job, tweet: results.append(tweet))
+    scheduler.join()
+    scheduler.shutdown()
+
+    assert len(results) == 200
+    assert transport.calls == 4
+    assert set(transport.sessions) <= set([0, 1])
+
+    t = twarc.Twarc(token_set=0, transport=transport)
+    with pytest.raises(requests.exceptions.HTTPError):
+        t.get("https://api.twitter.com/1.1/users/show.json",
+              params={"user_id": "1"}, allow_404=True)
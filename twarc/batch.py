@@ -0,0 +1,183 @@
+"""
+Run many twarc commands from a job file in one process.
+
+A job file has one JSON object per line. Each one needs a command and
+usually a query, and can set any of the command line options by name:
+
+    {"command": "timeline", "query": "deray", "output": "deray.jsonl"}
+    {"command": "search", "query": "ferguson", "lang": "en", "priority": 10}
+
+Jobs without an output are written to numbered files next to the job file.
+priority and weight are passed on to the Scheduler.
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import codecs
+import logging
+import argparse
+
+from twarc.scheduler import Scheduler, NORMAL
+from twarc.command import get_things, trim_args, trim_error, Output
+
+# streams never finish, so filter and sample are left to the daemon
+batch_commands = [
+    'dehydrate',
+    'followers',
+    'friends',
+    'hydrate',
+    'replies',
+    'retweets',
+    'search',
+    'timeline',
+    'trends',
+    'tweet',
+    'users',
+]
+
+
+def read_jobs(path):
+    """
+    Returns the list of job dictionaries in a job file, numbering them from
+    1 in the order they appear.
+    """
+    jobs = []
+    with codecs.open(path, 'r', 'utf8') as fh:
+        for line_num, line in enumerate(fh, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            job = json.loads(line)
+            if job.get('command') not in batch_commands:
+                raise ValueError("line %s: %s can't be run in a batch" %
+                                 (line_num, job.get('command')))
+            job['num'] = len(jobs) + 1
+            jobs.append(job)
+    return jobs
+
+
+def job_args(args, job):
+    """
+    Returns a copy of the command line arguments with the job's options
+    laid over the top.
+    """
+    options = dict(vars(args))
+    for key, value in job.items():
+        if key in options:
+            options[key] = value
+    return argparse.Namespace(**options)
+
+
+def use_job_options(t, options):
+    """
+    Sets the trimming options and tweet_mode of a job on the Twarc instance
+    that runs it, since the Scheduler's instances are shared by every job.
+    Returns the settings they replaced, to be put back with
+    restore_options() once the job is done.
+    """
+    settings = trim_args(options)
+    settings["tweet_mode"] = options.tweet_mode
+    saved = dict((key, getattr(t, key)) for key in settings)
+    for key, value in settings.items():
+        setattr(t, key, value)
+    return saved
+
+
+def restore_options(t, saved):
+    for key, value in saved.items():
+        setattr(t, key, value)
+
+
+def job_output(path, job):
+    if job.get('output'):
+        return job['output']
+    base = os.path.splitext(path)[0]
+    return "%s-%04i.jsonl" % (base, job['num'])
+
+
+def run_batch(path, args, pool, cache=None, transport=None):
+    """
+    Runs every job in the job file at path concurrently against the token
+    pool, writes each job's results to its own output and prints a status
+    line for each job, in job file order. Returns the number of failed jobs.
+    A ValueError is raised, before anything runs, if a job can't be run.
+    """
+    jobs = read_jobs(path)
+    for job in jobs:
+        error = trim_error(job['command'], job_args(args, job))
+        if error:
+            raise ValueError("job %s: %s" % (job['num'], error))
+    logging.info("running %s jobs from %s", len(jobs), path)
+
+    if args.output:
+        status_fh = codecs.open(args.output, 'w', 'utf8')
+    else:
+        status_fh = sys.stdout
+
+    scheduler = Scheduler(
+        pool,
+        workers=args.workers,
+        connection_errors=args.connection_errors,
+        http_errors=args.http_errors,
+        config=args.config,
+        profile=args.profile,
+        tweet_mode=args.tweet_mode,
+        cache=cache,
+        transport=transport,
+        **trim_args(args)
+    )
+
+    def make_func(job, options):
+        def func(t):
+            output = Output(options.output, options.format, options.split,
+                            options.warnings)
+            saved = use_job_options(t, options)
+            try:
+                things = get_things(t, job['command'],
+                                    job.get('query') or "", options)
+                for thing in things:
+                    output.write(thing)
+                    yield thing
+            finally:
+                output.close()
+                restore_options(t, saved)
+        return func
+
+    running = []
+    for job in jobs:
+        options = job_args(args, job)
+        options.output = job_output(path, job)
+        running.append((job, scheduler.submit(
+            make_func(job, options),
+            priority=job.get('priority', NORMAL),
+            weight=job.get('weight', 1),
+            name="%s %s %s" % (job['num'], job['command'], job.get('query'))
+        ), options.output))
+
+    errors = 0
+    for job, scheduled, output in running:
+        scheduled.wait()
+        status = {
+            "job": job['num'],
+            "command": job['command'],
+            "query": job.get('query'),
+            "output": output,
+            "status": scheduled.status,
+            "count": scheduled.count,
+            "started": scheduled.started,
+            "finished": scheduled.finished,
+        }
+        if scheduled.error:
+            errors += 1
+            status["error"] = str(scheduled.error)
+        print(json.dumps(status), file=status_fh)
+        status_fh.flush()
+
+    scheduler.shutdown()
+    if status_fh is not sys.stdout:
+        status_fh.close()
+    logging.info("finished %s jobs with %s errors", len(jobs), errors)
+    return errors
@@ -0,0 +1,122 @@
+"""
+An on-disk cache of API responses keyed by tweet or user id, so that
+looking up the same things again doesn't use any of the rate limit.
+"""
+
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+
+class Cache(object):
+    """
+    A SQLite backed cache of JSON values grouped by kind (e.g. tweet or
+    user). Entries older than ttl seconds are ignored, and once the cache
+    holds more than max_size entries the least recently used ones are
+    evicted. A Cache can be shared by several Twarc instances and threads.
+    """
+
+    def __init__(self, path, ttl=24 * 60 * 60, max_size=1000000):
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS cache (
+                kind TEXT,
+                id TEXT,
+                data TEXT,
+                fetched REAL,
+                accessed REAL,
+                PRIMARY KEY (kind, id)
+            );
+            CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+            """
+        )
+        self.db.commit()
+        self.size = self.db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def get(self, kind, id):
+        """
+        Returns the cached value or None if it isn't cached or has expired.
+        """
+        return self.get_many(kind, [id]).get(id)
+
+    def get_many(self, kind, ids):
+        """
+        Returns a dictionary of the ids that are in the cache and haven't
+        expired, mapped to their values.
+        """
+        ids = [str(i) for i in ids]
+        if not ids:
+            return {}
+        now = time.time()
+        found = {}
+        with self.lock:
+            placeholders = ",".join("?" * len(ids))
+            rows = self.db.execute(
+                "SELECT id, data FROM cache WHERE kind = ? AND fetched > ? "
+                "AND id IN (%s)" % placeholders,
+                [kind, now - self.ttl] + ids
+            ).fetchall()
+            for id, data in rows:
+                found[id] = json.loads(data)
+            if found:
+                self.db.executemany(
+                    "UPDATE cache SET accessed = ? WHERE kind = ? AND id = ?",
+                    [(now, kind, id) for id in found]
+                )
+                self.db.commit()
+        self.hits += len(found)
+        self.misses += len(ids) - len(found)
+        return found
+
+    def put(self, kind, id, value):
+        self.put_many(kind, {id: value})
+
+    def put_many(self, kind, values):
+        """
+        Stores a dictionary of ids and values, or a list of objects with an
+        id_str.
+        """
+        if isinstance(values, dict):
+            items = values.items()
+        else:
+            items = [(v['id_str'], v) for v in values]
+        now = time.time()
+        rows = [(kind, str(id), json.dumps(value), now, now)
+                for id, value in items]
+        if not rows:
+            return
+        with self.lock:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)", rows)
+            self.size += len(rows)
+            if self.size > self.max_size:
+                self._evict()
+            self.db.commit()
+
+    def _evict(self):
+        # recount since replaced rows were counted as new ones
+        self.size = self.db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        if self.size <= self.max_size:
+            return
+        # make some room so we aren't evicting on every put
+        extra = self.size - self.max_size + max(1, self.max_size // 10)
+        logging.info("evicting %s entries from cache %s", extra, self.path)
+        self.db.execute(
+            "DELETE FROM cache WHERE rowid IN (SELECT rowid FROM cache "
+            "ORDER BY accessed LIMIT ?)", (extra,))
+        self.size -= extra
+
+    def close(self):
+        logging.info("cache %s: %s hits, %s misses", self.path, self.hits,
+                     self.misses)
+        with self.lock:
+            self.db.close()
@@ -2,10 +2,14 @@ import os
 import re
 import sys
 import json
+import collections
 import logging
 import requests
 
 from .decorators import *
+from .scheduler import TokenPool
+from .ids import IdFilter
+from .transport import OAuth1Transport
 from requests_oauthlib import OAuth1Session
 
 
@@ -32,10 +36,31 @@ class Twarc(object):
     def __init__(self, consumer_key=None, consumer_secret=None,
                  access_token=None, access_token_secret=None,
                  current_token=0, connection_errors=0, http_errors=0, config=None,
-                 profile="main", tweet_mode="extended", token_set=None):
+                 profile="main", tweet_mode="extended", token_set=None,
+                 pool=None, job=None, cache=None, trim_user=False,
+                 include_entities=True, fields=None, transport=None):
         """
         Instantiate a Twarc instance. If keys aren't set we'll try to
         discover them in the environment or a supplied profile.
+
+        Rate limits are tracked by a TokenPool. By default it only contains
+        the token_set credentials, but a pool can be shared by several
+        instances (and threads) to spread requests over more tokens. job
+        is the scheduler Job the requests are being made for, if any.
+
+        If a Cache is given, tweets and users that are looked up by id are
+        kept in it and aren't requested again until they expire.
+
+        To cut down on bandwidth when full tweets aren't needed, trim_user
+        asks Twitter for just the id of each tweet's user, include_entities
+        set to False leaves out the entities, and fields is a list of dotted
+        field names (e.g. user.screen_name) that tweets are projected down to
+        before they are returned.
+
+        HTTP sessions come from a Transport, which by default is an
+        OAuth1Transport of this instance's own. Passing one in lets several
+        instances share its connection pools, or swaps in another backend
+        such as a MockTransport.
         """
 
         self.consumer_key = ["rWrYfBglRNfe6oKhuiWfsVWXP", "PGgc5lbZVz72Ee8JDVkvVvbPl", "JVLlA5xeVl1RGqeUMmXtoJUkm", "z2VAIGyGFoWpnev1iIlo5qyGv", "Jn9GyQcbRiDaSQl9d5bDGDcHc", "zVGFAdXmm5GVg6NhIwuuUvWpy", "crzkfuCPUWDi9l0p3iG1AlhrO", "S5ccg00YORNsehheyj0SSHHoB", "SydkB155MoPSsXyW4sHs7rifJ", "ZsNImUYubTtR8VHi4GpY8Ai2H", "G7sqKLNNN53jfsz63iBaAZbFB", "JizcLbUAcfwRra8LZXcvMBGcA"]
@@ -46,15 +71,11 @@ class Twarc(object):
         
         self.access_token_secret = ["AOy9GLzfPyrDRg6PmAVotSSR2yoCs3FPtCB1mqaOFqGnd", "HYwUWKAfdt9Cz4hAqZOmWczmH1mhMRFSQRUBGjm1dBD7t", "xXvXPpG2YL4ymUrSCPqH9yn4YdVShtMfAUGFoJ7KfYSSf", "yGamghcSk7AlmxrA0ZO4bVa1E7cadVyy7up3myuC2jDe7", "i2pVbSD2MlCttBfgYrN60fyEocmTj45dhXHDqWtveR0z2", "m10QsFprqknCoFjuBs5fC2nTOw54vmDO1gOmQT8fac1fW", "ozR5HqAvlMSz5eEQRAqzt5knN0KhczXGgl0EFu3Dlo7ij", "YjoalnqRUKpDYilMSkXfk6Tk7zRLzw9TtcuuEYBH5D7Sa", "oOKMJn9C0KBNrm8CuBAyoyMqniDNBC5mOpjIozP5DL4wb", "QF59kHF1mNHkwE517EvjrhQ4DMvcctFgKuQdrU1xEK2tu", "CeBUPMy05tJAlo5IWzoZ3PtRMHVQxdAg1l8CL1jcRJmbn", "K36lbwVM1IbsbdYUP79RkiwY80oAm0xmzO8oDb7Dbvsi7"]
         
-        # absolute second a particular token is next available
-        self.token_availability = [0,0,0, 0,0,0, 0,0,0]
-        
-        self.current_token = current_token
-        
         self.connection_errors = connection_errors
         self.http_errors = http_errors
         self.profile = profile
         self.client = None
+        self.transport = transport
         self.last_response = None
         self.tweet_mode = tweet_mode
 
@@ -63,7 +84,16 @@ class Twarc(object):
         else:
             self.config = self.default_config()
         
+        if token_set is None and pool:
+            token_set = pool.tokens[0]
         self.arg_keys = int(token_set)
+        self.pool = pool or TokenPool([self.arg_keys])
+        self.job = job
+        self.cache = cache
+        self.current_token = self.arg_keys
+        self.trim_user = trim_user
+        self.include_entities = include_entities
+        self.fields = fields
 
     def search(self, q, max_id=None, since_id=None, lang=None,
                result_type='recent', geocode=None):
@@ -85,6 +115,7 @@ class Twarc(object):
             params['result_type'] = 'recent'
         if geocode is not None:
             params['geocode'] = geocode
+        params.update(self._tweet_params(trim_user=False))
 
         while True:
             if since_id:
@@ -100,7 +131,7 @@ class Twarc(object):
                 break
 
             for status in statuses:
-                yield status
+                yield self.project(status)
 
             max_id = str(int(status["id_str"]) - 1)
 
@@ -119,6 +150,7 @@ class Twarc(object):
         logging.info("starting user timeline for user %s", id)
         url = "https://api.twitter.com/1.1/statuses/user_timeline.json"
         params = {"count": 200, id_type: id}
+        params.update(self._tweet_params())
 
         while True:
             if since_id:
@@ -145,7 +177,7 @@ class Twarc(object):
                 # results so need to check.
                 if not user_id or user_id == status.get("user",
                                                         {}).get("id_str"):
-                    yield status
+                    yield self.project(status)
 
             max_id = str(int(status["id_str"]) - 1)
 
@@ -165,9 +197,19 @@ class Twarc(object):
         # TODO: this is similar to hydrate, maybe they could share code?
 
         lookup_ids = []
+        cache_kind = "user:%s" % id_type
 
         def do_lookup():
-            ids_str = ",".join(lookup_ids)
+            users = []
+            ids = lookup_ids
+            if self.cache:
+                keys = [i.lower() for i in ids]
+                cached = self.cache.get_many(cache_kind, keys)
+                users = list(cached.values())
+                ids = [i for i, k in zip(ids, keys) if k not in cached]
+                if not ids:
+                    return users
+            ids_str = ",".join(ids)
             logging.info("looking up users %s", ids_str)
             url = 'https://api.twitter.com/1.1/users/lookup.json'
             params = {id_type: ids_str}
@@ -177,7 +219,13 @@ class Twarc(object):
                 if e.response.status_code == 404:
                     logging.warn("no users matching %s", ids_str)
                 raise e
-            return resp.json()
+            fetched = resp.json()
+            if self.cache:
+                self.cache.put_many("user:user_id", dict(
+                    (u['id_str'], u) for u in fetched))
+                self.cache.put_many("user:screen_name", dict(
+                    (u['screen_name'].lower(), u) for u in fetched))
+            return users + fetched
 
         for id in iterator:
             lookup_ids.append(id.strip())
@@ -195,61 +243,57 @@ class Twarc(object):
         Returns Twitter user id lists for the specified user's followers. 
         A user can be a specific using their screen_name or user_id
         """
-        user = str(user)
-        user = user.lstrip('@')
-        url = 'https://api.twitter.com/1.1/followers/ids.json'
-
-        if re.match('^\d+$', user):
-            params = {'user_id': user, 'cursor': -1}
-        else:
-            params = {'screen_name': user, 'cursor': -1}
-
-        while params['cursor'] != 0:
-            try:
-                resp = self.get(url, params=params, allow_404=True)
-            except requests.exceptions.HTTPError as e:
-                if e.response.status_code == 404:
-                    logging.info("no users matching %s", screen_name)
-                raise e
-            user_ids = resp.json()
-            for user_id in user_ids['ids']:
+        for user_ids, next_cursor in self.id_pages("followers", user):
+            for user_id in user_ids:
                 yield str_type(user_id)
-            params['cursor'] = user_ids['next_cursor']
 
     def friend_ids(self, user):
         """
         Returns Twitter user id lists for the specified user's friend. A user
         can be specified using their screen_name or user_id.
         """
+        for user_ids, next_cursor in self.id_pages("friends", user):
+            for user_id in user_ids:
+                yield str_type(user_id)
+
+    def id_pages(self, relation, user, cursor=-1):
+        """
+        Walks the cursor for a user's followers or friends (the relation),
+        yielding a tuple of the list of integer ids in each page and the
+        cursor for the next page. A walk can be resumed by passing in the
+        cursor it stopped at.
+        """
         user = str(user)
         user = user.lstrip('@')
-        url = 'https://api.twitter.com/1.1/friends/ids.json'
+        url = 'https://api.twitter.com/1.1/%s/ids.json' % relation
 
         if re.match('^\d+$', user):
-            params = {'user_id': user, 'cursor': -1}
+            params = {'user_id': user, 'cursor': cursor}
         else:
-            params = {'screen_name': user, 'cursor': -1}
+            params = {'screen_name': user, 'cursor': cursor}
 
         while params['cursor'] != 0:
             try:
                 resp = self.get(url, params=params, allow_404=True)
             except requests.exceptions.HTTPError as e:
                 if e.response.status_code == 404:
-                    logging.error("no users matching %s", user)
+                    logging.info("no users matching %s", user)
                 raise e
-
             user_ids = resp.json()
-            for user_id in user_ids['ids']:
-                yield str_type(user_id)
             params['cursor'] = user_ids['next_cursor']
+            yield user_ids['ids'], params['cursor']
 
-    def filter(self, track=None, follow=None, locations=None, event=None):
+    def filter(self, track=None, follow=None, locations=None, event=None,
+               raw=False):
         """
         Returns an iterator for tweets that match a given filter track from
         the livestream of tweets happening right now.
 
         If a threading.Event is provided for event and the event is set,
         the filter will be interrupted.
+
+        If raw is True each tweet is returned as the line of JSON it arrived
+        in, without being parsed.
         """
         if locations is not None:
             if type(locations) == list:
@@ -280,6 +324,9 @@ class Twarc(object):
                     if not line:
                         logging.info("keep-alive")
                         continue
+                    if raw:
+                        yield line.decode("utf8")
+                        continue
                     try:
                         yield json.loads(line.decode())
                     except Exception as e:
@@ -305,11 +352,13 @@ class Twarc(object):
                     logging.warn("too many exceptions")
                     raise e
                 logging.error(e)
+                # hang up on the broken stream before connecting again
+                self.connect()
                 if interruptible_sleep(errors, event):
                     logging.info("stopping filter")
                     return
 
-    def sample(self, event=None):
+    def sample(self, event=None, raw=False):
         """
         Returns a small random sample of all public statuses. The Tweets
         returned by the default access level are the same, so if two different
@@ -317,6 +366,9 @@ class Twarc(object):
 
         If a threading.Event is provided for event and the event is set,
         the sample will be interrupted.
+
+        If raw is True each tweet is returned as the line of JSON it arrived
+        in, without being parsed.
         """
         url = 'https://stream.twitter.com/1.1/statuses/sample.json'
         params = {"stall_warning": True}
@@ -333,9 +385,12 @@ class Twarc(object):
                         # Explicitly close response
                         resp.close()
                         return
-                    if line == "":
+                    if not line:
                         logging.info("keep-alive")
                         continue
+                    if raw:
+                        yield line.decode("utf8")
+                        continue
                     try:
                         yield json.loads(line.decode())
                     except Exception as e:
@@ -361,6 +416,8 @@ class Twarc(object):
                 if self.http_errors and errors == self.http_errors:
                     logging.warn("too many errors")
                     raise e
+                # hang up on the broken stream before connecting again
+                self.connect()
                 if interruptible_sleep(errors, event):
                     logging.info("stopping filter")
                     return
@@ -376,33 +433,107 @@ class Twarc(object):
             except Exception as e:
                 logging.error("uhoh: %s\n" % e)
 
-    def hydrate(self, iterator):
+    def hydrate(self, iterator, dedupe=True, unavailable=None):
         """
         Pass in an iterator of tweet ids and get back an iterator for the
-        decoded JSON for each corresponding tweet.
+        decoded JSON for each corresponding tweet. Duplicate ids are only
+        looked up once unless dedupe is False. If unavailable is given it is
+        called with the id of each tweet that is deleted or protected.
+        """
+        for tweet_id, tweet in self.lookup(iterator, dedupe):
+            if tweet:
+                yield self.project(tweet)
+            elif unavailable:
+                unavailable(tweet_id)
+
+    def lookup(self, iterator, dedupe=True, cache=True):
+        """
+        Pass in an iterator of tweet ids and get back an iterator of
+        (tweet_id, tweet) tuples for every id, where tweet is None if the
+        tweet is no longer available. Duplicate ids are skipped unless dedupe
+        is False; an IdFilter can also be passed in as dedupe. If cache is
+        False every tweet is fetched from Twitter even when there is a cache,
+        which is still updated with them. Lines that aren't tweet ids are
+        logged and skipped.
         """
         ids = []
-        url = "https://api.twitter.com/1.1/statuses/lookup.json"
+        seen = None
+        if dedupe is True:
+            dedupe = seen = IdFilter()
 
-        # lookup 100 tweets at a time
-        for tweet_id in iterator:
-            tweet_id = tweet_id.strip()  # remove new line if present
-            ids.append(tweet_id)
-            if len(ids) == 100:
-                logging.info("hydrating %s ids", len(ids))
-                resp = self.post(url, data={"id": ','.join(ids)})
-                tweets = resp.json()
-                tweets.sort(key=lambda t: t['id_str'])
-                for tweet in tweets:
-                    yield tweet
-                ids = []
-
-        # hydrate any remaining ones
-        if len(ids) > 0:
-            logging.info("hydrating %s", ids)
-            resp = self.post(url, data={"id": ','.join(ids)})
-            for tweet in resp.json():
-                yield tweet
+        try:
+            # lookup 100 tweets at a time
+            for tweet_id in iterator:
+                tweet_id = tweet_id.strip()  # remove new line if present
+                if not tweet_id:
+                    continue
+                if not tweet_id.isdigit():
+                    logging.warn("skipping %s, which isn't a tweet id",
+                                 tweet_id)
+                    continue
+                if dedupe and not dedupe.add(tweet_id):
+                    continue
+                ids.append(tweet_id)
+                if len(ids) == 100:
+                    for result in self._lookup_tweets(ids, cache):
+                        yield result
+                    ids = []
+
+            # hydrate any remaining ones
+            if len(ids) > 0:
+                for result in self._lookup_tweets(ids, cache):
+                    yield result
+        finally:
+            if seen:
+                seen.close()
+
+    def _lookup_tweets(self, ids, cache=True):
+        """
+        Returns (tweet_id, tweet) tuples for up to 100 ids, sorted by id,
+        using the cache if there is one and cache is True. statuses/lookup
+        is called in map mode so that unavailable tweets come back as None.
+        """
+        url = "https://api.twitter.com/1.1/statuses/lookup.json"
+        params = self._tweet_params()
+        # trimmed tweets are cached separately from full ones
+        cache_kind = ":".join(["tweet", self.tweet_mode] + sorted(params))
+        results = {}
+        if self.cache and cache:
+            results = self.cache.get_many(cache_kind, ids)
+            ids = [i for i in ids if i not in results]
+
+        if ids:
+            logging.info("hydrating %s ids", len(ids))
+            data = {"id": ','.join(ids), "map": "true"}
+            data.update(params)
+            resp = self.post(url, data=data)
+            fetched = resp.json()["id"]
+            if self.cache:
+                self.cache.put_many(cache_kind, fetched)
+            results.update(fetched)
+
+        return sorted(results.items(), key=lambda r: int(r[0]))
+
+    def project(self, tweet):
+        """
+        Returns the tweet projected down to the fields the Twarc instance
+        was created with, or the tweet itself if there aren't any.
+        """
+        if not self.fields:
+            return tweet
+        return project(tweet, self.fields)
+
+    def _tweet_params(self, trim_user=True):
+        """
+        Returns the request parameters that trim tweets down, for the
+        endpoints that support them.
+        """
+        params = {}
+        if trim_user and self.trim_user:
+            params["trim_user"] = "true"
+        if not self.include_entities:
+            params["include_entities"] = "false"
+        return params
 
     def tweet(self, tweet_id):
         try:
@@ -427,12 +558,19 @@ class Twarc(object):
         """
         Returns a list of regions for which Twitter tracks trends.
         """
+        if self.cache:
+            regions = self.cache.get("trends_available", "all")
+            if regions is not None:
+                return regions
         url = 'https://api.twitter.com/1.1/trends/available.json'
         try:
             resp = self.get(url)
         except requests.exceptions.HTTPError as e:
             raise e
-        return resp.json()
+        regions = resp.json()
+        if self.cache:
+            self.cache.put("trends_available", "all", regions)
+        return regions
 
     def trends_place(self, woeid, exclude=None):
         """
@@ -456,82 +594,101 @@ class Twarc(object):
         """
         Returns the closest regions for the supplied lat/lon.
         """
+        key = "%s,%s" % (lat, lon)
+        if self.cache:
+            regions = self.cache.get("trends_closest", key)
+            if regions is not None:
+                return regions
         url = 'https://api.twitter.com/1.1/trends/closest.json'
         params = {'lat': lat, 'long': lon}
         try:
             resp = self.get(url, params=params)
         except requests.exceptions.HTTPError as e:
             raise e
-        return resp.json()
+        regions = resp.json()
+        if self.cache:
+            self.cache.put("trends_closest", key, regions)
+        return regions
 
     def replies(self, tweet, recursive=False, prune=()):
         """
-        replies returns a generator of tweets that are replies for a given 
+        replies returns a generator of tweets that are replies for a given
         tweet. It includes the original tweet. If you would like to fetch the
-        replies to the replies use recursive=True which will do a depth-first
-        recursive walk of the replies. It also walk up the reply chain if you
-        supply a tweet that is itself a reply to another tweet. You can
-        optionally supply a tuple of tweet ids to ignore during this traversal 
+        replies to the replies use recursive=True, which will also walk up the
+        reply chain if you supply a tweet that is itself a reply to another
+        tweet, and fetch the tweets that are quoted along the way. You can
+        optionally supply a tuple of tweet ids to ignore during this traversal
         using the prune parameter.
+
+        The conversation is walked breadth first. Each screen name is only
+        searched for once (unless an older tweet of theirs turns up later),
+        and the tweets that are replied to or quoted are looked up 100 at a
+        time.
         """
+        seen = set(prune)
+        seen.add(tweet['id_str'])
+        queue = collections.deque([tweet])
+        to_lookup = []
+        searches = {}
 
         yield tweet
 
-        # get replies to the tweet
-        screen_name = tweet['user']['screen_name']
-        tweet_id = tweet['id_str']
-        logging.info("looking for replies to: %s", tweet_id)
-        for reply in self.search("to:%s" % screen_name, since_id=tweet_id):
-
-            if reply['in_reply_to_status_id_str'] != tweet_id:
-                continue
-
-            if reply['id_str'] in prune:
-                logging.info("ignoring pruned tweet id %s", reply['id_str'])
+        while queue or to_lookup:
+            if not queue:
+                # look up the tweets that were replied to or quoted
+                ids, to_lookup = to_lookup[:100], to_lookup[100:]
+                for t in self.hydrate(ids, dedupe=False):
+                    logging.info("found reply-to or quote: %s", t['id_str'])
+                    queue.append(t)
+                    yield t
                 continue
 
-            logging.info("found reply: %s", reply["id_str"])
-
-            if recursive:
-                if reply['id_str'] not in prune:
-                    prune = prune + (tweet_id,)
-                    for r in self.replies(reply, recursive, prune):
-                        yield r
-            else:
+            current = queue.popleft()
+            logging.info("looking for replies to: %s", current['id_str'])
+            for reply in self._replies_to(current, searches):
+                if reply['id_str'] in seen:
+                    logging.info("ignoring seen tweet id %s", reply['id_str'])
+                    continue
+                seen.add(reply['id_str'])
+                logging.info("found reply: %s", reply['id_str'])
                 yield reply
+                if recursive:
+                    queue.append(reply)
 
-        # if this tweet is itself a reply to another tweet get it and 
-        # get other potential replies to it
-
-        reply_to_id = tweet.get('in_reply_to_status_id_str')
-        logging.info("prune=%s", prune)
-        if recursive and reply_to_id and reply_to_id not in prune:
-            t = self.tweet(reply_to_id)
-            if t:
-                logging.info("found reply-to: %s", t['id_str'])
-                prune = prune + (tweet['id_str'],)
-                for r in self.replies(t, recursive=True, prune=prune):
-                    yield r
-
-        # if this tweet is a quote go get that too whatever tweets it
-        # may be in reply to
-
-        quote_id = tweet.get('quotes_status_id_str')
-        if recursive and quote_id and quote_id not in prune:
-            t = self.tweet(quote_id)
-            if t:
-                logging.info("found quote: %s", t['id_str'])
-                prune = prune + (tweet['id_str'],)
-                for r in self.replies(t, recursive=True, prune=prune):
-                    yield r
+            if recursive:
+                for key in ('in_reply_to_status_id_str',
+                            'quoted_status_id_str'):
+                    tweet_id = current.get(key)
+                    if tweet_id and tweet_id not in seen:
+                        seen.add(tweet_id)
+                        to_lookup.append(tweet_id)
+
+    def _replies_to(self, tweet, searches):
+        """
+        Returns the replies to a tweet from searching for tweets to its
+        author. searches remembers, for each screen name, the oldest
+        since_id searched and the replies found indexed by the tweet they
+        reply to, so later tweets by the same author don't need a search.
+        """
+        screen_name = tweet['user']['screen_name'].lower()
+        tweet_id = int(tweet['id_str'])
+        since_id, replies = searches.get(screen_name, (None, {}))
+        if since_id is None or tweet_id < since_id:
+            # only search for the tweets we haven't already got
+            for reply in self.search("to:%s" % screen_name, since_id=tweet_id,
+                                     max_id=since_id):
+                parent = reply.get('in_reply_to_status_id_str')
+                if parent:
+                    replies.setdefault(parent, []).append(reply)
+            searches[screen_name] = (tweet_id, replies)
+        return replies.get(tweet['id_str'], [])
 
     @rate_limit
     @catch_conn_reset
     @catch_timeout
     @catch_gzip_errors
     def get(self, *args, **kwargs):
-        if not self.client:
-            self.connect()
+        self.client = self.session()
 
         if "params" in kwargs:
             kwargs["params"]["tweet_mode"] = self.tweet_mode
@@ -560,7 +717,7 @@ class Twarc(object):
                 logging.error("received too many connection errors")
                 raise e
             else:
-                self.connect()
+                self.recover()
                 kwargs['connection_error_count'] = connection_error_count
                 kwargs['allow_404'] = allow_404
                 return self.get(*args, **kwargs)
@@ -570,8 +727,7 @@ class Twarc(object):
     @catch_timeout
     @catch_gzip_errors
     def post(self, *args, **kwargs):
-        if not self.client:
-            self.connect()
+        self.client = self.session()
 
         if "data" in kwargs:
             kwargs["data"]["tweet_mode"] = self.tweet_mode
@@ -590,33 +746,53 @@ class Twarc(object):
                 logging.error("received too many connection errors")
                 raise e
             else:
-                self.connect()
+                self.recover()
                 kwargs['connection_error_count'] = connection_error_count
                 return self.post(*args, **kwargs)
 
-    def connect(self):
+    def session(self):
         """
-        Sets up the HTTP session to talk to Twitter. If one is active it is
-        closed and another one is opened.
+        Returns the HTTP session for the token that was last handed out by
+        the pool, which the transport opens if it doesn't have one yet.
         """
-        if not (self.consumer_key[self.arg_keys] and self.consumer_secret[self.arg_keys] 
-                and self.access_token[self.arg_keys] and self.access_token_secret[self.arg_keys]):
+        token = self.current_token
+        if not (self.consumer_key[token] and self.consumer_secret[token]
+                and self.access_token[token] and self.access_token_secret[token]):
             raise MissingKeys()
+        if not self.transport:
+            self.transport = default_transport()
+        return self.transport.session(token, (
+            self.consumer_key[token], self.consumer_secret[token],
+            self.access_token[token], self.access_token_secret[token]))
 
-        if self.client:
-            logging.info("closing existing http session")
-            self.client.close()
+    def connect(self):
+        """
+        Gets the HTTP session for the token that was last handed out by the
+        pool ready for a new request, after closing the last response made
+        with it. filter() and sample() call this to hang up on a stream that
+        broke, since a half read stream can't go back in the pool. Only that
+        connection is dropped: the session, and the connections that other
+        threads are using from a shared transport, are left alone.
+        """
         if self.last_response:
             logging.info("closing last response")
             self.last_response.close()
-        logging.info("creating http session")
+            self.last_response = None
+        self.client = self.session()
 
-        self.client = OAuth1Session(
-            client_key=self.consumer_key[self.arg_keys],
-            client_secret=self.consumer_secret[self.arg_keys],
-            resource_owner_key=self.access_token[self.arg_keys],
-            resource_owner_secret=self.access_token_secret[self.arg_keys]
-        )
+    def recover(self):
+        """
+        Gets ready to try a request again after a connection error, read
+        timeout or gzip error. Only the last response is closed, so that its
+        connection is dropped, and the session keeps its other keep-alive
+        connections unless the transport decides otherwise.
+        """
+        if self.last_response:
+            logging.info("closing last response")
+            self.last_response.close()
+            self.last_response = None
+        if self.transport:
+            self.transport.recover(self.current_token)
 
     def load_config(self):
         path = self.config
@@ -638,3 +814,33 @@ class Twarc(object):
         return os.path.join(os.path.expanduser("~"), ".twarc")
 
 
+
+
+def default_transport(pool_size=10):
+    """
+    Returns the kind of Transport that Twarc instances make for themselves
+    when they aren't given one, with pool_size connections per token.
+    """
+    return OAuth1Transport(pool_size=pool_size, session_class=OAuth1Session)
+
+
+def project(thing, fields):
+    """
+    Returns a copy of a tweet (or user) dictionary with only the given
+    fields in it. Nested fields are named with dots, e.g. user.screen_name.
+    The id and id_str are always kept.
+    """
+    result = {}
+    for field in ["id", "id_str"] + list(fields):
+        value = thing
+        keys = field.split(".")
+        for key in keys:
+            if not isinstance(value, dict) or key not in value:
+                break
+            value = value[key]
+        else:
+            target = result
+            for key in keys[:-1]:
+                target = target.setdefault(key, {})
+            target[keys[-1]] = value
+    return result
@@ -7,12 +7,20 @@ import json
 import codecs
 import logging
 import argparse
+import datetime
 import fileinput
 
 import time
 
 from twarc import __version__
-from twarc.client import Twarc
+from twarc.client import Twarc, default_transport
+from twarc.fanout import FanoutServer
+from twarc.spool import Spool, MAX_SEGMENTS
+from twarc.matcher import RuleMatcher
+from twarc.scheduler import TokenPool, parse_tokens
+from twarc.cache import Cache
+from twarc.ids import IdWriter, is_id_file, read_ids
+from twarc import pipeline
 from twarc.json2csv import csv, get_headings, get_row
 
 if sys.version_info[:2] <= (2, 7):
@@ -28,24 +36,49 @@ else:
 
 
 commands = [
+    'batch',
     "configure",
+    'daemon',
     'dehydrate',
+    'fanout',
     'filter',
     'followers',
+    'followers_users',
     'friends',
+    'friends_users',
+    'graph',
     'help',
     'hydrate',
+    'poll',
+    'rehydrate',
     'replies',
     'retweets',
     'sample',
     'search',
+    'search_users',
+    'searches',
+    'snapshot',
     'timeline',
+    'timelines',
+    'track',
     'trends',
+    'trends_watch',
     'tweet',
     'users',
     'version',
 ]
 
+csv_commands = [
+    'filter',
+    'hydrate',
+    'replies',
+    'retweets',
+    'sample',
+    'search',
+    'timeline',
+    'tweet',
+]
+
 token_indexes = [
     '0',
     '1',
@@ -90,7 +123,323 @@ def main():
         print("\nFor example:\n\n    twarc search blacklivesmatter")
         sys.exit(1)
 
-    t = Twarc(
+    if args.tokens:
+        pool = TokenPool(parse_tokens(args.tokens), reserve=args.reserve)
+    else:
+        pool = TokenPool([int(args.token_set)], reserve=args.reserve)
+
+    cache = None
+    if args.cache:
+        cache = Cache(args.cache, ttl=args.cache_ttl, max_size=args.cache_size)
+
+    error = trim_error(command, args)
+    if error:
+        parser.error(error)
+
+    # every Twarc instance and scheduler worker shares one connection pool
+    # per token
+    transport = default_transport(args.pool_size or max(10, args.workers))
+    t = get_twarc(args, pool, cache, transport)
+
+    if command == "configure":
+        t.input_keys()
+        sys.exit()
+
+    elif command == "fanout":
+        filtered = query or args.follow or args.locations
+        # tweets are passed on as they arrived unless rules are added
+        raw = not (args.matching_rules and filtered)
+        if filtered:
+            things = t.filter(
+                track=query,
+                follow=args.follow,
+                locations=args.locations,
+                raw=raw
+            )
+        else:
+            things = t.sample(raw=raw)
+        if args.spool:
+            things = Spool(things, args.spool,
+                           max_segments=args.spool_segments or None)
+        if not raw:
+            matcher = RuleMatcher(query, args.follow, args.locations)
+            things = matcher.annotate(things)
+        server = FanoutServer(args.listen, buffer_size=args.buffer_size)
+        try:
+            server.listen()
+        except ValueError as e:
+            parser.error(str(e))
+        server.serve(things)
+        sys.exit()
+
+    elif command == "batch":
+        from twarc.batch import run_batch
+        if not os.path.isfile(query):
+            parser.error("batch needs a job file")
+        try:
+            errors = run_batch(query, args, pool, cache, transport)
+        except ValueError as e:
+            parser.error(str(e))
+        sys.exit(1 if errors else 0)
+
+    elif command == "timelines":
+        from twarc.timelines import SinceIdStore, harvest
+        if not os.path.isfile(query):
+            parser.error("timelines needs a file of users")
+        store = SinceIdStore(args.state or "timelines.db")
+        output = Output(args.output, args.format, args.split, args.warnings)
+        harvest(id_input(query), store, pool, output.write, workers=args.workers,
+                cooloff=args.cooloff,
+                connection_errors=args.connection_errors,
+                http_errors=args.http_errors, tweet_mode=args.tweet_mode,
+                cache=cache, transport=transport, **trim_args(args))
+        output.close()
+        store.close()
+        sys.exit()
+
+    elif command == "graph":
+        from twarc.graph import GraphCrawler
+        from twarc.ids import EdgeWriter
+        seeds = query.split(",")
+        if not re.match('^[0-9,]+$', query):
+            seeds = [u['id_str'] for u in t.user_lookup(screen_names=seeds)]
+        crawler = GraphCrawler(args.state or "graph.db", pool,
+                               relation=args.relation, level=args.level,
+                               workers=args.workers,
+                               connection_errors=args.connection_errors,
+                               http_errors=args.http_errors,
+                               transport=transport)
+        crawler.seed(seeds)
+        writer = EdgeWriter(args.output or "graph.edges")
+        crawler.crawl(writer)
+        writer.close()
+        crawler.close()
+        sys.exit()
+
+    elif command == "snapshot":
+        from twarc.snapshots import SnapshotStore
+        store = SnapshotStore(args.store)
+        user = query.lstrip('@')
+        ids = []
+        for page, cursor in t.id_pages(args.relation, user):
+            ids.extend(page)
+        previous = store.timestamps(user, args.relation)
+        timestamp = store.save(user, args.relation, ids)
+        output = Output(args.output, args.format, args.split, args.warnings)
+        if previous:
+            added, removed = store.diff(user, args.relation, previous[-1],
+                                        timestamp)
+            for change, changed_ids in (("added", added),
+                                        ("removed", removed)):
+                for changed_id in changed_ids:
+                    output.write({
+                        "id_str": str_type(changed_id),
+                        "change": change,
+                        "user": user,
+                        "relation": args.relation,
+                        "old": previous[-1],
+                        "new": timestamp
+                    })
+        output.close()
+        sys.exit()
+
+    elif command == "poll":
+        from twarc.polling import QueryStore, Poller, Locked
+        if not os.path.isfile(query):
+            parser.error("poll needs a file of queries")
+        store = QueryStore(args.state or "poll.db")
+
+        def reload():
+            # the query file can be edited while polling
+            with codecs.open(query, 'r', 'utf8') as fh:
+                queries = set(q.strip() for q in fh if q.strip())
+            for q in queries:
+                store.add(q, args.interval)
+            for q in set(store.queries()) - queries:
+                store.remove(q)
+
+        try:
+            poller = Poller(store, args.archive, pool, workers=args.workers,
+                            connection_errors=args.connection_errors,
+                            http_errors=args.http_errors,
+                            tweet_mode=args.tweet_mode, cache=cache,
+                            transport=transport)
+        except Locked as e:
+            sys.exit(str(e))
+        if args.once:
+            reload()
+            poller.poll()
+        else:
+            poller.run(reload=reload)
+        poller.close()
+        store.close()
+        sys.exit()
+
+    elif command == "track":
+        from twarc.engagement import Tracker
+        if not os.path.isfile(query):
+            parser.error("track needs a file of tweet ids")
+        tracker = Tracker(args.state or "engagement")
+        # only the counts are needed, and they mustn't come from a cache
+        tt = Twarc(connection_errors=args.connection_errors,
+                   http_errors=args.http_errors, tweet_mode=args.tweet_mode,
+                   pool=pool, trim_user=True, include_entities=False,
+                   transport=transport)
+        reload = lambda: tracker.watch(id_input(query))
+        if args.once:
+            reload()
+            tracker.check(tt)
+        else:
+            tracker.run(tt, reload=reload)
+        tracker.close()
+        sys.exit()
+
+    elif command == "trends_watch":
+        from twarc.trends import TrendStore, resolve_places, collect, watch
+        if not os.path.isfile(query):
+            parser.error("trends_watch needs a file of places")
+        state = args.state or "trends.db"
+        if not cache:
+            # the places rarely change, so keep them for a week
+            cache = t.cache = Cache(state, ttl=7 * 24 * 60 * 60)
+        with codecs.open(query, 'r', 'utf8') as fh:
+            try:
+                woeids = resolve_places(t, fh)
+            except ValueError as e:
+                parser.error(str(e))
+        store = TrendStore(state)
+        output = Output(args.output, args.format, args.split, args.warnings)
+        twarc_args = {
+            "workers": args.workers,
+            "connection_errors": args.connection_errors,
+            "http_errors": args.http_errors,
+            "transport": transport
+        }
+        if args.once:
+            collect(woeids, store, pool, output.write, **twarc_args)
+        else:
+            watch(woeids, store, pool, output.write, interval=args.interval,
+                  **twarc_args)
+        output.close()
+        store.close()
+        cache.close()
+        sys.exit()
+
+    elif command == "searches":
+        from twarc.packing import QueryPacker, search_packed
+        if not os.path.isfile(query):
+            parser.error("searches needs a file of queries")
+        with codecs.open(query, 'r', 'utf8') as fh:
+            packer = QueryPacker(fh)
+        if args.state and os.path.isfile(args.state):
+            packer.load(args.state)
+        output = Output(args.output, args.format, args.split, args.warnings)
+        search_args = {"lang": args.lang, "result_type": args.result_type,
+                       "geocode": args.geocode}
+        total, failed = search_packed(
+            packer, pool, output.write, workers=args.workers,
+            search_args=search_args,
+            connection_errors=args.connection_errors,
+            http_errors=args.http_errors,
+            tweet_mode=args.tweet_mode, cache=cache,
+            transport=transport)
+        output.close()
+        if args.state:
+            packer.save(args.state)
+        if failed:
+            logging.error("searches for %s queries failed: %s", len(failed),
+                          ", ".join(failed))
+        sys.exit(1 if failed else 0)
+
+    elif command == "search" and args.sweep:
+        from twarc.geosweep import sweep
+        output = Output(args.output, args.format, args.split, args.warnings)
+        search_args = {
+            "since_id": args.since_id,
+            "max_id": args.max_id,
+            "lang": args.lang,
+            "result_type": args.result_type
+        }
+        sweep(query, args.sweep, pool, output.write,
+              cell_size=args.cell_size, cell_tweets=args.cell_tweets,
+              workers=args.workers, search_args=search_args,
+              connection_errors=args.connection_errors,
+              http_errors=args.http_errors, tweet_mode=args.tweet_mode,
+              cache=cache, transport=transport, **trim_args(args))
+        output.close()
+        sys.exit()
+
+    elif command == "hydrate" and args.processes:
+        from twarc.coordinator import Coordinator
+        cache_args = None
+        if args.cache:
+            cache_args = {"path": args.cache, "ttl": args.cache_ttl,
+                          "max_size": args.cache_size}
+        coordinator = Coordinator(
+            args.state or "hydrate-work", pool.tokens,
+            processes=args.processes, cache_args=cache_args,
+            connection_errors=args.connection_errors,
+            http_errors=args.http_errors, tweet_mode=args.tweet_mode,
+            **trim_args(args))
+        coordinator.load(id_input(query))
+        output = Output(args.output, args.format, args.split, args.warnings)
+        unavailable = None
+        if args.unavailable:
+            unavailable = codecs.open(args.unavailable, 'w', 'utf8')
+        failed = coordinator.run(output, unavailable)
+        output.close()
+        if unavailable:
+            unavailable.close()
+        coordinator.close()
+        if failed:
+            logging.error("%s ranges of ids couldn't be hydrated, see %s",
+                          failed, os.path.join(args.state or "hydrate-work",
+                                               "failed-ids.txt"))
+        sys.exit(1 if failed else 0)
+
+    elif command == "daemon":
+        from twarc.daemon import serve
+        serve(query or "twarc-jobs", args, pool, cache, transport)
+        sys.exit()
+
+    if args.format == "csv" and command not in csv_commands:
+        parser.error("csv output not available for %s" % command)
+
+    if args.binary_ids:
+        if command not in ["dehydrate", "followers", "friends"]:
+            parser.error("%s doesn't output ids" % command)
+        if not args.output:
+            parser.error("--binary_ids needs --output")
+
+    try:
+        things = get_things(t, command, query, args)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.spool and command in ["filter", "sample"]:
+        things = Spool(things, args.spool,
+                       max_segments=args.spool_segments or None)
+
+    if args.matching_rules and command == "filter":
+        matcher = RuleMatcher(query, args.follow, args.locations)
+        things = matcher.annotate(things)
+
+    if args.binary_ids:
+        output = IdWriter(args.output, compress=args.binary_ids == "compressed")
+    else:
+        output = Output(args.output, args.format, args.split, args.warnings)
+    for thing in things:
+        output.write(thing)
+    output.close()
+    if cache:
+        cache.close()
+
+
+def get_twarc(args, pool=None, cache=None, transport=None):
+    """
+    Create a Twarc instance from the command line arguments.
+    """
+    return Twarc(
         consumer_key=args.consumer_key,
         consumer_secret=args.consumer_secret,
         access_token=args.access_token,
@@ -100,9 +449,48 @@ def main():
         config=args.config,
         profile=args.profile,
         tweet_mode=args.tweet_mode,
-        token_set=args.token_set
+        token_set=args.token_set,
+        pool=pool,
+        cache=cache,
+        transport=transport,
+        **trim_args(args)
     )
 
+
+def trim_args(args):
+    """
+    Returns the Twarc arguments for trimming tweets down from the command
+    line arguments.
+    """
+    return {
+        "trim_user": args.trim_user,
+        "include_entities": not args.no_entities,
+        "fields": args.fields.split(",") if args.fields else None
+    }
+
+
+def trim_error(command, args):
+    """
+    Returns why the tweets for a command can't be trimmed or projected the
+    way the command line arguments ask, or None if they can.
+    """
+    if not (args.trim_user or args.no_entities or args.fields):
+        return None
+    if command == "replies":
+        return "replies needs full tweets, so can't be trimmed"
+    if args.format == "csv":
+        return "csv output needs full tweets, so can't be trimmed"
+    if command == "search_users" and args.fields:
+        return "search_users needs each tweet's user, so can't use --fields"
+    return None
+
+
+def get_things(t, command, query, args):
+    """
+    Returns an iterator for the results of a command. A ValueError is raised
+    if the command can't be run with the given query.
+    """
+
     # calls that return tweets
     if command == "search":
         things = t.search(
@@ -124,18 +512,24 @@ def main():
     elif command == "dehydrate":
         input_iterator = fileinput.FileInput(
             query,
-            mode='rU',
+            mode='r',
             openhook=fileinput.hook_compressed,
         )
         things = t.dehydrate(input_iterator)
 
     elif command == "hydrate":
+        input_iterator = id_input(query)
+        things = hydrate(t, input_iterator, args.unavailable,
+                         not args.keep_duplicates)
+
+    elif command == "rehydrate":
+        from twarc.rehydrate import rehydrate
         input_iterator = fileinput.FileInput(
             query,
-            mode='rU',
+            mode='r',
             openhook=fileinput.hook_compressed,
         )
-        things = t.hydrate(input_iterator)
+        things = rehydrate(t, input_iterator)
 
     elif command == "tweet":
         things = [t.tweet(query)]
@@ -156,12 +550,7 @@ def main():
 
     elif command == "users":
         if os.path.isfile(query):
-            iterator = fileinput.FileInput(
-                query,
-                mode='rU',
-                openhook=fileinput.hook_compressed,
-            )
-            things = t.user_lookup(iterator=iterator)
+            things = t.user_lookup(iterator=id_input(query))
         elif re.match('^[0-9,]+$', query):
             things = t.user_lookup(user_ids=query.split(","))
         else:
@@ -173,18 +562,42 @@ def main():
     elif command == "friends":
         things = t.friend_ids(query)
 
+    elif command in ["followers_users", "friends_users", "search_users"]:
+        twarc_args = {
+            "connection_errors": args.connection_errors,
+            "http_errors": args.http_errors,
+            "tweet_mode": args.tweet_mode,
+            "cache": t.cache
+        }
+        twarc_args.update(trim_args(args))
+        if command == "followers_users":
+            things = pipeline.follower_users(query, t.pool, **twarc_args)
+        elif command == "friends_users":
+            things = pipeline.friend_users(query, t.pool, **twarc_args)
+        else:
+            search_args = {
+                "since_id": args.since_id,
+                "max_id": args.max_id,
+                "lang": args.lang,
+                "result_type": args.result_type,
+                "geocode": args.geocode
+            }
+            things = pipeline.search_users(query, t.pool, search_args,
+                                           **twarc_args)
+
     elif command == "trends":
         # lookup woeid for geo-coordinate if appropriate
         geo = re.match('^([0-9\-\.]+),([0-9\-\.]+)$', query)
         if geo:
             lat, lon = map(float, geo.groups())
             if lat > 180 or lat < -180 or lon > 180 or lon < -180:
-                parser.error('LAT and LONG must be within [-180.0, 180.0]')
+                raise ValueError('LAT and LONG must be within [-180.0, 180.0]')
             places = list(t.trends_closest(lat, lon))
             if len(places) == 0:
-                parser.error("Couldn't find WOE ID for %s" % query)
+                raise ValueError("Couldn't find WOE ID for %s" % query)
             query = places[0]["woeid"]
 
+        things = []
         if not query:
             things = t.trends_available()
         else:
@@ -195,49 +608,88 @@ def main():
     elif command == "replies":
         tweet = t.tweet(query)
         if not tweet:
-            parser.error("tweet with id %s does not exist" % query)
+            raise ValueError("tweet with id %s does not exist" % query)
         things = t.replies(tweet, args.recursive)
 
-    elif command == "configure":
-        t.input_keys()
-        sys.exit()
-
     else:
-        parser.print_help()
-        print("\nPlease use one of the following commands:\n")
-        for cmd in commands:
-            print(" - %s" % cmd)
-        print("\nFor example:\n\n    twarc search blacklivesmatter")
-        sys.exit(1)
+        raise ValueError("%s can't be used here" % command)
 
-    # get the output filehandle
-    if args.output:
-        fh = codecs.open(args.output, 'wb', 'utf8')
-    else:
-        fh = sys.stdout
+    return things
 
-    # optionally create a csv writer
-    csv_writer = None
-    if args.format == "csv" and command not in ["filter", "hydrate", "replies",
-            "retweets", "sample", "search", "timeline", "tweet"]:
-        parser.error("csv output not available for %s" % command)
-    elif args.format == "csv":
-        csv_writer = csv.writer(fh)
-        csv_writer.writerow(get_headings())
 
-    line_count = 0
-    file_count = 0
-    for thing in things:
+def id_input(path):
+    """
+    Returns an iterator of the ids in a file of ids, one per line (which may
+    be compressed), or in a binary id file.
+    """
+    if os.path.isfile(path) and is_id_file(path):
+        return (str_type(i) for i in read_ids(path))
+    return fileinput.FileInput(
+        path,
+        mode='r',
+        openhook=fileinput.hook_compressed,
+    )
+
+
+def hydrate(t, ids, unavailable=None, dedupe=True):
+    """
+    Hydrates ids, writing the ids of any tweets that are no longer available
+    to the file named by unavailable.
+    """
+    if not unavailable:
+        for tweet in t.hydrate(ids, dedupe):
+            yield tweet
+        return
+    with codecs.open(unavailable, 'w', 'utf8') as fh:
+        write = lambda tweet_id: print(tweet_id, file=fh)
+        for tweet in t.hydrate(ids, dedupe, unavailable=write):
+            yield tweet
+
+
+class Output(object):
+    """
+    Writes the things a command returns to stdout, a file or an open file
+    handle, as JSON or CSV, optionally splitting the output into numbered
+    files.
+    """
+
+    def __init__(self, output=None, format="json", split=0, warnings=False,
+                 fh=None):
+        self.output = output
+        self.format = format
+        self.split = split
+        self.warnings = warnings
+        self.line_count = 0
+        self.file_count = 0
+        self.csv_writer = None
+
+        # get the output filehandle
+        if fh:
+            self.fh = fh
+        elif output:
+            self.fh = codecs.open(output, 'wb', 'utf8')
+        else:
+            self.fh = sys.stdout
+
+        # optionally create a csv writer
+        if format == "csv":
+            self.csv_writer = csv.writer(self.fh)
+            self.csv_writer.writerow(get_headings())
+
+    def write(self, thing):
+        fh = self.fh
 
         # rotate the files if necessary
-        if args.output and args.split and line_count % args.split == 0:
-            file_count += 1
-            fh = codecs.open(numbered_filepath(args.output, file_count), 'wb', 'utf8')
-            if csv_writer:
-                csv_writer = csv.writer(fh)
-                csv_writer.writerow(get_headings())
+        if self.output and self.split and self.line_count % self.split == 0:
+            self.file_count += 1
+            fh.close()
+            fh = self.fh = codecs.open(
+                numbered_filepath(self.output, self.file_count), 'wb', 'utf8')
+            if self.csv_writer:
+                self.csv_writer = csv.writer(fh)
+                self.csv_writer.writerow(get_headings())
 
-        line_count += 1
+        self.line_count += 1
 
         # ready to output
 
@@ -246,19 +698,22 @@ def main():
             # user or tweet IDs
             print(thing, file=fh)
             logging.info("archived %s" % thing)
+        elif 'change' in thing:
+            # rehydrate's change records, which aren't tweets
+            print(json.dumps(thing), file=fh)
         elif 'id_str' in thing:
             # tweets and users
-            if (args.format == "json"):
+            if (self.format == "json"):
                 print(json.dumps(thing), file=fh)
-            elif (args.format == "csv"):
-                csv_writer.writerow(get_row(thing))
+            elif (self.format == "csv"):
+                self.csv_writer.writerow(get_row(thing))
             logging.info("archived %s", thing['id_str'])
         elif 'woeid' in thing:
             # places
-            print(json.dump(thing), file=fh)
+            print(json.dumps(thing), file=fh)
         elif 'tweet_volume' in thing:
             # trends
-            print(json.dump(thing), file=fh)
+            print(json.dumps(thing), file=fh)
         elif 'limit' in thing:
             # rate limits
             t = datetime.datetime.utcfromtimestamp(
@@ -266,13 +721,19 @@ def main():
             t = t.isoformat("T") + "Z"
             logging.warn("%s tweets undelivered at %s",
                          thing['limit']['track'], t)
-            if args.warnings:
-                print(json.dump(thing), file=fh)
+            if self.warnings:
+                print(json.dumps(thing), file=fh)
         elif 'warning' in thing:
             # other warnings
             logging.warn(thing['warning']['message'])
-            if args.warnings:
-                print(json.dump(thing), file=fh)
+            if self.warnings:
+                print(json.dumps(thing), file=fh)
+
+    def close(self):
+        if self.fh is sys.stdout:
+            self.fh.flush()
+        else:
+            self.fh.close()
 
 
 def get_argparser():
@@ -315,6 +776,14 @@ def get_argparser():
                         help="limit to ISO 639-1 language code"),
     parser.add_argument("--geocode", dest="geocode",
                         help="limit by latitude,longitude,radius")
+    parser.add_argument("--sweep", action="store", default=None,
+                        help="search a west,south,east,north box or GeoJSON file in a grid of geocodes")
+    parser.add_argument("--cell_size", action="store", type=float,
+                        default=50,
+                        help="km across each --sweep cell starts out")
+    parser.add_argument("--cell_tweets", action="store", type=int,
+                        default=1000,
+                        help="tweets from a --sweep cell before it is split")
     parser.add_argument("--locations", dest="locations",
                         help="limit filter stream to location(s)")
     parser.add_argument("--follow", dest="follow",
@@ -324,6 +793,12 @@ def get_argparser():
     parser.add_argument("--tweet_mode", action="store", default="extended",
                         dest="tweet_mode", choices=["compat", "extended"],
                         help="set tweet mode")
+    parser.add_argument("--trim_user", action="store_true",
+                        help="only include the user id in tweets")
+    parser.add_argument("--no_entities", action="store_true",
+                        help="leave entities out of tweets")
+    parser.add_argument("--fields", action="store", default=None,
+                        help="comma separated tweet fields to keep, e.g. id_str,user.screen_name")
     parser.add_argument("--output", action="store", default=None,
                         dest="output", help="write output to file path")
     parser.add_argument("--format", action="store", default="json",
@@ -331,6 +806,62 @@ def get_argparser():
                         help="set output format")
     parser.add_argument("--split", action="store", type=int, default=0,
                         help="used with --output to split into numbered files")
+    parser.add_argument("--binary_ids", action="store", default=None,
+                        choices=["raw", "compressed"],
+                        help="write ids to --output as a binary id file")
+    parser.add_argument("--matching_rules", action="store_true",
+                        help="add the filter rules each tweet matched")
+    parser.add_argument("--spool", action="store", default=None,
+                        help="directory to buffer filter/sample stream when output stalls")
+    parser.add_argument("--spool_segments", action="store", type=int,
+                        default=MAX_SEGMENTS,
+                        help="64MB spool files to keep before dropping the "
+                             "oldest, 0 for no limit")
+    parser.add_argument("--unavailable", action="store", default=None,
+                        help="write ids of tweets that couldn't be hydrated to a file")
+    parser.add_argument("--keep_duplicates", action="store_true",
+                        help="hydrate duplicate ids more than once")
+    parser.add_argument("--tokens", action="store", default=None,
+                        help="share a pool of token sets, e.g. 0-8 or 0,2,5")
+    parser.add_argument("--processes", action="store", type=int, default=0,
+                        help="hydrate in this many processes sharing --tokens")
+    parser.add_argument("--reserve", action="store", type=int, default=0,
+                        help="calls per rate limit window kept for priority jobs")
+    parser.add_argument("--workers", action="store", type=int, default=4,
+                        help="number of jobs to run at once")
+    parser.add_argument("--pool_size", action="store", type=int, default=None,
+                        help="keep-alive connections to keep for each token, "
+                             "10 or --workers if that's more by default")
+    parser.add_argument("--state", action="store", default=None,
+                        help="database file used to remember progress")
+    parser.add_argument("--cooloff", action="store", type=int, default=0,
+                        help="seconds to skip users whose last check found nothing")
+    parser.add_argument("--archive", action="store", default="archive",
+                        help="directory that poll writes each query's tweets to")
+    parser.add_argument("--interval", action="store", type=int, default=900,
+                        help="seconds between polls of each query or place")
+    parser.add_argument("--once", action="store_true",
+                        help="poll once and exit")
+    parser.add_argument("--relation", action="store", default="friends",
+                        choices=["friends", "followers"],
+                        help="which ids to follow when crawling the graph")
+    parser.add_argument("--level", action="store", type=int, default=2,
+                        help="how far out into the graph to crawl")
+    parser.add_argument("--store", action="store", default="snapshots",
+                        help="directory for follower and friend snapshots")
+    parser.add_argument("--cache", action="store", default=None,
+                        help="database file to cache tweet and user lookups in")
+    parser.add_argument("--cache_ttl", action="store", type=int,
+                        default=86400,
+                        help="seconds before a cached lookup expires")
+    parser.add_argument("--cache_size", action="store", type=int,
+                        default=1000000,
+                        help="maximum number of tweets and users to cache")
+    parser.add_argument("--listen", action="store", default="127.0.0.1:8765",
+                        help="host:port (or unix:path for fanout) to listen on")
+    parser.add_argument("--buffer_size", action="store", type=int,
+                        default=1000,
+                        help="lines buffered per fanout subscriber before dropping")
 
     return parser
 
@@ -0,0 +1,385 @@
+"""
+Hydrate a large list of ids with several worker processes on one host.
+
+A Coordinator splits the ids into ranges and puts them in an SQLite work
+queue. Each worker process is bound to some of the tokens and claims ranges
+from the queue, hydrating each one into its own file. The coordinator
+merges finished ranges into the output and hands the ranges of a worker
+that died (or whose lease ran out) to another worker.
+"""
+
+import os
+import json
+import time
+import codecs
+import sqlite3
+import logging
+import multiprocessing
+
+from twarc.ids import IdFilter, delta_encode, delta_decode
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+MERGED = "merged"
+FAILED = "failed"
+
+
+class WorkQueue(object):
+    """
+    The ranges of ids to hydrate, kept in directory/queue.db so that the
+    coordinator and the worker processes can all see them.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.db = sqlite3.connect(os.path.join(directory, "queue.db"),
+                                  timeout=60, isolation_level=None)
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS ranges (
+                num INTEGER PRIMARY KEY,
+                ids BLOB,
+                count INTEGER,
+                status TEXT,
+                worker INTEGER,
+                lease REAL,
+                attempts INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS ranges_status ON ranges (status);
+            """
+        )
+
+    def add(self, num, ids):
+        self.db.execute(
+            "INSERT INTO ranges VALUES (?, ?, ?, ?, NULL, NULL, 0)",
+            (num, sqlite3.Binary(delta_encode(ids)), len(ids), QUEUED))
+
+    def claim(self, worker, lease):
+        """
+        Returns (num, ids) for the next queued range, leased to the worker
+        for lease seconds, or None if nothing is queued.
+        """
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.db.execute(
+                "SELECT num, ids FROM ranges WHERE status = ? "
+                "ORDER BY num LIMIT 1", (QUEUED,)).fetchone()
+            if row:
+                self.db.execute(
+                    "UPDATE ranges SET status = ?, worker = ?, lease = ? "
+                    "WHERE num = ?",
+                    (RUNNING, worker, time.time() + lease, row[0]))
+        finally:
+            self.db.execute("COMMIT")
+        if row:
+            return row[0], delta_decode(bytes(row[1]))
+        return None
+
+    def finish(self, num, worker, paths):
+        """
+        Marks a range as done by moving the worker's result files into
+        place. Returns False, and removes them, if the range was taken away
+        from the worker in the meantime.
+        """
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.db.execute(
+                "SELECT status, worker FROM ranges WHERE num = ?",
+                (num,)).fetchone()
+            owned = row == (RUNNING, worker)
+            for tmp, path in paths:
+                if owned:
+                    os.rename(tmp, path)
+                else:
+                    os.remove(tmp)
+            if owned:
+                self.db.execute(
+                    "UPDATE ranges SET status = ? WHERE num = ?", (DONE, num))
+        finally:
+            self.db.execute("COMMIT")
+        return owned
+
+    def renew(self, num, worker, lease):
+        self.db.execute(
+            "UPDATE ranges SET lease = ? WHERE num = ? AND status = ? "
+            "AND worker = ?", (time.time() + lease, num, RUNNING, worker))
+
+    def release(self, num, worker, max_attempts):
+        """
+        Puts a range that a worker couldn't hydrate back in the queue, or
+        gives up on it after max_attempts.
+        """
+        self.db.execute(
+            "UPDATE ranges SET attempts = attempts + 1, "
+            "status = CASE WHEN attempts + 1 >= ? THEN ? ELSE ? END "
+            "WHERE num = ? AND status = ? AND worker = ?",
+            (max_attempts, FAILED, QUEUED, num, RUNNING, worker))
+
+    def requeue(self, worker=None):
+        """
+        Puts the ranges of a worker, or all ranges whose lease has run out,
+        back in the queue. Returns how many were requeued.
+        """
+        if worker is None:
+            cursor = self.db.execute(
+                "UPDATE ranges SET status = ? WHERE status = ? AND lease < ?",
+                (QUEUED, RUNNING, time.time()))
+        else:
+            cursor = self.db.execute(
+                "UPDATE ranges SET status = ? WHERE status = ? AND worker = ?",
+                (QUEUED, RUNNING, worker))
+        return cursor.rowcount
+
+    def fail_remaining(self):
+        """
+        Gives up on every range that hasn't been hydrated yet.
+        """
+        self.db.execute(
+            "UPDATE ranges SET status = ? WHERE status IN (?, ?)",
+            (FAILED, QUEUED, RUNNING))
+
+    def failed(self):
+        """
+        Returns the ids of the ranges that were given up on.
+        """
+        ids = []
+        for row in self.db.execute(
+                "SELECT ids FROM ranges WHERE status = ? ORDER BY num",
+                (FAILED,)):
+            ids.extend(delta_decode(bytes(row[0])))
+        return ids
+
+    def done(self):
+        return [r[0] for r in self.db.execute(
+            "SELECT num FROM ranges WHERE status = ? ORDER BY num", (DONE,))]
+
+    def merged(self, num):
+        self.db.execute("UPDATE ranges SET status = ? WHERE num = ?",
+                        (MERGED, num))
+
+    def counts(self):
+        """
+        Returns a dictionary of the number of ranges in each status.
+        """
+        return dict(self.db.execute(
+            "SELECT status, COUNT(*) FROM ranges GROUP BY status"))
+
+    def close(self):
+        self.db.close()
+
+
+class Coordinator(object):
+    """
+    Runs a hydration of ids across worker processes. The tokens are dealt
+    out between the processes so that every token is used, and each
+    process spreads its calls over its own tokens. Ids are de-duplicated
+    as they are loaded.
+    """
+
+    def __init__(self, directory, tokens, processes=None, batch_size=10000,
+                 lease=1800, max_attempts=3, cache_args=None, **twarc_args):
+        self.directory = directory
+        self.tokens = list(tokens)
+        self.processes = min(processes or len(self.tokens), len(self.tokens))
+        self.batch_size = batch_size
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.cache_args = cache_args
+        self.twarc_args = twarc_args
+        self.workers = {}
+        self.restarts = {}
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        if os.path.isfile(os.path.join(directory, "queue.db")):
+            raise ValueError("%s already has a work queue in it" % directory)
+        self.queue = WorkQueue(directory)
+
+    def load(self, ids):
+        """
+        Splits an iterator of ids into ranges in the work queue and returns
+        how many ranges there are.
+        """
+        seen = IdFilter()
+        batch = []
+        num = 0
+        self.queue.db.execute("BEGIN")
+        try:
+            for id in ids:
+                id = id.strip()
+                if not id:
+                    continue
+                if not id.isdigit():
+                    logging.warn("skipping %s, which isn't a tweet id", id)
+                    continue
+                if not seen.add(id):
+                    continue
+                batch.append(int(id))
+                if len(batch) == self.batch_size:
+                    num += 1
+                    self.queue.add(num, batch)
+                    batch = []
+            if batch:
+                num += 1
+                self.queue.add(num, batch)
+        finally:
+            seen.close()
+        self.queue.db.execute("COMMIT")
+        logging.info("queued %s ranges of ids", num)
+        return num
+
+    def run(self, output, unavailable=None, poll=1):
+        """
+        Starts the workers and merges their results into output (which
+        needs a write method) until every range is done, writing the ids
+        of unavailable tweets to the unavailable file handle if there is
+        one. Returns the number of ranges that failed, whose ids are written
+        to failed-ids.txt in the directory so they can be tried again.
+        """
+        for slot in range(self.processes):
+            self._start(slot)
+
+        while True:
+            self._reap()
+            expired = self.queue.requeue()
+            if expired:
+                logging.warn("requeued %s ranges with expired leases",
+                             expired)
+            for num in self.queue.done():
+                self._merge(num, output, unavailable)
+            counts = self.queue.counts()
+            if not counts.get(QUEUED) and not counts.get(RUNNING) and \
+                    not counts.get(DONE):
+                break
+            if not self.workers:
+                logging.error("no workers left, giving up")
+                self.queue.fail_remaining()
+                break
+            time.sleep(poll)
+
+        for process in self.workers.values():
+            process.join()
+        counts = self.queue.counts()
+        logging.info("hydration finished: %s", counts)
+        if counts.get(FAILED):
+            path = os.path.join(self.directory, "failed-ids.txt")
+            with open(path, "w") as fh:
+                for id in self.queue.failed():
+                    fh.write("%s\n" % id)
+            logging.error("wrote the ids of %s failed ranges to %s",
+                          counts[FAILED], path)
+        return counts.get(FAILED, 0)
+
+    def close(self):
+        """
+        Closes the work queue and removes it, unless some ranges failed, in
+        which case it is kept along with failed-ids.txt.
+        """
+        failed = self.queue.counts().get(FAILED)
+        self.queue.close()
+        if failed:
+            logging.warn("keeping %s since %s ranges failed", self.directory,
+                         failed)
+        else:
+            os.remove(os.path.join(self.directory, "queue.db"))
+
+    def _start(self, slot):
+        tokens = self.tokens[slot::self.processes]
+        process = multiprocessing.Process(
+            target=work,
+            args=(self.directory, tokens, self.lease, self.max_attempts,
+                  self.cache_args, self.twarc_args)
+        )
+        process.daemon = True
+        process.start()
+        logging.info("started worker %s with tokens %s", process.pid, tokens)
+        self.workers[slot] = process
+
+    def _reap(self):
+        for slot, process in list(self.workers.items()):
+            if process.is_alive() or process.exitcode == 0:
+                continue
+            requeued = self.queue.requeue(process.pid)
+            logging.error("worker %s died with exit code %s, requeued %s "
+                          "ranges", process.pid, process.exitcode, requeued)
+            self.restarts[slot] = self.restarts.get(slot, 0) + 1
+            if self.restarts[slot] < self.max_attempts:
+                self._start(slot)
+            else:
+                del self.workers[slot]
+
+    def _merge(self, num, output, unavailable):
+        path = range_path(self.directory, num)
+        with codecs.open(path, "r", "utf8") as fh:
+            for line in fh:
+                output.write(json.loads(line))
+        with codecs.open(path + ".missing", "r", "utf8") as fh:
+            for line in fh:
+                if unavailable:
+                    unavailable.write(line)
+        os.remove(path)
+        os.remove(path + ".missing")
+        self.queue.merged(num)
+
+
+def range_path(directory, num):
+    return os.path.join(directory, "range-%06i.jsonl" % num)
+
+
+def work(directory, tokens, lease, max_attempts, cache_args, twarc_args):
+    """
+    The main loop of a worker process: claim a range, hydrate it and move
+    on to the next, until nothing is left in the queue.
+    """
+    from twarc.client import Twarc
+    from twarc.scheduler import TokenPool
+    from twarc.cache import Cache
+
+    worker = os.getpid()
+    queue = WorkQueue(directory)
+    cache = Cache(**cache_args) if cache_args else None
+    t = Twarc(pool=TokenPool(tokens), cache=cache, **twarc_args)
+
+    def renewing(num, ids):
+        # ids are looked up 100 at a time, so this renews every 10 calls
+        for n, i in enumerate(ids):
+            if n and n % 1000 == 0:
+                queue.renew(num, worker, lease)
+            yield str(i)
+
+    while True:
+        task = queue.claim(worker, lease)
+        if task is None:
+            counts = queue.counts()
+            if not counts.get(QUEUED) and not counts.get(RUNNING):
+                break
+            # another worker's ranges may yet come back to the queue
+            time.sleep(1)
+            continue
+
+        num, ids = task
+        path = range_path(directory, num)
+        tmp = "%s.%s.tmp" % (path, worker)
+        missing_tmp = "%s.missing.%s.tmp" % (path, worker)
+        logging.info("worker %s hydrating range %s", worker, num)
+        try:
+            with codecs.open(tmp, "w", "utf8") as fh, \
+                    codecs.open(missing_tmp, "w", "utf8") as missing:
+                write_missing = lambda i: missing.write(i + "\n")
+                for tweet in t.hydrate(renewing(num, ids), dedupe=False,
+                                       unavailable=write_missing):
+                    fh.write(json.dumps(tweet) + "\n")
+        except Exception:
+            logging.exception("worker %s failed on range %s", worker, num)
+            for p in (tmp, missing_tmp):
+                if os.path.isfile(p):
+                    os.remove(p)
+            queue.release(num, worker, max_attempts)
+            continue
+        if not queue.finish(num, worker, [(tmp, path),
+                                          (missing_tmp, path + ".missing")]):
+            logging.warn("worker %s lost range %s", worker, num)
+
+    queue.close()
+    if cache:
+        cache.close()
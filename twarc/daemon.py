@@ -0,0 +1,346 @@
+"""
+A long running twarc process that keeps its HTTP sessions and rate limit
+knowledge around, and accepts collection jobs over a small local HTTP API:
+
+    POST   /jobs              submit a job, e.g. {"command": "search",
+                              "query": "ferguson", "every": 3600}
+    GET    /jobs              list jobs and their status
+    GET    /jobs/<id>         the status of one job
+    GET    /jobs/<id>/results stream the job's results as JSON lines,
+                              following along while it is running
+    DELETE /jobs/<id>         stop a job and any further runs of it
+
+Jobs take the same options as the batch job file. A job with "every" is run
+again that many seconds after it last finished. Recurring search and
+timeline jobs only ask for tweets newer than the ones they already have.
+hydrate and users jobs can be given a list of "ids" instead of a file.
+"""
+
+import os
+import re
+import json
+import codecs
+import time
+import logging
+import threading
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer  # Python 3
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer  # Python 2
+    from SocketServer import ThreadingMixIn
+
+from twarc.batch import job_args, use_job_options, restore_options
+from twarc.command import get_things, trim_args, trim_error, Output
+from twarc.fanout import parse_address
+from twarc.scheduler import Scheduler, NORMAL
+
+daemon_commands = [
+    'filter',
+    'followers',
+    'friends',
+    'hydrate',
+    'sample',
+    'search',
+    'timeline',
+    'users',
+]
+
+
+class DaemonJob(object):
+    """
+    A job submitted to the daemon, which may be run more than once.
+    """
+
+    def __init__(self, job_id, spec, output):
+        self.id = job_id
+        self.spec = spec
+        self.output = output
+        self.every = spec.get('every')
+        self.since_id = spec.get('since_id')
+        self.runs = 0
+        self.count = 0
+        self.status = "pending"
+        self.error = None
+        self.next_run = time.time()
+        self.scheduled = None
+        self.stop = threading.Event()
+
+    def finished(self):
+        """
+        True when the job won't write any more results.
+        """
+        return self.stop.is_set() or (
+            self.status in ("done", "error") and not self.every)
+
+    def to_dict(self):
+        d = {
+            "id": self.id,
+            "command": self.spec.get('command'),
+            "query": self.spec.get('query'),
+            "status": self.status,
+            "runs": self.runs,
+            "count": self.count,
+            "output": self.output,
+        }
+        if self.every:
+            d["every"] = self.every
+            d["next_run"] = self.next_run
+        if self.since_id:
+            d["since_id"] = self.since_id
+        if self.error:
+            d["error"] = self.error
+        return d
+
+
+class Daemon(object):
+    """
+    Keeps a Scheduler (and so its Twarc instances and TokenPool) running and
+    starts the jobs that are submitted to it when they are due.
+    """
+
+    def __init__(self, directory, args, pool, cache=None, transport=None):
+        self.directory = directory
+        self.args = args
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.counter = 0
+        self.stopped = threading.Event()
+        self.scheduler = Scheduler(
+            pool,
+            workers=args.workers,
+            connection_errors=args.connection_errors,
+            http_errors=args.http_errors,
+            config=args.config,
+            profile=args.profile,
+            tweet_mode=args.tweet_mode,
+            cache=cache,
+            transport=transport,
+            **trim_args(args)
+        )
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def submit(self, spec):
+        if spec.get('command') not in daemon_commands:
+            raise ValueError("%s jobs aren't supported" % spec.get('command'))
+        if spec.get('command') in ('hydrate', 'users') and \
+                not (spec.get('ids') or spec.get('query')):
+            raise ValueError("%s needs ids or a query" % spec['command'])
+        error = trim_error(spec['command'], job_args(self.args, spec))
+        if error:
+            raise ValueError(error)
+        with self.lock:
+            self.counter += 1
+            job_id = self.counter
+            output = os.path.join(self.directory, "job-%05i.jsonl" % job_id)
+            job = self.jobs[job_id] = DaemonJob(job_id, spec, output)
+        logging.info("submitted job %s: %s", job_id, spec)
+        self.start_due()
+        return job
+
+    def cancel(self, job_id):
+        job = self.jobs[job_id]
+        job.stop.set()
+        job.every = None
+        if job.status == "pending":
+            job.status = "cancelled"
+        return job
+
+    def start_due(self):
+        now = time.time()
+        with self.lock:
+            due = [j for j in self.jobs.values()
+                   if j.status != "running" and not j.stop.is_set()
+                   and j.next_run and j.next_run <= now]
+            for job in due:
+                job.status = "running"
+                job.next_run = None
+        for job in due:
+            self._start(job)
+
+    def run(self):
+        """
+        Starts jobs as they become due until stop() is called.
+        """
+        while not self.stopped.wait(1):
+            self.start_due()
+
+    def stop(self):
+        self.stopped.set()
+        for job in self.jobs.values():
+            job.stop.set()
+        self.scheduler.shutdown()
+
+    def _start(self, job):
+        spec = job.spec
+        options = job_args(self.args, spec)
+        options.output = None
+        if job.since_id and spec['command'] in ('search', 'timeline'):
+            options.since_id = job.since_id
+
+        def func(t):
+            saved = use_job_options(t, options)
+            try:
+                for thing in run(t):
+                    yield thing
+            finally:
+                restore_options(t, saved)
+
+        def run(t):
+            command = spec['command']
+            query = spec.get('query') or ""
+            if command == 'filter':
+                things = t.filter(track=query, follow=options.follow,
+                                  locations=options.locations,
+                                  event=job.stop)
+            elif command == 'sample':
+                things = t.sample(event=job.stop)
+            elif command == 'hydrate' and spec.get('ids'):
+                things = t.hydrate(iter(spec['ids']))
+            elif command == 'users' and spec.get('ids'):
+                things = t.user_lookup(user_ids=spec['ids'])
+            else:
+                things = get_things(t, command, query, options)
+
+            fh = codecs.open(job.output, 'a', 'utf8')
+            output = Output(format=options.format, fh=fh)
+            newest = job.since_id
+            try:
+                for thing in things:
+                    if job.stop.is_set():
+                        break
+                    output.write(thing)
+                    fh.flush()
+                    if isinstance(thing, dict) and 'id_str' in thing and \
+                            command in ('search', 'timeline'):
+                        if not newest or int(thing['id_str']) > int(newest):
+                            newest = thing['id_str']
+                    job.count += 1
+                    yield thing
+                else:
+                    # only once every page has been read, so that a run
+                    # that fails part way is tried again from the start
+                    job.since_id = newest
+            finally:
+                output.close()
+
+        def done(scheduled):
+            scheduled.wait()
+            job.runs += 1
+            job.status = scheduled.status
+            job.error = str(scheduled.error) if scheduled.error else None
+            if job.every and not job.stop.is_set():
+                job.next_run = time.time() + job.every
+            logging.info("job %s run %s finished: %s", job.id, job.runs,
+                         job.status)
+
+        job.scheduled = self.scheduler.submit(
+            func,
+            priority=spec.get('priority', NORMAL),
+            weight=spec.get('weight', 1),
+            name="daemon job %s" % job.id
+        )
+        waiter = threading.Thread(target=done, args=(job.scheduled,))
+        waiter.daemon = True
+        waiter.start()
+
+
+class DaemonServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, daemon):
+        HTTPServer.__init__(self, address, DaemonHandler)
+        self.twarc_daemon = daemon
+
+
+class DaemonHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        daemon = self.server.twarc_daemon
+        if self.path.rstrip('/') == '/jobs':
+            jobs = sorted(daemon.jobs.values(), key=lambda j: j.id)
+            return self.send_json(200, [j.to_dict() for j in jobs])
+
+        m = re.match(r'^/jobs/(\d+)(/results)?/?$', self.path)
+        if not m or int(m.group(1)) not in daemon.jobs:
+            return self.send_json(404, {"error": "no such job"})
+        job = daemon.jobs[int(m.group(1))]
+        if not m.group(2):
+            return self.send_json(200, job.to_dict())
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.end_headers()
+        self.follow(job)
+
+    def do_POST(self):
+        daemon = self.server.twarc_daemon
+        if self.path.rstrip('/') != '/jobs':
+            return self.send_json(404, {"error": "not found"})
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            spec = json.loads(self.rfile.read(length).decode('utf8'))
+            job = daemon.submit(spec)
+        except ValueError as e:
+            return self.send_json(400, {"error": str(e)})
+        self.send_json(201, job.to_dict())
+
+    def do_DELETE(self):
+        daemon = self.server.twarc_daemon
+        m = re.match(r'^/jobs/(\d+)/?$', self.path)
+        if not m or int(m.group(1)) not in daemon.jobs:
+            return self.send_json(404, {"error": "no such job"})
+        self.send_json(200, daemon.cancel(int(m.group(1))).to_dict())
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode('utf8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def follow(self, job):
+        """
+        Writes the job's output file to the client, waiting for more lines
+        until the job has finished.
+        """
+        while not os.path.isfile(job.output) and not job.finished():
+            time.sleep(0.5)
+        if not os.path.isfile(job.output):
+            return
+        with open(job.output, 'rb') as fh:
+            while True:
+                line = fh.readline()
+                if line.endswith(b'\n'):
+                    self.wfile.write(line)
+                    continue
+                if job.finished():
+                    break
+                fh.seek(-len(line), os.SEEK_CUR)
+                self.wfile.flush()
+                time.sleep(0.5)
+
+    def log_message(self, format, *args):
+        logging.info("%s %s", self.address_string(), format % args)
+
+
+def serve(directory, args, pool, cache=None, transport=None):
+    """
+    Runs the daemon and its HTTP API until interrupted.
+    """
+    daemon = Daemon(directory, args, pool, cache, transport)
+    server = DaemonServer(parse_address(args.listen), daemon)
+    logging.info("daemon listening on %s", args.listen)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        daemon.stop()
@@ -2,56 +2,40 @@ import time
 import logging
 import requests
 
+from .scheduler import resource
+
 def rate_limit(f):
     """
-    A decorator to handle rate limiting from the Twitter API. If
-    a rate limit error is encountered we will sleep until we can
-    issue the API call again.
+    A decorator to handle rate limiting from the Twitter API. A token is
+    taken from the instance's TokenPool before each call, which will sleep
+    until one is available for the resource being requested. If a rate limit
+    error is encountered the token is marked as unavailable until its window
+    resets and the call is tried again with the next available token.
     """
     def new_f(*args, **kwargs):
         errors = 0
-        #print ("current_token is ", args[0].current_token)
-        
+        self = args[0]
+        res = resource(args[1]) if len(args) > 1 else None
+
         while True:
-        
-            args[0].current_token = -1
-        
-            ## Get the next available token
-            next_available_second = args[0].token_availability[0]
-            now = time.time()
-            for x in range(0, 9):
-                
-                # Keep track of next available time in case they are all taken
-                if args[0].token_availability[x] < next_available_second:
-                    next_available_second = args[0].token_availability[x]
-                
-                # If there exists a token which is now available, take it
-                if now > args[0].token_availability[x]:
-                    args[0].current_token = x
-                    break
-                
-            # If no tokens are available, sleep until the next one is
-            if args[0].current_token == -1:
-                seconds = next_available_second - now + 10
-                logging.warn("All 9 tokens used: sleeping %s secs", seconds)
-                time.sleep(seconds)
-        
+            self.current_token = self.pool.acquire(res, self.job)
+
             # Execute the function with the appropriate token
             resp = f(*args, **kwargs)
-            
-            
+            self.pool.update(self.current_token, res, resp)
+
             ## Error handling
             # If done
             if resp.status_code == 200:
                 errors = 0
                 return resp
-                
-            # If reached the request limit
+
+            # If reached the request limit, the pool will hand out another
+            # token or sleep until this one is available again
             elif resp.status_code == 429:
-            
-                # Get the absolute second when rate limit resets and set it as the next available time for the token
-                args[0].token_availability[args[0].current_token] = int(resp.headers['x-rate-limit-reset'])
-                
+                logging.warn("rate limit exceeded for token %s",
+                             self.current_token)
+
             # If some other error
             elif resp.status_code >= 500:
                 errors += 1
@@ -85,7 +69,7 @@ def catch_conn_reset(f):
                 return f(self, *args, **kwargs)
             except ConnectionError as e:
                 logging.warn("caught connection reset error: %s", e)
-                self.connect()
+                self.recover()
                 return f(self, *args, **kwargs)
         else:
             return f(self, *args, **kwargs)
@@ -97,17 +81,11 @@ def catch_timeout(f):
     A decorator to handle read timeouts from Twitter.
     """
     def new_f(self, *args, **kwargs):
-        print(self.arg_keys)
-        print(self.consumer_key[self.arg_keys])
-        print(self.consumer_secret[self.arg_keys])
-        print(self.access_token[self.arg_keys])
-        print(self.access_token_secret[self.arg_keys])
-    
         try:
             return f(self, *args, **kwargs)
         except requests.exceptions.ReadTimeout as e:
             logging.warn("caught read timeout: %s", e)
-            self.connect()
+            self.recover()
             return f(self, *args, **kwargs)
     return new_f
 
@@ -122,7 +100,7 @@ def catch_gzip_errors(f):
             return f(self, *args, **kwargs)
         except requests.exceptions.ContentDecodingError as e:
             logging.warn("caught gzip error: %s", e)
-            self.connect()
+            self.recover()
             return f(self, *args, **kwargs)
     return new_f
 
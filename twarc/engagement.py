@@ -0,0 +1,247 @@
+"""
+Track how the retweet and favorite counts of a set of tweets change.
+
+Rather than hydrating and storing whole tweets over and over, a Tracker
+keeps a schedule for each watched tweet and only rehydrates the ones that
+are due. Young tweets are checked often and older ones less and less, since
+their counts settle down. Each check appends one row of fixed size numbers
+to a set of column files:
+
+    id.col              uint64 tweet id
+    time.col            uint32 unix time of the check
+    retweet_count.col   int32
+    favorite_count.col  int32
+    reply_count.col     int32, -1 when the API doesn't say
+    quote_count.col     int32, -1 when the API doesn't say
+
+Tweets that can no longer be hydrated are flagged and aren't checked again.
+"""
+
+import os
+import time
+import struct
+import sqlite3
+import logging
+
+# milliseconds since the epoch at which tweet ids start counting
+TWEPOCH = 1288834974657
+
+columns = [
+    ("id", "Q"),
+    ("time", "I"),
+    ("retweet_count", "i"),
+    ("favorite_count", "i"),
+    ("reply_count", "i"),
+    ("quote_count", "i"),
+]
+
+
+def tweet_time(tweet_id):
+    """
+    Returns when a tweet was created, from its (snowflake) id.
+    """
+    return ((int(tweet_id) >> 22) + TWEPOCH) / 1000.0
+
+
+class Tracker(object):
+    """
+    Keeps the watched tweets and their schedule in directory/tracker.db and
+    the counts in column files next to it. A tweet is next checked after
+    factor times its age, but no sooner than min_interval and no later than
+    max_interval seconds, and is dropped once it is older than max_age.
+    """
+
+    def __init__(self, directory, min_interval=3600, max_interval=86400,
+                 factor=0.25, max_age=30 * 86400):
+        self.directory = directory
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.factor = factor
+        self.max_age = max_age
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.db = sqlite3.connect(os.path.join(directory, "tracker.db"))
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS watched (
+                id INTEGER PRIMARY KEY,
+                next_check REAL,
+                checks INTEGER,
+                unavailable REAL
+            );
+            CREATE INDEX IF NOT EXISTS watched_next_check
+                ON watched (next_check);
+            """
+        )
+        self.db.commit()
+        self._align_columns()
+
+    def watch(self, ids, now=None):
+        """
+        Starts watching tweet ids, which are due to be checked now. Ids that
+        are already being watched are left alone.
+        """
+        now = now or time.time()
+        self.db.executemany(
+            "INSERT OR IGNORE INTO watched VALUES (?, ?, 0, NULL)",
+            ((int(i), now) for i in ids if str(i).strip()))
+        self.db.commit()
+
+    def interval(self, tweet_id, now):
+        age = now - tweet_time(tweet_id)
+        return min(self.max_interval, max(self.min_interval,
+                                          age * self.factor))
+
+    def due(self, now=None):
+        """
+        Returns the ids that are due to be checked, oldest first.
+        """
+        now = now or time.time()
+        return [r[0] for r in self.db.execute(
+            "SELECT id FROM watched WHERE next_check <= ? "
+            "ORDER BY next_check", (now,))]
+
+    def next_due(self):
+        return self.db.execute(
+            "SELECT MIN(next_check) FROM watched").fetchone()[0]
+
+    def check(self, t, now=None):
+        """
+        Rehydrates the due tweets with Twarc instance t, recording their
+        counts and flagging the ones that are unavailable. Returns the
+        number of tweets that were checked and that were unavailable.
+        """
+        now = now or time.time()
+        due = self.due(now)
+        checked = unavailable = 0
+        rows = []
+        schedule = []
+        gone = []
+        for tweet_id, tweet in t.lookup((str(i) for i in due), dedupe=False):
+            tweet_id = int(tweet_id)
+            checked += 1
+            if tweet is None:
+                unavailable += 1
+                gone.append((now, tweet_id))
+                continue
+            rows.append((tweet_id, int(now),
+                         tweet.get('retweet_count', 0),
+                         tweet.get('favorite_count', 0),
+                         _count(tweet, 'reply_count'),
+                         _count(tweet, 'quote_count')))
+            if now - tweet_time(tweet_id) > self.max_age:
+                next_check = None
+            else:
+                next_check = now + self.interval(tweet_id, now)
+            schedule.append((next_check, tweet_id))
+            if len(rows) >= 10000:
+                self._append(rows)
+                rows = []
+        self._append(rows)
+        self.db.executemany(
+            "UPDATE watched SET next_check = ?, checks = checks + 1 "
+            "WHERE id = ?", schedule)
+        self.db.executemany(
+            "UPDATE watched SET next_check = NULL, unavailable = ? "
+            "WHERE id = ?", gone)
+        self.db.commit()
+        logging.info("checked %s tweets, %s unavailable", checked,
+                     unavailable)
+        return checked, unavailable
+
+    def unavailable(self):
+        """
+        Returns (id, time) for each watched tweet that became unavailable.
+        """
+        return self.db.execute(
+            "SELECT id, unavailable FROM watched WHERE unavailable IS NOT NULL "
+            "ORDER BY id").fetchall()
+
+    def run(self, t, event=None, reload=None, reload_interval=60):
+        """
+        Checks tweets as they become due until the event is set. If reload
+        is given it is called before each check, e.g. to watch new ids, and
+        at least every reload_interval seconds, so that it keeps running
+        while there's nothing to check. Without it run returns once no
+        tweet is due to be checked again.
+        """
+        while not (event and event.is_set()):
+            if reload:
+                reload()
+            self.check(t)
+            next_check = self.next_due()
+            if next_check is None and not reload:
+                logging.info("no more tweets to check")
+                break
+            if next_check is None:
+                wait = reload_interval
+            else:
+                wait = max(1, next_check - time.time())
+            if reload:
+                wait = min(wait, reload_interval)
+            logging.info("sleeping %.0f seconds until the next check", wait)
+            if event:
+                event.wait(wait)
+            else:
+                time.sleep(wait)
+
+    def close(self):
+        self.db.close()
+
+    def _append(self, rows):
+        if not rows:
+            return
+        try:
+            for i, (name, code) in enumerate(columns):
+                path = os.path.join(self.directory, "%s.col" % name)
+                with open(path, "ab") as fh:
+                    fh.write(struct.pack("<%d%s" % (len(rows), code),
+                                         *[r[i] for r in rows]))
+        except Exception:
+            self._align_columns()
+            raise
+
+    def _align_columns(self):
+        """
+        The columns are appended to one at a time, so a crash part way
+        through can leave some of them longer than others, and every row
+        appended after that would be out of line. Truncates them all to the
+        number of rows they have in common.
+        """
+        sizes = []
+        for name, code in columns:
+            path = os.path.join(self.directory, "%s.col" % name)
+            size = os.path.getsize(path) if os.path.isfile(path) else 0
+            sizes.append((path, size, struct.calcsize("<" + code)))
+        rows = min(size // width for path, size, width in sizes)
+        for path, size, width in sizes:
+            if size > rows * width:
+                logging.warn("truncating %s to %s rows", path, rows)
+                with open(path, "r+b") as fh:
+                    fh.truncate(rows * width)
+
+
+def _count(tweet, key):
+    value = tweet.get(key)
+    return -1 if value is None else value
+
+
+def read_samples(directory):
+    """
+    Returns a dictionary of each column's name to the list of its values.
+    """
+    samples = {}
+    for name, code in columns:
+        path = os.path.join(directory, "%s.col" % name)
+        data = b""
+        if os.path.isfile(path):
+            with open(path, "rb") as fh:
+                data = fh.read()
+        count = len(data) // struct.calcsize("<" + code)
+        samples[name] = list(struct.unpack_from("<%d%s" % (count, code), data))
+    # a crash part way through appending a check can leave some columns
+    # longer than others
+    rows = min(len(values) for values in samples.values())
+    for name in samples:
+        del samples[name][rows:]
+    return samples
@@ -0,0 +1,229 @@
+"""
+Rebroadcast a single filter or sample stream to any number of local
+subscribers over a TCP or Unix domain socket.
+"""
+
+import os
+import json
+import stat
+import errno
+import socket
+import logging
+import threading
+
+try:
+    import queue  # Python 3
+except ImportError:
+    import Queue as queue  # Python 2
+
+
+class Subscriber(object):
+    """
+    A connected client with its own bounded buffer. When a subscriber can't
+    keep up, lines that don't fit in its buffer are dropped and counted so
+    that it never holds up the upstream connection or other subscribers.
+    """
+
+    def __init__(self, sock, address, buffer_size=1000):
+        self.sock = sock
+        self.address = address
+        self.queue = queue.Queue(maxsize=buffer_size)
+        self.sent = 0
+        self.dropped = 0
+        self.closed = threading.Event()
+        self.thread = threading.Thread(target=self._send)
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+
+    def put(self, line):
+        try:
+            self.queue.put_nowait(line)
+        except queue.Full:
+            self.dropped += 1
+
+    def finish(self, timeout=5):
+        """
+        Give the subscriber a chance to receive what is already buffered
+        before it is disconnected.
+        """
+        try:
+            self.queue.put(None, timeout=timeout)
+            self.thread.join(timeout)
+        except queue.Full:
+            pass
+        self.close()
+
+    def close(self):
+        if self.closed.is_set():
+            return
+        self.closed.set()
+        try:
+            self.sock.close()
+        except socket.error:
+            pass
+        # wake up the sending thread if it's waiting on an empty queue
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+        logging.info("subscriber %s disconnected after %s lines, %s dropped",
+                     self.address, self.sent, self.dropped)
+
+    def _send(self):
+        while not self.closed.is_set():
+            line = self.queue.get()
+            if line is None:
+                break
+            try:
+                self.sock.sendall(line)
+                self.sent += 1
+            except socket.error as e:
+                logging.info("unable to write to subscriber %s: %s",
+                             self.address, e)
+                break
+        self.close()
+
+
+class FanoutServer(object):
+    """
+    Accepts subscribers on a local socket and writes every line it is given
+    to each of them. The address can be a host:port pair, or a path to a
+    Unix domain socket prefixed with unix:, which is only replaced if it is
+    a socket that nothing is listening on any more.
+    """
+
+    def __init__(self, address="127.0.0.1:8765", buffer_size=1000):
+        self.address = address
+        self.buffer_size = buffer_size
+        self.subscribers = []
+        self.lock = threading.Lock()
+        self.sock = None
+        self.thread = None
+        self.path = None
+
+    def listen(self):
+        if self.address.startswith("unix:"):
+            path = self.address[5:]
+            if os.path.exists(path):
+                remove_stale_socket(path)
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.bind(path)
+            self.path = path
+        else:
+            host, port = parse_address(self.address)
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.sock.bind((host, port))
+        self.sock.listen(128)
+        logging.info("listening for subscribers on %s", self.address)
+        self.thread = threading.Thread(target=self._accept)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def close(self):
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+        with self.lock:
+            subscribers, self.subscribers = self.subscribers, []
+        for s in subscribers:
+            s.finish()
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+            self.path = None
+
+    def broadcast(self, line):
+        """
+        Hand a line (bytes) to every subscriber without blocking.
+        """
+        with self.lock:
+            subscribers = self.subscribers
+            if any(s.closed.is_set() for s in subscribers):
+                subscribers = [s for s in subscribers
+                               if not s.closed.is_set()]
+                self.subscribers = subscribers
+        for s in subscribers:
+            s.put(line)
+
+    def serve(self, things, event=None):
+        """
+        Broadcast each item from a filter or sample iterator until it is
+        exhausted or the optional threading.Event is set. Raw lines of JSON
+        are sent as they are, and anything else is encoded as JSON.
+        """
+        if not self.sock:
+            self.listen()
+        count = 0
+        try:
+            for thing in things:
+                if event and event.is_set():
+                    break
+                if not isinstance(thing, dict):
+                    line = thing + "\n"
+                else:
+                    line = json.dumps(thing) + "\n"
+                line = line.encode("utf8")
+                self.broadcast(line)
+                count += 1
+                if count % 10000 == 0:
+                    self.log_stats(count)
+        finally:
+            self.log_stats(count)
+            self.close()
+
+    def log_stats(self, count):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        logging.info("broadcast %s lines to %s subscribers", count,
+                     len(subscribers))
+        for s in subscribers:
+            if s.dropped:
+                logging.warn("subscriber %s has dropped %s lines",
+                             s.address, s.dropped)
+
+    def _accept(self):
+        while self.sock:
+            try:
+                conn, addr = self.sock.accept()
+            except socket.error:
+                break
+            addr = addr or self.address
+            logging.info("new subscriber %s", addr)
+            s = Subscriber(conn, addr, self.buffer_size)
+            s.start()
+            with self.lock:
+                self.subscribers = self.subscribers + [s]
+
+
+def remove_stale_socket(path):
+    """
+    Removes a Unix domain socket left behind by a server that has gone away.
+    A ValueError is raised if the path is something else, or a server is
+    still listening on it.
+    """
+    if not stat.S_ISSOCK(os.stat(path).st_mode):
+        raise ValueError("%s already exists and isn't a socket" % path)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except socket.error as e:
+        if e.errno != errno.ECONNREFUSED:
+            raise
+        logging.info("removing stale socket %s", path)
+        os.remove(path)
+        return
+    finally:
+        sock.close()
+    raise ValueError("something is already listening on %s" % path)
+
+
+def parse_address(address):
+    """
+    Turns host:port (or just :port) into a (host, port) tuple.
+    """
+    if address.startswith("tcp:"):
+        address = address[4:]
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
@@ -0,0 +1,241 @@
+"""
+Search a large area by tiling it with many small geocode circles.
+
+A search with one big geocode radius can't be split across tokens, and
+busy areas run into the limit on how far back search goes before all
+their tweets have been collected. A sweep covers a bounding box, or the
+polygons in a GeoJSON file, with a grid of cells, searches the circle
+around each cell concurrently and splits cells that turn out to be busy
+into four smaller ones.
+"""
+
+import math
+import json
+import logging
+import threading
+
+from twarc.ids import IdFilter
+from twarc.scheduler import Scheduler
+
+EARTH_RADIUS = 6371.0
+
+
+class Cell(object):
+    """
+    A rectangle of latitude and longitude that is searched with the
+    smallest geocode circle that covers it.
+    """
+
+    def __init__(self, south, west, north, east, depth=0):
+        self.south = south
+        self.west = west
+        self.north = north
+        self.east = east
+        self.depth = depth
+
+    def center(self):
+        return (self.south + self.north) / 2.0, (self.west + self.east) / 2.0
+
+    def corners(self):
+        return [(self.south, self.west), (self.south, self.east),
+                (self.north, self.west), (self.north, self.east)]
+
+    def radius(self):
+        """
+        Returns the distance in km from the center to the furthest corner.
+        """
+        lat, lon = self.center()
+        return max(distance(lat, lon, c[0], c[1]) for c in self.corners())
+
+    def geocode(self):
+        lat, lon = self.center()
+        return "%.6f,%.6f,%.3fkm" % (lat, lon, self.radius())
+
+    def split(self):
+        """
+        Returns the four quarters of the cell.
+        """
+        lat, lon = self.center()
+        depth = self.depth + 1
+        return [Cell(self.south, self.west, lat, lon, depth),
+                Cell(self.south, lon, lat, self.east, depth),
+                Cell(lat, self.west, self.north, lon, depth),
+                Cell(lat, lon, self.north, self.east, depth)]
+
+    def contains(self, lat, lon):
+        return self.south <= lat <= self.north and \
+            self.west <= lon <= self.east
+
+    def __repr__(self):
+        return "<Cell %s,%s,%s,%s>" % (self.west, self.south, self.east,
+                                       self.north)
+
+
+def distance(lat1, lon1, lat2, lon2):
+    """
+    Returns the great circle distance in km between two points.
+    """
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + \
+        math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(a)))
+
+
+def grid(bbox, cell_size):
+    """
+    Covers a (west, south, east, north) bounding box with cells about
+    cell_size km across.
+    """
+    west, south, east, north = bbox
+    mid = (south + north) / 2.0
+    height = distance(south, west, north, west)
+    width = distance(mid, west, mid, east)
+    rows = max(1, int(math.ceil(height / cell_size)))
+    cols = max(1, int(math.ceil(width / cell_size)))
+    lat_step = (north - south) / float(rows)
+    lon_step = (east - west) / float(cols)
+    cells = []
+    for row in range(rows):
+        for col in range(cols):
+            cells.append(Cell(south + row * lat_step, west + col * lon_step,
+                              south + (row + 1) * lat_step,
+                              west + (col + 1) * lon_step))
+    return cells
+
+
+def read_polygons(geojson):
+    """
+    Returns the polygons in a GeoJSON geometry, feature or feature
+    collection, each as a list of rings of (lon, lat) points.
+    """
+    kind = geojson.get("type")
+    if kind == "FeatureCollection":
+        polygons = []
+        for feature in geojson["features"]:
+            polygons.extend(read_polygons(feature))
+        return polygons
+    elif kind == "Feature":
+        return read_polygons(geojson["geometry"])
+    elif kind == "Polygon":
+        return [geojson["coordinates"]]
+    elif kind == "MultiPolygon":
+        return list(geojson["coordinates"])
+    raise ValueError("no polygons in GeoJSON %s" % kind)
+
+
+def in_polygon(lon, lat, polygon):
+    """
+    Tests if a point is inside a polygon (and not in one of its holes).
+    """
+    inside = False
+    for ring in polygon:
+        n = len(ring)
+        for i in range(n):
+            x1, y1 = ring[i][:2]
+            x2, y2 = ring[i - 1][:2]
+            if (y1 > lat) != (y2 > lat) and \
+                    lon < (x2 - x1) * (lat - y1) / float(y2 - y1) + x1:
+                inside = not inside
+    return inside
+
+
+def intersects(cell, polygons):
+    """
+    Tests (approximately) if a cell overlaps any of the polygons: whether a
+    corner or the center of the cell is in a polygon, or a polygon vertex
+    is in the cell.
+    """
+    points = cell.corners() + [cell.center()]
+    for polygon in polygons:
+        for lat, lon in points:
+            if in_polygon(lon, lat, polygon):
+                return True
+        for ring in polygon:
+            for point in ring:
+                if cell.contains(point[1], point[0]):
+                    return True
+    return False
+
+
+def parse_area(area):
+    """
+    Returns the cells' bounding box and the polygons (or None) for an area
+    given as "west,south,east,north" or the path to a GeoJSON file.
+    """
+    parts = area.split(",")
+    if len(parts) == 4:
+        try:
+            return tuple(float(p) for p in parts), None
+        except ValueError:
+            pass
+    with open(area) as fh:
+        polygons = read_polygons(json.load(fh))
+    points = [p for polygon in polygons for ring in polygon for p in ring]
+    bbox = (min(p[0] for p in points), min(p[1] for p in points),
+            max(p[0] for p in points), max(p[1] for p in points))
+    return bbox, polygons
+
+
+def sweep(q, area, pool, write, cell_size=50, cell_tweets=1000, min_size=1,
+          workers=4, search_args=None, **twarc_args):
+    """
+    Searches for q across an area (see parse_area) a cell at a time,
+    passing each tweet to write() once, even if it turned up in more than
+    one of the overlapping circles.
+
+    A cell that gives back cell_tweets tweets is likely to have more, so
+    rather than carrying on its search is handed to its four quarters,
+    starting where it left off, until cells are min_size km across.
+    Returns the number of cells that were searched.
+    """
+    bbox, polygons = parse_area(area)
+    cells = grid(bbox, cell_size)
+    if polygons:
+        cells = [c for c in cells if intersects(c, polygons)]
+    logging.info("sweeping %s cells of %skm", len(cells), cell_size)
+
+    scheduler = Scheduler(pool, workers=workers, **twarc_args)
+    seen = IdFilter()
+    lock = threading.Lock()
+    searched = []
+    found = [0]
+
+    def locked_write(job, tweet):
+        with lock:
+            if seen.add(tweet['id_str']):
+                found[0] += 1
+                write(tweet)
+
+    def submit(cell, args):
+        scheduler.submit(make_func(cell, args), name=cell.geocode(),
+                         callback=locked_write)
+
+    def make_func(cell, args):
+        def func(t):
+            searched.append(cell)
+            count = 0
+            oldest = None
+            for tweet in t.search(q, geocode=cell.geocode(), **args):
+                count += 1
+                oldest = tweet['id_str']
+                yield tweet
+                if count == cell_tweets:
+                    break
+            size = distance(cell.south, cell.west, cell.north, cell.west)
+            if count == cell_tweets and size / 2 >= min_size:
+                logging.info("splitting busy cell %s", cell)
+                child_args = dict(args, max_id=str(int(oldest) - 1))
+                for child in cell.split():
+                    if not polygons or intersects(child, polygons):
+                        submit(child, child_args)
+        return func
+
+    for cell in cells:
+        submit(cell, dict(search_args or {}))
+
+    scheduler.join()
+    scheduler.shutdown()
+    seen.close()
+    logging.info("searched %s cells, found %s tweets", len(searched),
+                 found[0])
+    return len(searched)
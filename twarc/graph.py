@@ -0,0 +1,181 @@
+"""
+Crawl the follower or friend graph outwards from some seed users.
+"""
+
+import sqlite3
+import logging
+import threading
+
+import requests
+
+from twarc.ids import delta_encode, delta_decode
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class GraphCrawler(object):
+    """
+    A breadth-first crawl of the friend (or follower) graph. Every user that
+    is discovered is added to a frontier table once, so users that are
+    reachable in more than one way are only fetched once. Workers take the
+    shallowest queued user, walk their id cursor and write their adjacency
+    list to an EdgeWriter.
+
+    The frontier and the pages of ids (along with the cursor that follows
+    each one) of every partially fetched list are kept in an SQLite
+    database, so an interrupted
+    crawl carries on where it left off when it is started again with the
+    same state file.
+    """
+
+    def __init__(self, state, pool, relation="friends", level=2, workers=4,
+                 **twarc_args):
+        self.pool = pool
+        self.relation = relation
+        self.level = level
+        self.workers = workers
+        self.twarc_args = twarc_args
+        self.condition = threading.Condition()
+        self.running = 0
+        self.fetched = 0
+        self.db = sqlite3.connect(state, check_same_thread=False)
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS frontier (
+                user_id INTEGER PRIMARY KEY,
+                depth INTEGER,
+                status TEXT
+            );
+            CREATE INDEX IF NOT EXISTS frontier_status
+                ON frontier (status, depth);
+            CREATE TABLE IF NOT EXISTS pages (
+                user_id INTEGER,
+                cursor INTEGER,
+                ids BLOB
+            );
+            CREATE INDEX IF NOT EXISTS pages_user_id ON pages (user_id);
+            """
+        )
+        # anything that was being fetched when we stopped needs doing again
+        self.db.execute("UPDATE frontier SET status = ? WHERE status = ?",
+                        (QUEUED, RUNNING))
+        self.db.commit()
+
+    def seed(self, user_ids):
+        with self.condition:
+            self.db.executemany(
+                "INSERT OR IGNORE INTO frontier VALUES (?, 0, ?)",
+                [(int(u), QUEUED) for u in user_ids]
+            )
+            self.db.commit()
+
+    def crawl(self, writer):
+        """
+        Runs the crawl to completion, writing each user's list of ids to the
+        writer.
+        """
+        from twarc.client import Twarc
+        threads = []
+        for i in range(self.workers):
+            t = Twarc(pool=self.pool, **self.twarc_args)
+            thread = threading.Thread(target=self._work, args=(t, writer))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        logging.info("crawl finished after fetching %s users", self.fetched)
+
+    def counts(self):
+        """
+        Returns a dictionary of the number of users in each crawl status.
+        """
+        with self.condition:
+            return dict(self.db.execute(
+                "SELECT status, COUNT(*) FROM frontier GROUP BY status"))
+
+    def _next(self):
+        with self.condition:
+            while True:
+                row = self.db.execute(
+                    "SELECT user_id, depth FROM frontier WHERE status = ? "
+                    "ORDER BY depth LIMIT 1", (QUEUED,)).fetchone()
+                if row:
+                    self.db.execute(
+                        "UPDATE frontier SET status = ? WHERE user_id = ?",
+                        (RUNNING, row[0]))
+                    self.db.commit()
+                    self.running += 1
+                    return row
+                if self.running == 0:
+                    self.condition.notify_all()
+                    return None
+                # another worker may still add users to the frontier
+                self.condition.wait()
+
+    def _work(self, t, writer):
+        while True:
+            task = self._next()
+            if task is None:
+                break
+            user_id, depth = task
+            status = FAILED
+            try:
+                ids = self._fetch(t, user_id)
+                status = DONE
+            except requests.exceptions.HTTPError as e:
+                if e.response.status_code not in (401, 404):
+                    logging.exception("unable to crawl %s", user_id)
+                else:
+                    logging.info("can't get %s for %s", self.relation,
+                                 user_id)
+            except Exception:
+                logging.exception("unable to crawl %s", user_id)
+
+            with self.condition:
+                if status == DONE:
+                    writer.write(user_id, ids)
+                    writer.flush()
+                    if depth + 1 < self.level:
+                        self.db.executemany(
+                            "INSERT OR IGNORE INTO frontier VALUES (?, ?, ?)",
+                            [(i, depth + 1, QUEUED) for i in ids])
+                    self.fetched += 1
+                self.db.execute("DELETE FROM pages WHERE user_id = ?",
+                                (user_id,))
+                self.db.execute(
+                    "UPDATE frontier SET status = ? WHERE user_id = ?",
+                    (status, user_id))
+                self.db.commit()
+                self.running -= 1
+                self.condition.notify_all()
+
+    def _fetch(self, t, user_id):
+        with self.condition:
+            rows = self.db.execute(
+                "SELECT cursor, ids FROM pages WHERE user_id = ? "
+                "ORDER BY rowid", (user_id,)).fetchall()
+        cursor, ids = -1, []
+        for cursor, page in rows:
+            ids.extend(delta_decode(bytes(page)))
+        if rows:
+            logging.info("resuming %s for %s at cursor %s", self.relation,
+                         user_id, cursor)
+
+        logging.info("getting %s for user %s", self.relation, user_id)
+        for page, cursor in t.id_pages(self.relation, user_id, cursor):
+            ids.extend(page)
+            if cursor:
+                # only the new page is saved, and encoded outside the lock
+                blob = sqlite3.Binary(delta_encode(page))
+                with self.condition:
+                    self.db.execute("INSERT INTO pages VALUES (?, ?, ?)",
+                                    (user_id, cursor, blob))
+                    self.db.commit()
+        return ids
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,413 @@
+"""
+Compact binary encodings for lists of tweet and user ids.
+
+Ids are written as unsigned LEB128 varints. Sorted lists are delta encoded
+first, which for dense lists of ids usually takes 3-5 bytes per id instead of
+the 19 or so it takes to write one out as a line of text.
+
+Long lists of ids (e.g. for hydrating) can be kept in id files, either as
+raw little-endian uint64s, which are read through mmap, or sorted, delta
+encoded and compressed, which is usually smaller still.
+
+Also here are filters for remembering which ids have already been seen.
+"""
+
+import io
+import math
+import heapq
+import mmap
+import zlib
+import struct
+import sqlite3
+import logging
+import tempfile
+
+EDGES_MAGIC = b"TWEDGES1"
+RAW_IDS_MAGIC = b"TWIDSRAW"
+DELTA_IDS_MAGIC = b"TWIDSDZ1"
+CHUNK_SIZE = 65536
+
+
+def encode_varint(n):
+    """
+    Returns the varint bytes for a non-negative integer.
+    """
+    out = bytearray()
+    while True:
+        byte = n & 0x7f
+        n >>= 7
+        if n:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def decode_varints(buf, pos=0, count=None):
+    """
+    Yields integers decoded from a buffer of varints, starting at pos and
+    stopping after count integers if it is given.
+    """
+    buf = bytearray(buf)
+    end = len(buf)
+    n = 0
+    while pos < end and (count is None or n < count):
+        value = 0
+        shift = 0
+        while True:
+            byte = buf[pos]
+            pos += 1
+            value |= (byte & 0x7f) << shift
+            if not byte & 0x80:
+                break
+            shift += 7
+        n += 1
+        yield value
+
+
+def delta_encode(ids):
+    """
+    Encodes a list of integer ids as sorted, delta encoded varints.
+    """
+    out = bytearray()
+    last = 0
+    for i in sorted(set(int(i) for i in ids)):
+        out += encode_varint(i - last)
+        last = i
+    return bytes(out)
+
+
+def delta_decode(buf):
+    """
+    Returns the sorted list of ids in a delta_encode()d buffer.
+    """
+    ids = []
+    last = 0
+    for delta in decode_varints(buf):
+        last += delta
+        ids.append(last)
+    return ids
+
+
+class EdgeWriter(object):
+    """
+    Appends adjacency lists to a binary edge file. Each record is the user
+    id, the number of ids in the list and the delta encoded list itself.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.fh = open(path, "ab")
+        if self.fh.tell() == 0:
+            self.fh.write(EDGES_MAGIC)
+
+    def write(self, user_id, ids):
+        ids = set(int(i) for i in ids)
+        encoded = delta_encode(ids)
+        self.fh.write(encode_varint(int(user_id)))
+        self.fh.write(encode_varint(len(ids)))
+        self.fh.write(encode_varint(len(encoded)))
+        self.fh.write(encoded)
+
+    def flush(self):
+        self.fh.flush()
+
+    def close(self):
+        self.fh.close()
+
+
+def read_edges(path):
+    """
+    Yields (user_id, [ids]) for each record in an edge file.
+    """
+    with open(path, "rb") as fh:
+        data = fh.read()
+    if not data.startswith(EDGES_MAGIC):
+        raise ValueError("%s isn't an edge file" % path)
+    pos = len(EDGES_MAGIC)
+    while pos < len(data):
+        user_id, pos = _read_varint(data, pos)
+        count, pos = _read_varint(data, pos)
+        length, pos = _read_varint(data, pos)
+        yield user_id, delta_decode(data[pos:pos + length])
+        pos += length
+
+
+def _read_varint(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        byte = bytearray(data[pos:pos + 1])[0]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+class IdWriter(object):
+    """
+    Writes ids to an id file. By default they are written as they come as
+    raw uint64s. With compress=True they are sorted and de-duplicated when
+    the writer is closed, and written delta encoded and compressed. So that
+    long lists don't have to fit in memory, every run_size ids are sorted
+    and spilled to a temporary file (8 bytes an id), and the runs are
+    merged when the writer is closed.
+    """
+
+    def __init__(self, path, compress=False, run_size=1000000):
+        self.path = path
+        self.compress = compress
+        self.run_size = run_size
+        self.buffer = []
+        self.runs = []
+        self.count = 0
+        self.fh = open(path, "wb")
+        self.fh.write(DELTA_IDS_MAGIC if compress else RAW_IDS_MAGIC)
+
+    def write(self, id):
+        self.buffer.append(int(id))
+        self.count += 1
+        if self.compress:
+            if len(self.buffer) == self.run_size:
+                self._spill()
+        elif len(self.buffer) == CHUNK_SIZE:
+            self._flush_raw()
+
+    def _flush_raw(self):
+        self.fh.write(struct.pack("<%dQ" % len(self.buffer), *self.buffer))
+        self.buffer = []
+
+    def _spill(self):
+        ids = sorted(set(self.buffer))
+        self.buffer = []
+        run = tempfile.TemporaryFile()
+        for i in range(0, len(ids), CHUNK_SIZE):
+            chunk = ids[i:i + CHUNK_SIZE]
+            run.write(struct.pack("<%dQ" % len(chunk), *chunk))
+        run.seek(0)
+        self.runs.append(run)
+
+    def close(self):
+        if self.compress:
+            self._spill()
+            compressor = zlib.compressobj()
+            data = bytearray()
+            last = None
+            for id in heapq.merge(*[_read_run(r) for r in self.runs]):
+                if id == last:
+                    continue
+                data += encode_varint(id - (last or 0))
+                last = id
+                if len(data) >= CHUNK_SIZE:
+                    self.fh.write(compressor.compress(bytes(data)))
+                    data = bytearray()
+            self.fh.write(compressor.compress(bytes(data)))
+            self.fh.write(compressor.flush())
+            for run in self.runs:
+                run.close()
+            self.runs = []
+        else:
+            self._flush_raw()
+        self.fh.close()
+        logging.info("wrote %s ids to %s", self.count, self.path)
+
+
+def _read_run(fh):
+    while True:
+        data = fh.read(CHUNK_SIZE * 8)
+        if not data:
+            break
+        for id in struct.unpack("<%dQ" % (len(data) // 8), data):
+            yield id
+
+
+def is_id_file(path):
+    """
+    Returns True if the file at path is an id file rather than text.
+    """
+    with open(path, "rb") as fh:
+        return fh.read(len(RAW_IDS_MAGIC)) in (RAW_IDS_MAGIC, DELTA_IDS_MAGIC)
+
+
+def read_ids(path):
+    """
+    Yields the integer ids in an id file.
+    """
+    with open(path, "rb") as fh:
+        magic = fh.read(len(RAW_IDS_MAGIC))
+        if magic == RAW_IDS_MAGIC:
+            ids = _read_raw_ids(fh)
+        elif magic == DELTA_IDS_MAGIC:
+            ids = _read_delta_ids(fh)
+        else:
+            raise ValueError("%s isn't an id file" % path)
+        for id in ids:
+            yield id
+
+
+def _read_raw_ids(fh):
+    fh.seek(0, io.SEEK_END)
+    if fh.tell() == len(RAW_IDS_MAGIC):
+        return
+    data = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        pos = len(RAW_IDS_MAGIC)
+        while pos < len(data):
+            count = min(CHUNK_SIZE, (len(data) - pos) // 8)
+            if count == 0:
+                break
+            for id in struct.unpack_from("<%dQ" % count, data, pos):
+                yield id
+            pos += count * 8
+    finally:
+        data.close()
+
+
+def _read_delta_ids(fh):
+    decompressor = zlib.decompressobj()
+    last = value = shift = 0
+    while True:
+        data = fh.read(CHUNK_SIZE)
+        if not data:
+            data = decompressor.flush()
+            if not data:
+                break
+        else:
+            data = decompressor.decompress(data)
+        # a varint can be split across chunks, so value and shift carry over
+        for byte in bytearray(data):
+            value |= (byte & 0x7f) << shift
+            if byte & 0x80:
+                shift += 7
+            else:
+                last += value
+                yield last
+                value = shift = 0
+
+
+class BloomFilter(object):
+    """
+    A fixed size Bloom filter for integer ids. It never forgets an id that
+    was added, but will wrongly claim to have seen about error_rate of the
+    ids it hasn't, as long as no more than capacity ids are added.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(-capacity * math.log(error_rate) /
+                               (math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.size / float(capacity) *
+                                       math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, n):
+        # double hashing with two rounds of splitmix64
+        h1 = _mix(n)
+        h2 = _mix(h1) | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, n):
+        """
+        Adds an id, returning False if it (probably) was already present.
+        """
+        new = False
+        for pos in self._positions(n):
+            byte, bit = pos >> 3, 1 << (pos & 7)
+            if not self.bits[byte] & bit:
+                self.bits[byte] |= bit
+                new = True
+        if new:
+            self.count += 1
+        return new
+
+    def __contains__(self, n):
+        for pos in self._positions(n):
+            if not self.bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+
+class IdFilter(object):
+    """
+    Remembers which ids have been seen. The first exact_limit ids are kept
+    in memory and after that new ids go into a temporary SQLite database on
+    disk, so no id is ever wrongly reported as already seen.
+
+    If bloom_capacity is given, ids after the first exact_limit go into a
+    Bloom filter sized for that many ids instead, which is faster and uses a
+    fixed amount of memory, but will wrongly claim to have seen about
+    error_rate of them. Those ids are logged and counted in skipped.
+    """
+
+    def __init__(self, exact_limit=1000000, bloom_capacity=None,
+                 error_rate=0.0001):
+        self.exact_limit = exact_limit
+        self.bloom_capacity = bloom_capacity
+        self.error_rate = error_rate
+        self.exact = set()
+        self.bloom = None
+        self.db = None
+        self.skipped = 0
+
+    def add(self, id):
+        """
+        Adds an id and returns True if it hadn't been seen before.
+        """
+        n = int(id)
+        if n in self.exact:
+            return False
+        if self.bloom is not None:
+            if self.bloom.add(n):
+                return True
+            self.skipped += 1
+            logging.info("skipping %s, which may not be a duplicate", n)
+            return False
+        if self.db is not None:
+            cursor = self.db.execute(
+                "INSERT OR IGNORE INTO seen VALUES (?)", (n,))
+            return cursor.rowcount == 1
+        self.exact.add(n)
+        if len(self.exact) >= self.exact_limit:
+            if self.bloom_capacity:
+                logging.info("seen %s ids, switching to a bloom filter",
+                             len(self.exact))
+                self.bloom = BloomFilter(self.bloom_capacity,
+                                         self.error_rate)
+            else:
+                logging.info("seen %s ids, keeping the rest on disk",
+                             len(self.exact))
+                # an empty name is a temporary database that SQLite
+                # deletes when it is closed
+                self.db = sqlite3.connect("", isolation_level=None,
+                                          check_same_thread=False)
+                self.db.execute("PRAGMA journal_mode = OFF")
+                self.db.execute("PRAGMA synchronous = OFF")
+                self.db.execute("CREATE TABLE seen (id INTEGER PRIMARY KEY)")
+        return True
+
+    def __contains__(self, id):
+        n = int(id)
+        if n in self.exact:
+            return True
+        if self.bloom is not None:
+            return n in self.bloom
+        if self.db is not None:
+            return self.db.execute("SELECT 1 FROM seen WHERE id = ?",
+                                   (n,)).fetchone() is not None
+        return False
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+
+def _mix(n):
+    n = (n + 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+    n = ((n ^ (n >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+    n = ((n ^ (n >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+    return n ^ (n >> 31)
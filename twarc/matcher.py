@@ -0,0 +1,217 @@
+"""
+Work out which of the rules given to the filter stream matched each tweet.
+"""
+
+import re
+
+from collections import deque
+
+word_chars = re.compile(r"\w", re.UNICODE)
+
+
+class AhoCorasick(object):
+    """
+    A minimal Aho-Corasick automaton that finds every occurrence of a set of
+    keywords in a single pass over some text.
+    """
+
+    def __init__(self, keywords):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+        self.keywords = []
+        for keyword in keywords:
+            self._add(keyword)
+        self._build()
+
+    def _add(self, keyword):
+        state = 0
+        for char in keyword:
+            if char not in self.goto[state]:
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append([])
+                self.goto[state][char] = len(self.goto) - 1
+            state = self.goto[state][char]
+        self.out[state].append(len(self.keywords))
+        self.keywords.append(keyword)
+
+    def _build(self):
+        todo = deque(self.goto[0].values())
+        while todo:
+            state = todo.popleft()
+            for char, next_state in self.goto[state].items():
+                todo.append(next_state)
+                f = self.fail[state]
+                while f and char not in self.goto[f]:
+                    f = self.fail[f]
+                f = self.goto[f].get(char, 0)
+                self.fail[next_state] = f if f != next_state else 0
+                self.out[next_state] = self.out[next_state] + self.out[f]
+
+    def search(self, text):
+        """
+        Yields (end_position, keyword_index) for every keyword found in text.
+        end_position is the index of the last character of the keyword.
+        """
+        goto, fail, out = self.goto, self.fail, self.out
+        state = 0
+        for pos, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for keyword_index in out[state]:
+                yield pos, keyword_index
+
+
+class RuleMatcher(object):
+    """
+    Compiles the track, follow and locations parameters given to
+    Twarc.filter once so that each tweet from the stream can be annotated
+    with the rules it matched.
+
+    Like the streaming API, a track phrase matches when all of its space
+    separated words appear as whole words in the tweet text, URLs, mentions
+    or hashtags, ignoring case.
+    """
+
+    def __init__(self, track=None, follow=None, locations=None):
+        self.phrases = []
+        words = {}
+        self.word_phrases = []
+        for phrase in split_param(track):
+            phrase_words = set(phrase.lower().split())
+            if not phrase_words:
+                continue
+            for word in phrase_words:
+                if word not in words:
+                    words[word] = len(words)
+                    self.word_phrases.append([])
+                self.word_phrases[words[word]].append(len(self.phrases))
+            self.phrases.append((phrase, len(phrase_words)))
+        self.automaton = AhoCorasick(sorted(words, key=words.get))
+
+        self.follow = set(split_param(follow))
+
+        self.locations = []
+        coords = [float(c) for c in split_param(locations)]
+        for i in range(0, len(coords) - 3, 4):
+            self.locations.append(tuple(coords[i:i + 4]))
+
+    def match(self, tweet):
+        """
+        Returns the list of rules that match the tweet. Track phrases are
+        returned as they were given, follows as follow:<user_id> and
+        locations as locations:<sw_lon,sw_lat,ne_lon,ne_lat>.
+        """
+        rules = []
+        if self.phrases:
+            text = tweet_text(tweet)
+            found = set()
+            for pos, word_index in self.automaton.search(text):
+                if word_index in found:
+                    continue
+                start = pos - len(self.automaton.keywords[word_index])
+                end = pos + 1
+                if start >= 0 and word_chars.match(text[start]):
+                    continue
+                if end < len(text) and word_chars.match(text[end]):
+                    continue
+                found.add(word_index)
+
+            counts = {}
+            for word_index in found:
+                for phrase_index in self.word_phrases[word_index]:
+                    counts[phrase_index] = counts.get(phrase_index, 0) + 1
+            for phrase_index in sorted(counts):
+                phrase, needed = self.phrases[phrase_index]
+                if counts[phrase_index] == needed:
+                    rules.append(phrase)
+
+        if self.follow:
+            for user_id in tweet_user_ids(tweet):
+                if user_id in self.follow:
+                    rules.append("follow:%s" % user_id)
+
+        if self.locations:
+            for box in self.locations:
+                if in_box(tweet, box):
+                    rules.append("locations:%s" % ",".join(
+                        "%g" % c for c in box))
+
+        return rules
+
+    def annotate(self, things):
+        """
+        Adds a matching_rules list to each tweet in an iterator, passing
+        through stream messages such as limit notices untouched.
+        """
+        for thing in things:
+            if "id_str" in thing:
+                thing["matching_rules"] = self.match(thing)
+            yield thing
+
+
+def split_param(value):
+    if not value:
+        return []
+    if not isinstance(value, (list, tuple)):
+        value = value.replace("\\", "").split(",")
+    return [v.strip() for v in value if v.strip()]
+
+
+def tweet_text(tweet):
+    """
+    Gathers the lowercased text the streaming API matches track phrases
+    against, including retweeted and quoted tweets.
+    """
+    parts = []
+    for t in (tweet, tweet.get("retweeted_status"),
+              tweet.get("quoted_status")):
+        if not t:
+            continue
+        extended = t.get("extended_tweet", {})
+        parts.append(extended.get("full_text") or t.get("full_text") or
+                     t.get("text") or "")
+        entities = extended.get("entities") or t.get("entities") or {}
+        for url in entities.get("urls", []):
+            parts.append(url.get("expanded_url") or "")
+            parts.append(url.get("display_url") or "")
+        for mention in entities.get("user_mentions", []):
+            parts.append(mention.get("screen_name", ""))
+        for hashtag in entities.get("hashtags", []):
+            parts.append(hashtag.get("text", ""))
+    return "\n".join(parts).lower()
+
+
+def tweet_user_ids(tweet):
+    """
+    The users a follow rule can match: the author, the author of a
+    retweeted tweet and the user being replied to.
+    """
+    ids = [tweet.get("user", {}).get("id_str")]
+    if tweet.get("retweeted_status"):
+        ids.append(tweet["retweeted_status"].get("user", {}).get("id_str"))
+    ids.append(tweet.get("in_reply_to_user_id_str"))
+    seen = []
+    for user_id in ids:
+        if user_id and user_id not in seen:
+            seen.append(user_id)
+    return seen
+
+
+def in_box(tweet, box):
+    sw_lon, sw_lat, ne_lon, ne_lat = box
+    coords = (tweet.get("coordinates") or {}).get("coordinates")
+    if coords:
+        lon, lat = coords
+        return sw_lon <= lon <= ne_lon and sw_lat <= lat <= ne_lat
+
+    bbox = ((tweet.get("place") or {}).get("bounding_box") or {})
+    points = (bbox.get("coordinates") or [[]])[0]
+    if not points:
+        return False
+    lons = [p[0] for p in points]
+    lats = [p[1] for p in points]
+    return (min(lons) <= ne_lon and max(lons) >= sw_lon and
+            min(lats) <= ne_lat and max(lats) >= sw_lat)
@@ -0,0 +1,228 @@
+"""
+Run many small searches with fewer API calls by packing them together.
+
+Most of a long list of low volume queries find nothing on any given run,
+yet each one costs at least one search call. Simple keyword queries can be
+combined with OR into packed queries of up to the search length limit, so
+one call covers dozens of them. Tweets that come back are attributed to the
+queries they match with a RuleMatcher, and packs that get busy are split
+in two so that they don't page through more tweets than they need to.
+"""
+
+import re
+import json
+import logging
+import threading
+
+try:
+    from urllib.parse import quote  # Python 3
+except ImportError:
+    from urllib import quote  # Python 2
+
+from twarc.ids import IdFilter
+from twarc.matcher import RuleMatcher
+from twarc.scheduler import Scheduler
+
+# the search API counts the length of the URL encoded query
+MAX_LENGTH = 500
+
+# anything with an operator in it is searched for on its own
+operator_pat = re.compile(r'(^|\s)-|\bOR\b|[():]')
+
+
+def packable(query):
+    return not operator_pat.search(query) and query.count('"') % 2 == 0
+
+
+def phrase(query):
+    """
+    Returns the words of a packable query the way the matcher wants them.
+    """
+    return " ".join(query.replace('"', ' ').lower().split())
+
+
+def pack_query(queries):
+    """
+    ORs queries together, putting the ones with more than one word in
+    parentheses since OR binds more tightly than AND.
+    """
+    parts = []
+    for q in queries:
+        parts.append("(%s)" % q if len(q.split()) > 1 else q)
+    return " OR ".join(parts)
+
+
+def encoded_length(query):
+    """
+    Returns the length of a query once it is URL encoded, which is what
+    counts against the limit: every space, quote and # takes 3 characters,
+    and non-ASCII characters take 3 for each of their UTF-8 bytes.
+    """
+    return len(quote(query.encode("utf8"), safe=""))
+
+
+def pack(queries, max_length=MAX_LENGTH):
+    """
+    Greedily groups queries into lists whose packed query fits in
+    max_length characters when it is URL encoded.
+    """
+    packs = []
+    current = []
+    for q in queries:
+        if current and \
+                encoded_length(pack_query(current + [q])) > max_length:
+            packs.append(current)
+            current = []
+        current.append(q)
+    if current:
+        packs.append(current)
+    return packs
+
+
+class QueryPacker(object):
+    """
+    Keeps a list of queries packed together, along with the newest tweet id
+    seen for each query so that every run only asks for new tweets. A pack
+    that finds split_at or more tweets in a run is split in two for the
+    next one.
+    """
+
+    def __init__(self, queries, max_length=MAX_LENGTH, split_at=1000):
+        self.max_length = max_length
+        self.split_at = split_at
+        self.queries = []
+        for q in queries:
+            q = q.strip()
+            if q and q not in self.queries:
+                self.queries.append(q)
+        self.since_ids = {}
+        simple = [q for q in self.queries if packable(q)]
+        self.packs = pack(simple, max_length)
+        self.packs.extend([q] for q in self.queries if not packable(q))
+
+        self.phrase_queries = {}
+        for q in simple:
+            self.phrase_queries.setdefault(phrase(q), []).append(q)
+        self.matcher = RuleMatcher(track=list(self.phrase_queries))
+
+    def since_id(self, pack):
+        """
+        Returns the since_id to search a pack from: the oldest of its
+        queries' since_ids, or None if one of them hasn't been run yet.
+        """
+        since_ids = [self.since_ids.get(q) for q in pack]
+        if None in since_ids:
+            return None
+        return str(min(int(i) for i in since_ids))
+
+    def attribute(self, tweet, pack):
+        """
+        Returns the queries a tweet found by searching a pack matches. If
+        the matcher can't tell (search matches more loosely than it does)
+        the tweet is put down to every query in the pack.
+        """
+        if len(pack) == 1:
+            return list(pack)
+        matched = []
+        for rule in self.matcher.match(tweet):
+            matched.extend(self.phrase_queries.get(rule, []))
+        return matched or list(pack)
+
+    def update(self, pack, newest, count):
+        """
+        Records the newest tweet id found for a pack and splits the pack if
+        it found split_at tweets or more.
+        """
+        if newest:
+            for q in pack:
+                if not self.since_ids.get(q) or \
+                        int(newest) > int(self.since_ids[q]):
+                    self.since_ids[q] = newest
+        if count >= self.split_at and len(pack) > 1 and pack in self.packs:
+            logging.info("splitting busy pack of %s queries", len(pack))
+            i = self.packs.index(pack)
+            half = len(pack) // 2
+            self.packs[i:i + 1] = [pack[:half], pack[half:]]
+
+    def save(self, path):
+        with open(path, "w") as fh:
+            json.dump({"packs": self.packs, "since_ids": self.since_ids}, fh)
+
+    def load(self, path):
+        """
+        Picks up the packs and since_ids saved by an earlier run, for the
+        queries that are still in the list.
+        """
+        with open(path) as fh:
+            state = json.load(fh)
+        queries = set(self.queries)
+        self.since_ids = dict((q, i) for q, i in state["since_ids"].items()
+                              if q in queries)
+        packs = [[q for q in p if q in queries] for p in state["packs"]]
+        packs = [p for p in packs if p]
+        packed = set(q for p in packs for q in p)
+        new = [q for q in self.queries if q not in packed]
+        packs.extend(pack([q for q in new if packable(q)], self.max_length))
+        packs.extend([q] for q in new if not packable(q))
+        self.packs = packs
+
+
+def search_packed(packer, pool, write, workers=4, search_args=None,
+                  **twarc_args):
+    """
+    Runs every pack concurrently, passing each new tweet to write() once
+    with the queries it matched in matching_queries. Returns the number of
+    tweets found and a list of the queries in packs whose search failed,
+    which keep their since_ids so the next run tries them again.
+    """
+    scheduler = Scheduler(pool, workers=workers, **twarc_args)
+    seen = IdFilter()
+    lock = threading.Lock()
+    results = []
+
+    def make_func(pack):
+        since_id = packer.since_id(pack)
+
+        def func(t):
+            newest = None
+            count = 0
+            for tweet in t.search(pack_query(pack), since_id=since_id,
+                                  **(search_args or {})):
+                if not newest or int(tweet['id_str']) > int(newest):
+                    newest = tweet['id_str']
+                count += 1
+                yield tweet
+            with lock:
+                results.append((pack, newest, count))
+        return func
+
+    def make_callback(pack):
+        def callback(job, tweet):
+            with lock:
+                if seen.add(tweet['id_str']):
+                    tweet['matching_queries'] = packer.attribute(tweet, pack)
+                    write(tweet)
+        return callback
+
+    logging.info("searching for %s queries in %s packs",
+                 len(packer.queries), len(packer.packs))
+    jobs = []
+    for p in list(packer.packs):
+        jobs.append((p, scheduler.submit(make_func(p), name=pack_query(p)[:50],
+                                         callback=make_callback(p))))
+    scheduler.join()
+    scheduler.shutdown()
+    seen.close()
+
+    total = 0
+    for p, newest, count in results:
+        packer.update(p, newest, count)
+        total += count
+
+    failed = []
+    for p, job in jobs:
+        if job.status == "error":
+            logging.error("search for %s failed: %s", pack_query(p),
+                          job.error)
+            failed.extend(p)
+    return total, failed
@@ -0,0 +1,95 @@
+"""
+Chain two API calls together so that the second can start on the results of
+the first while the first is still running.
+"""
+
+import logging
+import threading
+
+try:
+    import queue  # Python 3
+except ImportError:
+    import Queue as queue  # Python 2
+
+from twarc.client import Twarc
+
+_done = object()
+
+
+def pipe(source, queue_size=10000):
+    """
+    Runs the source iterator on its own thread and returns an iterator over
+    what it produces. Exceptions raised by the source are raised again in
+    the consumer.
+    """
+    q = queue.Queue(maxsize=queue_size)
+    errors = []
+
+    def produce():
+        try:
+            for item in source:
+                q.put(item)
+        except Exception as e:
+            logging.exception("pipeline source failed")
+            errors.append(e)
+        finally:
+            q.put(_done)
+
+    thread = threading.Thread(target=produce)
+    thread.daemon = True
+    thread.start()
+
+    while True:
+        item = q.get()
+        if item is _done:
+            break
+        yield item
+    if errors:
+        raise errors[0]
+
+
+def unique_authors(tweets):
+    """
+    Yields the user id of each new author in an iterator of tweets.
+    """
+    seen = set()
+    for tweet in tweets:
+        user_id = tweet['user']['id_str']
+        if user_id not in seen:
+            seen.add(user_id)
+            yield user_id
+
+
+def lookup_users(source, pool, **twarc_args):
+    """
+    Looks up the users whose ids are produced by source(t), where t is a
+    Twarc instance for the first stage. Users are looked up 100 at a time
+    as soon as enough ids have arrived. Both stages share the token pool.
+    """
+    producer = Twarc(pool=pool, **twarc_args)
+    consumer = Twarc(pool=pool, **twarc_args)
+    return consumer.user_lookup(iterator=pipe(source(producer)))
+
+
+def follower_users(user, pool, **twarc_args):
+    """
+    Returns an iterator of the user objects of a user's followers.
+    """
+    return lookup_users(lambda t: t.follower_ids(user), pool, **twarc_args)
+
+
+def friend_users(user, pool, **twarc_args):
+    """
+    Returns an iterator of the user objects of a user's friends.
+    """
+    return lookup_users(lambda t: t.friend_ids(user), pool, **twarc_args)
+
+
+def search_users(q, pool, search_args=None, **twarc_args):
+    """
+    Returns an iterator of the current user objects for the authors of
+    tweets matching a search, each looked up once.
+    """
+    search_args = search_args or {}
+    return lookup_users(lambda t: unique_authors(t.search(q, **search_args)),
+                        pool, **twarc_args)
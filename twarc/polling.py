@@ -0,0 +1,260 @@
+"""
+Poll many searches on a schedule, archiving only the new tweets each time.
+
+The newest tweet id seen for every query is kept in a small SQLite store,
+so each poll only asks for tweets since then. The due queries are run
+together on a Scheduler that shares the token pool, and each query's tweets
+are written to its own directory of numbered, gzipped files in the same
+layout as utils/twarc-archive.py.
+
+Directories are guarded with fcntl advisory locks, which the operating
+system drops when the process holding them dies, so a crash never leaves a
+stale lock behind.
+"""
+
+import os
+import re
+import gzip
+import json
+import time
+import codecs
+import hashlib
+import sqlite3
+import logging
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows
+
+from twarc.scheduler import Scheduler
+
+archive_file_fmt = "tweets-%04i.jsonl.gz"
+archive_file_pat = re.compile(r"^tweets-(\d+)\.jsonl\.gz$")
+
+
+class Locked(Exception):
+    pass
+
+
+def lock(path):
+    """
+    Takes an exclusive advisory lock on the file at path and returns the
+    open file, which holds the lock until it is closed or the process
+    exits. Raises Locked if another process has it.
+    """
+    fh = open(path, "a")
+    if fcntl is None:
+        logging.warn("no fcntl, so %s isn't locked", path)
+        return fh
+    try:
+        fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except (IOError, OSError):
+        fh.close()
+        raise Locked("%s is locked by another process" % path)
+    return fh
+
+
+class QueryStore(object):
+    """
+    The queries being polled, each with how often to poll it, when it is
+    next due, the newest tweet id found and how many tweets the last poll
+    found.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS queries (
+                query TEXT PRIMARY KEY,
+                since_id TEXT,
+                interval INTEGER,
+                next_run REAL,
+                last_run REAL,
+                last_count INTEGER
+            )
+            """
+        )
+        self.db.commit()
+
+    def add(self, query, interval):
+        """
+        Adds a query, due straight away, or changes the interval of one
+        that is already there.
+        """
+        with self.lock:
+            self.db.execute(
+                "INSERT OR IGNORE INTO queries VALUES (?, NULL, ?, 0, NULL, "
+                "NULL)", (query, interval))
+            self.db.execute("UPDATE queries SET interval = ? WHERE query = ?",
+                            (interval, query))
+            self.db.commit()
+
+    def remove(self, query):
+        with self.lock:
+            self.db.execute("DELETE FROM queries WHERE query = ?", (query,))
+            self.db.commit()
+
+    def get(self, query):
+        """
+        Returns (since_id, interval, next_run, last_run, last_count) for a
+        query, or None if it isn't in the store.
+        """
+        with self.lock:
+            return self.db.execute(
+                "SELECT since_id, interval, next_run, last_run, last_count "
+                "FROM queries WHERE query = ?", (query,)).fetchone()
+
+    def queries(self):
+        with self.lock:
+            return [r[0] for r in self.db.execute("SELECT query FROM queries")]
+
+    def due(self, now=None):
+        """
+        Returns (query, since_id) for the queries that are due, most
+        overdue first.
+        """
+        now = now or time.time()
+        with self.lock:
+            return self.db.execute(
+                "SELECT query, since_id FROM queries WHERE next_run <= ? "
+                "ORDER BY next_run", (now,)).fetchall()
+
+    def next_due(self):
+        with self.lock:
+            return self.db.execute(
+                "SELECT MIN(next_run) FROM queries").fetchone()[0]
+
+    def update(self, query, since_id, count, now=None):
+        now = now or time.time()
+        with self.lock:
+            self.db.execute(
+                "UPDATE queries SET since_id = COALESCE(?, since_id), "
+                "last_run = ?, next_run = ? + interval, last_count = ? "
+                "WHERE query = ?", (since_id, now, now, count, query))
+            self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+def query_dir(directory, query):
+    """
+    Returns the archive directory for a query. Queries that aren't safe to
+    use as a name get a hash on the end so that they can't collide.
+    """
+    name = re.sub(r"[^\w.-]+", "_", query).strip("_")[:100]
+    if name != query:
+        digest = hashlib.md5(query.encode("utf8")).hexdigest()[:8]
+        name = "%s-%s" % (name, digest)
+    return os.path.join(directory, name)
+
+
+def next_archive(path):
+    """
+    Returns the path of the next numbered archive file in a directory.
+    """
+    count = 0
+    for filename in os.listdir(path):
+        m = archive_file_pat.match(filename)
+        if m:
+            count = max(count, int(m.group(1)))
+    return os.path.join(path, archive_file_fmt % (count + 1))
+
+
+class Poller(object):
+    """
+    Runs the due queries in a QueryStore, writing their tweets under
+    directory. Only one Poller can use a directory at a time.
+    """
+
+    def __init__(self, store, directory, pool, workers=4, **twarc_args):
+        self.store = store
+        self.directory = directory
+        self.pool = pool
+        self.workers = workers
+        self.twarc_args = twarc_args
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.lock = lock(os.path.join(directory, "poll.lock"))
+
+    def poll(self, now=None):
+        """
+        Runs every query that is due and returns how many there were.
+        """
+        due = self.store.due(now)
+        if not due:
+            return 0
+        logging.info("polling %s queries", len(due))
+        scheduler = Scheduler(self.pool, workers=self.workers,
+                              **self.twarc_args)
+        jobs = []
+        for query, since_id in due:
+            jobs.append(scheduler.submit(self._make_func(query, since_id),
+                                         name=query))
+        scheduler.join()
+        scheduler.shutdown()
+        for job in jobs:
+            # try again next time round rather than straight away
+            if job.status == "error":
+                self.store.update(job.name, None, 0)
+        return len(due)
+
+    def run(self, event=None, reload=None):
+        """
+        Polls until the event is set, sleeping until the next query is due.
+        If reload is given it is called before each poll, e.g. to add new
+        queries to the store.
+        """
+        while not (event and event.is_set()):
+            if reload:
+                reload()
+            self.poll()
+            next_run = self.store.next_due()
+            wait = max(1, (next_run or time.time() + 60) - time.time())
+            logging.info("sleeping %.0f seconds until the next poll", wait)
+            if event:
+                event.wait(wait)
+            else:
+                time.sleep(wait)
+
+    def close(self):
+        self.lock.close()
+
+    def _make_func(self, query, since_id):
+        def func(t):
+            path = query_dir(self.directory, query)
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            try:
+                dir_lock = lock(os.path.join(path, "lockfile"))
+            except Locked:
+                logging.warn("skipping %s, its archive is in use", query)
+                self.store.update(query, None, 0)
+                return
+            newest = None
+            count = 0
+            fh = None
+            try:
+                for tweet in t.search(query, since_id=since_id):
+                    # only create a file if there are new tweets
+                    if not fh:
+                        fh = gzip.open(next_archive(path), "wb")
+                        writer = codecs.getwriter("utf8")(fh)
+                    if not newest or int(tweet['id_str']) > int(newest):
+                        newest = tweet['id_str']
+                    writer.write(json.dumps(tweet) + "\n")
+                    count += 1
+                    yield tweet
+            finally:
+                if fh:
+                    fh.close()
+                dir_lock.close()
+            self.store.update(query, newest, count)
+            logging.info("found %s new tweets for %s", count, query)
+        return func
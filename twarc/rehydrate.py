@@ -0,0 +1,121 @@
+"""
+Rehydrate an archive of tweets and report what has changed since.
+
+The archive is read a line at a time and hydrated 100 tweets at a time, so
+each batch of stored tweets is joined with the current ones on their id and
+then forgotten. Only the differences are written out.
+"""
+
+import json
+import logging
+
+from twarc.ids import IdFilter
+
+CHANGED = "changed"
+UNAVAILABLE = "unavailable"
+
+# fields that are compared, with dots for nested ones
+count_fields = [
+    "retweet_count",
+    "favorite_count",
+    "reply_count",
+    "quote_count",
+]
+
+tweet_fields = [
+    "possibly_sensitive",
+    "withheld_in_countries",
+]
+
+user_fields = [
+    "user.screen_name",
+    "user.name",
+    "user.description",
+    "user.location",
+    "user.url",
+    "user.protected",
+    "user.verified",
+    "user.followers_count",
+    "user.friends_count",
+    "user.statuses_count",
+]
+
+
+def get_field(tweet, field):
+    value = tweet
+    for key in field.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def tweet_text(tweet):
+    return tweet.get("full_text") or tweet.get("text")
+
+
+def diff_tweets(old, new):
+    """
+    Returns a dictionary of the fields that differ between two copies of a
+    tweet, each mapped to its [old, new] values. Fields that are missing
+    from either copy (e.g. a trimmed user) aren't compared.
+    """
+    delta = {}
+    for field in count_fields + tweet_fields + user_fields:
+        old_value = get_field(old, field)
+        new_value = get_field(new, field)
+        if old_value is None or new_value is None:
+            continue
+        if old_value != new_value:
+            delta[field] = [old_value, new_value]
+    old_text = tweet_text(old)
+    new_text = tweet_text(new)
+    if old_text and new_text and old_text != new_text:
+        delta["text"] = [old_text, new_text]
+    return delta
+
+
+def rehydrate(t, lines):
+    """
+    Hydrates the tweets in an iterator of JSON lines with Twarc instance t
+    and yields a change record for each tweet that has changed or is no
+    longer available. Tweets that appear more than once in the archive are
+    only compared once.
+    """
+    seen = IdFilter()
+    batch = {}
+    try:
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                tweet = json.loads(line)
+            except ValueError as e:
+                logging.error("skipping line that isn't JSON: %s", e)
+                continue
+            tweet_id = tweet.get("id_str")
+            if not tweet_id or not seen.add(tweet_id):
+                continue
+            batch[tweet_id] = tweet
+            if len(batch) == 100:
+                for change in _compare(t, batch):
+                    yield change
+                batch = {}
+        if batch:
+            for change in _compare(t, batch):
+                yield change
+    finally:
+        seen.close()
+
+
+def _compare(t, batch):
+    # a cached copy could be as old as the archive, so it has to be fetched
+    for tweet_id, new in t.lookup(list(batch), dedupe=False, cache=False):
+        old = batch[tweet_id]
+        if new is None:
+            yield {"id_str": tweet_id, "change": UNAVAILABLE}
+            continue
+        delta = diff_tweets(old, new)
+        if delta:
+            yield {"id_str": tweet_id, "change": CHANGED, "delta": delta}
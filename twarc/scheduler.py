@@ -0,0 +1,326 @@
+"""
+Share the rate limits of a set of API tokens between many jobs.
+
+A TokenPool keeps track of when each token can next be used for each API
+resource. Every request made by a Twarc instance asks the pool for a token
+first, so several instances (usually one per thread) can share the same
+credentials without tripping over each other's rate limits.
+
+The Scheduler runs jobs on worker threads against a shared pool. Since a
+token is requested for every page of results, a high priority job that
+starts while a bulk job is running gets the next available call, and jobs
+of the same priority share calls in proportion to their weight.
+"""
+
+import re
+import time
+import heapq
+import logging
+import threading
+
+try:
+    import queue  # Python 3
+except ImportError:
+    import Queue as queue  # Python 2
+
+# rate limit windows are 15 minutes long
+WINDOW = 15 * 60
+
+BULK = -10
+NORMAL = 0
+INTERACTIVE = 10
+
+
+class TokenPool(object):
+    """
+    A thread safe view of the rate limits for a list of token indexes. If
+    reserve is set, that many calls per resource and window are held back
+    for jobs with a priority above NORMAL.
+    """
+
+    def __init__(self, tokens, reserve=0):
+        self.tokens = [int(t) for t in tokens]
+        self.reserve = reserve
+        self.condition = threading.Condition()
+        # resource -> heap of the jobs waiting for a token for it
+        self.waiting = {}
+        self.counter = 0
+        # (token, resource) -> [remaining calls, reset time, unavailable until]
+        self.limits = {}
+
+    def acquire(self, resource=None, job=None):
+        """
+        Blocks until a token can be used for the resource and returns its
+        index. Jobs waiting for the same resource are served highest
+        priority first and, within a priority, by how many calls they've had
+        relative to their weight. Each resource has its own queue, so a job
+        waiting for one that has run out doesn't hold up the others.
+        """
+        job = job or default_job
+        with self.condition:
+            self.counter += 1
+            entry = (-job.priority, job.virtual_time, self.counter, job)
+            waiting = self.waiting.setdefault(resource, [])
+            heapq.heappush(waiting, entry)
+            try:
+                while True:
+                    if waiting[0] is entry:
+                        token, wait = self._take(resource, job)
+                        if token is not None:
+                            job.virtual_time += 1.0 / job.weight
+                            return token
+                    else:
+                        wait = None
+                    if wait and wait > 5:
+                        logging.warn("no tokens available for %s: sleeping "
+                                     "up to %s secs", resource, int(wait))
+                    self.condition.wait(wait)
+            finally:
+                waiting.remove(entry)
+                heapq.heapify(waiting)
+                if not waiting:
+                    del self.waiting[resource]
+                self.condition.notify_all()
+
+    def update(self, token, resource, resp):
+        """
+        Records the rate limit headers that came back with a response.
+        """
+        headers = getattr(resp, "headers", None) or {}
+        now = time.time()
+        with self.condition:
+            limit = self._limit(token, resource)
+            if "x-rate-limit-reset" in headers:
+                limit[1] = int(headers["x-rate-limit-reset"])
+            if "x-rate-limit-remaining" in headers:
+                limit[0] = int(headers["x-rate-limit-remaining"])
+            if getattr(resp, "status_code", None) == 429:
+                limit[0] = 0
+                if limit[1] <= now:
+                    limit[1] = now + WINDOW
+                limit[2] = limit[1]
+                logging.warn("token %s is rate limited for %s until %s",
+                             token, resource, limit[1])
+            self.condition.notify_all()
+
+    def remaining(self, resource=None):
+        """
+        Returns the total number of calls known to be left for a resource,
+        or None if no limits have been seen for it yet.
+        """
+        total = None
+        now = time.time()
+        with self.condition:
+            for token in self.tokens:
+                limit = self.limits.get((token, resource))
+                if limit is None or limit[0] is None or limit[1] <= now:
+                    return None
+                total = (total or 0) + limit[0]
+        return total
+
+    def _limit(self, token, resource):
+        key = (token, resource)
+        if key not in self.limits:
+            self.limits[key] = [None, 0, 0]
+        return self.limits[key]
+
+    def _take(self, resource, job):
+        now = time.time()
+        reserve = self.reserve if job.priority <= NORMAL else 0
+        best = None
+        wait = None
+        for token in self.tokens:
+            limit = self._limit(token, resource)
+            if limit[1] and limit[1] <= now:
+                # the window has reset
+                limit[0] = None
+                limit[1] = 0
+            if limit[2] > now:
+                until = limit[2]
+            elif limit[0] is not None and limit[0] <= reserve:
+                until = limit[1] or now + WINDOW
+            else:
+                left = limit[0] if limit[0] is not None else float("inf")
+                if best is None or left > best[0]:
+                    best = (left, token)
+                continue
+            wait = until - now if wait is None else min(wait, until - now)
+
+        if best is None:
+            # a little extra so the window has really reset
+            return None, wait + 1
+        limit = self._limit(best[1], resource)
+        if limit[0] is not None:
+            limit[0] -= 1
+        return best[1], None
+
+
+class Job(object):
+    """
+    A unit of work for the Scheduler. func is called with a Twarc instance
+    and should return an iterator. Each item it yields is passed to
+    callback(job, item) if one was given.
+    """
+
+    def __init__(self, func, priority=NORMAL, weight=1, name=None,
+                 callback=None):
+        self.func = func
+        self.priority = priority
+        self.weight = weight
+        self.name = name
+        self.callback = callback
+        self.virtual_time = 0.0
+        self.status = "pending"
+        self.count = 0
+        self.error = None
+        self.started = None
+        self.finished = None
+        self.done = threading.Event()
+
+    def wait(self, timeout=None):
+        self.done.wait(timeout)
+        return self.status
+
+    def __repr__(self):
+        return "<Job %s %s priority=%s count=%s>" % (
+            self.name, self.status, self.priority, self.count)
+
+
+default_job = Job(None)
+
+
+class Scheduler(object):
+    """
+    Runs jobs on a set of worker threads that share one TokenPool. Each
+    worker has its own Twarc instance which is reused from job to job, and
+    they all share one transport, so there is one HTTP session and
+    connection pool per token. Unless a transport is passed in with the
+    Twarc arguments, the scheduler opens one with a connection for each
+    worker, and closes it when it is shut down. Jobs start in priority
+    order, and if every worker is busy a job with a higher priority than
+    all the running ones gets a thread of its own rather than waiting
+    behind them.
+    """
+
+    def __init__(self, pool, workers=4, **twarc_args):
+        from .client import default_transport
+        self.pool = pool
+        self.workers = workers
+        self.twarc_args = twarc_args
+        self.own_transport = not twarc_args.get("transport")
+        if self.own_transport:
+            twarc_args["transport"] = default_transport(max(10, workers))
+        self.pending = queue.PriorityQueue()
+        self.running = []
+        self.jobs = []
+        self.lock = threading.Lock()
+        self.counter = 0
+        self.threads = []
+        for i in range(workers):
+            self._start_thread()
+
+    def submit(self, func, priority=NORMAL, weight=1, name=None,
+               callback=None):
+        job = Job(func, priority, weight, name, callback)
+        with self.lock:
+            self.jobs.append(job)
+            self.counter += 1
+            busy = len(self.running) >= self.workers
+            jump = busy and all(j.priority < priority for j in self.running)
+        if jump:
+            logging.info("starting %s on its own thread", job)
+            thread = threading.Thread(target=self._run, args=(job,))
+            thread.daemon = True
+            thread.start()
+        else:
+            self.pending.put((-priority, self.counter, job))
+        return job
+
+    def join(self):
+        """
+        Waits for every job submitted so far to finish, along with any jobs
+        that they submit while they are running.
+        """
+        i = 0
+        while i < len(self.jobs):
+            self.jobs[i].wait()
+            i += 1
+
+    def shutdown(self):
+        for thread in self.threads:
+            self.pending.put((float("inf"), 0, None))
+        for thread in self.threads:
+            thread.join()
+        if self.own_transport:
+            self.twarc_args["transport"].close()
+
+    def twarc(self):
+        from .client import Twarc
+        return Twarc(pool=self.pool, **self.twarc_args)
+
+    def _start_thread(self):
+        thread = threading.Thread(target=self._work)
+        thread.daemon = True
+        thread.start()
+        self.threads.append(thread)
+
+    def _work(self):
+        t = self.twarc()
+        while True:
+            priority, counter, job = self.pending.get()
+            if job is None:
+                break
+            self._run(job, t)
+
+    def _run(self, job, t=None):
+        t = t or self.twarc()
+        t.job = job
+        with self.lock:
+            self.running.append(job)
+        job.status = "running"
+        job.started = time.time()
+        logging.info("starting %s", job)
+        try:
+            for item in job.func(t):
+                job.count += 1
+                if job.callback:
+                    job.callback(job, item)
+            job.status = "done"
+        except Exception as e:
+            logging.exception("%s failed", job)
+            job.error = e
+            job.status = "error"
+        finally:
+            t.job = None
+            job.finished = time.time()
+            with self.lock:
+                self.running.remove(job)
+            logging.info("finished %s", job)
+            job.done.set()
+
+
+def resource(url):
+    """
+    Returns the rate limited resource for an API URL, e.g.
+    https://api.twitter.com/1.1/search/tweets.json -> /search/tweets
+    """
+    m = re.match(r"https?://[^/]+/1\.1(/.+?)(\.json)?$", url or "")
+    if not m:
+        return url
+    path = m.group(1)
+    # statuses/retweets/:id and friends are limited per endpoint
+    return re.sub(r"/\d+$", "/:id", path)
+
+
+def parse_tokens(tokens):
+    """
+    Turns a token specification like "0-3,7" into a list of indexes.
+    """
+    indexes = []
+    for part in str(tokens).split(","):
+        if "-" in part:
+            start, end = part.split("-", 1)
+            indexes.extend(range(int(start), int(end) + 1))
+        elif part.strip():
+            indexes.append(int(part))
+    return indexes
@@ -0,0 +1,121 @@
+"""
+Keep dated snapshots of follower and friend id lists and work out who
+followed and unfollowed between any two of them.
+"""
+
+import os
+import re
+import zlib
+import time
+import logging
+
+from twarc.ids import delta_encode, delta_decode
+
+SNAPSHOT_MAGIC = b"TWSNAP1\n"
+# older snapshots were named to the second
+snapshot_pat = re.compile(r"^(\d{8}T\d{6}(\.\d{6})?Z)\.ids$")
+
+
+class SnapshotStore(object):
+    """
+    Stores each snapshot as a sorted, delta encoded and compressed list of
+    ids in directory/<user>/<relation>/<timestamp>.ids. Timestamps are UTC
+    to the microsecond and look like 20180102T030405.123456Z, so several
+    snapshots can be taken in the same second.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def save(self, user, relation, ids, timestamp=None):
+        """
+        Saves a list of ids and returns the snapshot's timestamp.
+        """
+        if not timestamp:
+            now = int(time.time() * 1000000)
+            timestamp = format_timestamp(now)
+            # never replace an earlier snapshot, however close together
+            while os.path.exists(self._path(user, relation, timestamp)):
+                now += 1
+                timestamp = format_timestamp(now)
+        path = self._path(user, relation, timestamp)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        data = zlib.compress(delta_encode(ids))
+        with open(path + ".tmp", "wb") as fh:
+            fh.write(SNAPSHOT_MAGIC)
+            fh.write(data)
+        os.rename(path + ".tmp", path)
+        logging.info("saved %s %s for %s to %s", len(ids), relation, user,
+                     path)
+        return timestamp
+
+    def load(self, user, relation, timestamp):
+        """
+        Returns the sorted list of ids in a snapshot.
+        """
+        with open(self._path(user, relation, timestamp), "rb") as fh:
+            data = fh.read()
+        if not data.startswith(SNAPSHOT_MAGIC):
+            raise ValueError("%s %s %s isn't a snapshot" %
+                             (user, relation, timestamp))
+        return delta_decode(zlib.decompress(data[len(SNAPSHOT_MAGIC):]))
+
+    def timestamps(self, user, relation):
+        """
+        Returns the timestamps of the snapshots for a user, oldest first.
+        """
+        path = os.path.join(self.directory, str(user), relation)
+        if not os.path.isdir(path):
+            return []
+        found = []
+        for filename in os.listdir(path):
+            m = snapshot_pat.match(filename)
+            if m:
+                found.append(m.group(1))
+        return sorted(found, key=lambda t: (t[:15], t[15:-1]))
+
+    def diff(self, user, relation, old, new):
+        """
+        Returns (added, removed) id lists between two snapshots, e.g. the
+        users who followed and unfollowed between them.
+        """
+        return diff(self.load(user, relation, old),
+                    self.load(user, relation, new))
+
+    def _path(self, user, relation, timestamp):
+        return os.path.join(self.directory, str(user), relation,
+                            "%s.ids" % timestamp)
+
+
+def format_timestamp(microseconds):
+    """
+    Returns the snapshot timestamp for a time in microseconds since the
+    epoch.
+    """
+    seconds, fraction = divmod(microseconds, 1000000)
+    return "%s.%06iZ" % (time.strftime("%Y%m%dT%H%M%S", time.gmtime(seconds)),
+                         fraction)
+
+
+def diff(old, new):
+    """
+    Compares two sorted lists of ids in a single linear merge, returning
+    the ids only in new (added) and the ids only in old (removed).
+    """
+    added = []
+    removed = []
+    i = j = 0
+    while i < len(old) and j < len(new):
+        if old[i] == new[j]:
+            i += 1
+            j += 1
+        elif old[i] < new[j]:
+            removed.append(old[i])
+            i += 1
+        else:
+            added.append(new[j])
+            j += 1
+    removed.extend(old[i:])
+    added.extend(new[j:])
+    return added, removed
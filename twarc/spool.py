@@ -0,0 +1,167 @@
+"""
+A buffer that keeps a stream connection being read at line rate even when
+whatever is consuming the stream stalls.
+"""
+
+import os
+import json
+import logging
+import threading
+
+try:
+    import queue  # Python 3
+except ImportError:
+    import Queue as queue  # Python 2
+
+# with 64MB segments the spool takes up to 10GB before tweets are dropped
+MAX_SEGMENTS = 160
+
+
+class Spool(object):
+    """
+    Spool wraps an iterator (usually Twarc.filter or Twarc.sample) and reads
+    it on its own thread. Items are handed over through an in-memory queue,
+    and when that queue is full they are appended to segment files in a
+    spool directory instead. Once anything has been spilled to disk new
+    items keep going to disk until the consumer has drained it, so items
+    always come out in the order they were read.
+
+    Segments are deleted as soon as they have been read. When there are
+    max_segments of them the oldest unread segment is discarded, with a
+    warning, so disk usage is bounded like a ring buffer. Pass None for
+    max_segments to let the spool grow until the disk is full.
+    """
+
+    def __init__(self, iterator, directory, memory_size=10000,
+                 segment_size=64 * 1024 * 1024, max_segments=MAX_SEGMENTS):
+        self.iterator = iterator
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self.queue = queue.Queue(maxsize=memory_size)
+        self.lock = threading.Lock()
+        self.thread = None
+        self.finished = False
+        self.error = None
+        self.spilled = 0
+        self.discarded = 0
+
+        # segment numbers that are on disk, oldest first
+        self.segments = []
+        self.writer = None
+        self.reader = None
+        self.reader_segment = None
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def __iter__(self):
+        self.start()
+        while True:
+            try:
+                yield self.queue.get_nowait()
+                continue
+            except queue.Empty:
+                pass
+
+            with self.lock:
+                item = self._read_disk()
+                finished = self.finished and not self.segments
+            if item is not None:
+                yield item
+                continue
+            if finished and self.queue.empty():
+                break
+
+            try:
+                yield self.queue.get(timeout=0.25)
+            except queue.Empty:
+                pass
+
+        if self.error:
+            raise self.error
+
+    def start(self):
+        if self.thread:
+            return
+        self.thread = threading.Thread(target=self._fill)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _fill(self):
+        try:
+            for item in self.iterator:
+                with self.lock:
+                    if self.segments:
+                        self._write_disk(item)
+                        continue
+                    try:
+                        self.queue.put_nowait(item)
+                    except queue.Full:
+                        logging.warn("consumer is stalled, spooling to %s",
+                                     self.directory)
+                        self._write_disk(item)
+        except Exception as e:
+            logging.error("spooled stream failed: %s", e)
+            self.error = e
+        finally:
+            with self.lock:
+                if self.writer:
+                    self.writer.flush()
+                self.finished = True
+            logging.info("spooled %s items to disk, discarded %s segments",
+                         self.spilled, self.discarded)
+
+    def _segment_path(self, num):
+        return os.path.join(self.directory, "spool-%06i.jsonl" % num)
+
+    def _write_disk(self, item):
+        if not self.writer or self.writer.tell() >= self.segment_size:
+            self._rotate()
+        self.writer.write(json.dumps(item))
+        self.writer.write("\n")
+        self.spilled += 1
+
+    def _rotate(self):
+        if self.writer:
+            self.writer.close()
+        num = self.segments[-1] + 1 if self.segments else 1
+        self.segments.append(num)
+        self.writer = open(self._segment_path(num), "w")
+
+        if self.max_segments and len(self.segments) > self.max_segments:
+            oldest = self.segments.pop(0)
+            if self.reader_segment == oldest:
+                self.reader.close()
+                self.reader = self.reader_segment = None
+            logging.warn("spool is full (%s segments), discarding unread "
+                         "segment %s", self.max_segments, oldest)
+            self.discarded += 1
+            os.remove(self._segment_path(oldest))
+
+    def _read_disk(self):
+        """
+        Returns the next spooled item, or None if there's nothing on disk.
+        Must be called with the lock held.
+        """
+        while self.segments:
+            oldest = self.segments[0]
+            if self.reader_segment != oldest:
+                self.reader = open(self._segment_path(oldest), "r")
+                self.reader_segment = oldest
+            if oldest == self.segments[-1]:
+                self.writer.flush()
+
+            line = self.reader.readline()
+            if line:
+                return json.loads(line)
+
+            if oldest == self.segments[-1]:
+                # caught up with the writer: go back to using memory
+                self.writer.close()
+                self.writer = None
+            self.reader.close()
+            self.reader = self.reader_segment = None
+            self.segments.pop(0)
+            os.remove(self._segment_path(oldest))
+        return None
@@ -0,0 +1,123 @@
+"""
+Refresh the timelines of many users at once, remembering the newest tweet
+seen for each of them so that only new tweets are fetched next time.
+"""
+
+import re
+import time
+import sqlite3
+import logging
+import threading
+
+import requests
+
+from twarc.scheduler import Scheduler
+
+
+class SinceIdStore(object):
+    """
+    A small SQLite database that records, for each user, the newest tweet id
+    collected, when their timeline was last checked and how many tweets that
+    check found.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS timelines (
+                user TEXT PRIMARY KEY,
+                since_id TEXT,
+                checked REAL,
+                count INTEGER
+            )
+            """
+        )
+        self.db.commit()
+
+    def get(self, user):
+        """
+        Returns (since_id, checked, count) for a user, or None if they haven't
+        been seen before.
+        """
+        with self.lock:
+            return self.db.execute(
+                "SELECT since_id, checked, count FROM timelines WHERE user = ?",
+                (user,)
+            ).fetchone()
+
+    def update(self, user, since_id, count, checked=None):
+        checked = checked or time.time()
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO timelines VALUES (?, ?, ?, ?)",
+                (user, since_id, checked, count)
+            )
+            self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+def harvest(users, store, pool, write, workers=4, cooloff=0, **twarc_args):
+    """
+    Collects new tweets for every user (screen names or user ids) in an
+    iterator concurrently, passing each tweet to write(). Users whose last
+    check found nothing are skipped until cooloff seconds have passed.
+    Returns the number of users that were checked.
+    """
+    scheduler = Scheduler(pool, workers=workers, **twarc_args)
+    lock = threading.Lock()
+
+    def locked_write(job, tweet):
+        with lock:
+            write(tweet)
+
+    def make_func(user, since_id):
+        def func(t):
+            if re.match('^[0-9]+$', user):
+                kwargs = {"user_id": user}
+            else:
+                kwargs = {"screen_name": user}
+            newest = since_id
+            count = 0
+            try:
+                for tweet in t.timeline(since_id=since_id, **kwargs):
+                    if not newest or int(tweet['id_str']) > int(newest):
+                        newest = tweet['id_str']
+                    count += 1
+                    yield tweet
+            except requests.exceptions.HTTPError as e:
+                if e.response.status_code != 401:
+                    raise e
+                logging.info("timeline for %s is protected", user)
+            store.update(user, newest, count)
+            logging.info("found %s new tweets for %s", count, user)
+        return func
+
+    now = time.time()
+    checked = 0
+    skipped = 0
+    for user in users:
+        user = user.strip().lstrip('@')
+        if not user:
+            continue
+        since_id = None
+        row = store.get(user)
+        if row:
+            since_id, last_checked, last_count = row
+            if last_count == 0 and now - last_checked < cooloff:
+                skipped += 1
+                continue
+        scheduler.submit(make_func(user, since_id), name=user,
+                         callback=locked_write)
+        checked += 1
+
+    scheduler.join()
+    scheduler.shutdown()
+    logging.info("checked %s timelines, skipped %s in cool-off", checked,
+                 skipped)
+    return checked
@@ -0,0 +1,183 @@
+"""
+The HTTP sessions that Twarc instances make their requests with.
+
+A Transport keeps one session per token and hands it out to the Twarc
+instances that use it, which can be in several threads. OAuth1Transport
+talks to Twitter with a connection pool of a given size for each token and
+retries failed connections in the HTTP adapter, so a dropped connection is
+replaced without throwing away the rest of the pool or the session.
+MockTransport answers requests in the same process, which is handy for
+tests and benchmarks that shouldn't touch the network.
+"""
+
+import json
+import time
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests_oauthlib import OAuth1Session
+from urllib3.util.retry import Retry
+
+
+class Transport(object):
+    """
+    Opens a session for each token the first time it is asked for one and
+    keeps it until it is closed.
+    """
+
+    def __init__(self):
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def session(self, token, keys):
+        """
+        Returns the session for a token, opening one with its keys (consumer
+        key and secret, access token and secret) if there isn't one yet.
+        """
+        with self.lock:
+            if token not in self.sessions:
+                logging.info("creating http session for token %s", token)
+                self.sessions[token] = self.open(token, keys)
+            return self.sessions[token]
+
+    def open(self, token, keys):
+        raise NotImplementedError()
+
+    def recover(self, token):
+        """
+        Called after a request with a token failed with a connection error,
+        read timeout or bad encoding, before it is tried again. The session
+        is kept since the connection pool drops broken connections itself.
+        """
+        pass
+
+    def close(self, token=None):
+        """
+        Closes the session for a token, or all of them if there isn't one,
+        along with their pooled connections.
+        """
+        with self.lock:
+            if token is None:
+                tokens = list(self.sessions)
+            else:
+                tokens = [token]
+            for t in tokens:
+                session = self.sessions.pop(t, None)
+                if session:
+                    logging.info("closing http session for token %s", t)
+                    session.close()
+
+
+class OAuth1Transport(Transport):
+    """
+    OAuth1 sessions with pool_size keep-alive connections per host for each
+    token, or pool_size[token] if it is a dictionary. Connections that can't
+    be made (and GETs whose response doesn't arrive) are retried up to
+    retries times by the adapter, waiting backoff, 2 * backoff, ... seconds
+    in between, before the error reaches Twarc.
+    """
+
+    def __init__(self, pool_size=10, retries=3, backoff=0.5,
+                 session_class=None):
+        Transport.__init__(self)
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff = backoff
+        self.session_class = session_class or OAuth1Session
+
+    def open(self, token, keys):
+        consumer_key, consumer_secret, access_token, access_token_secret = keys
+        session = self.session_class(
+            client_key=consumer_key,
+            client_secret=consumer_secret,
+            resource_owner_key=access_token,
+            resource_owner_secret=access_token_secret
+        )
+        adapter = self.adapter(token)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def adapter(self, token):
+        if isinstance(self.pool_size, dict):
+            size = self.pool_size.get(token, 10)
+        else:
+            size = self.pool_size
+        # rate limits and server errors are left to Twarc
+        retry = Retry(total=self.retries, connect=self.retries,
+                      read=self.retries, status=0, redirect=3,
+                      backoff_factor=self.backoff, raise_on_status=False)
+        return HTTPAdapter(pool_connections=4, pool_maxsize=size,
+                           max_retries=retry)
+
+
+class MockTransport(Transport):
+    """
+    Answers every request with handler(method, url, kwargs), after waiting
+    delay seconds. The handler can return a requests Response, a
+    (status_code, body) tuple or just a body for a 200. Bodies that aren't
+    bytes are sent as JSON. The requests made are counted in calls.
+    """
+
+    def __init__(self, handler, delay=0):
+        Transport.__init__(self)
+        self.handler = handler
+        self.delay = delay
+        self.calls = 0
+
+    def open(self, token, keys):
+        return MockSession(self)
+
+    def request(self, method, url, kwargs):
+        with self.lock:
+            self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        result = self.handler(method, url, kwargs)
+        if isinstance(result, requests.Response):
+            return result
+        if isinstance(result, tuple):
+            status_code, body = result
+        else:
+            status_code, body = 200, result
+        return response(status_code, body, url)
+
+
+class MockSession(object):
+
+    def __init__(self, transport):
+        self.transport = transport
+
+    def get(self, url, **kwargs):
+        return self.transport.request("GET", url, kwargs)
+
+    def post(self, url, data=None, **kwargs):
+        kwargs["data"] = data
+        return self.transport.request("POST", url, kwargs)
+
+    def mount(self, prefix, adapter):
+        pass
+
+    def close(self):
+        pass
+
+
+def response(status_code, body, url=None, headers=None):
+    """
+    Returns a requests Response with a status code and body, which is sent
+    as JSON unless it is bytes.
+    """
+    resp = requests.Response()
+    resp.status_code = status_code
+    resp.url = url
+    resp.reason = "OK" if status_code == 200 else "Error"
+    resp.headers.update(headers or {})
+    if not isinstance(body, bytes):
+        body = json.dumps(body).encode("utf8")
+        resp.headers["content-type"] = "application/json"
+    resp.encoding = "utf8"
+    resp._content = body
+    resp._content_consumed = True
+    return resp
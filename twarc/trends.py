@@ -0,0 +1,190 @@
+"""
+Follow the trends for many places, writing out only what changes.
+
+Places can be given as WOEIDs, lat,lon pairs or names from the trends
+catalogue. The catalogue and the lat,lon lookups are kept in a Cache so
+they don't need to be fetched on every run. Each round the trends for
+every place are fetched concurrently over the token pool and compared
+with the last ones seen, which are kept in SQLite, and a record is written
+for each trend that is new, has dropped out or has moved up or down.
+"""
+
+import re
+import time
+import sqlite3
+import logging
+import threading
+
+import requests
+
+from twarc.scheduler import Scheduler
+
+NEW = "new"
+DROPPED = "dropped"
+MOVED = "moved"
+
+
+class TrendStore(object):
+    """
+    The last trends seen for each WOEID, with their rank and tweet volume.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS trends (
+                woeid INTEGER,
+                name TEXT,
+                rank INTEGER,
+                tweet_volume INTEGER,
+                as_of TEXT,
+                PRIMARY KEY (woeid, name)
+            )
+            """
+        )
+        self.db.commit()
+
+    def get(self, woeid):
+        """
+        Returns a dictionary of trend names to ranks for a WOEID.
+        """
+        with self.lock:
+            return dict(self.db.execute(
+                "SELECT name, rank FROM trends WHERE woeid = ?", (woeid,)))
+
+    def replace(self, woeid, trends, as_of):
+        with self.lock:
+            self.db.execute("DELETE FROM trends WHERE woeid = ?", (woeid,))
+            self.db.executemany(
+                "INSERT INTO trends VALUES (?, ?, ?, ?, ?)",
+                [(woeid, t['name'], rank, t.get('tweet_volume'), as_of)
+                 for rank, t in enumerate(trends, 1)])
+            self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+def changes(woeid, old, trends, as_of):
+    """
+    Compares the old trend ranks for a place with its current list of
+    trends, returning a change record for each new, dropped or moved trend.
+    """
+    found = []
+    current = set()
+    for rank, trend in enumerate(trends, 1):
+        current.add(trend['name'])
+        old_rank = old.get(trend['name'])
+        if old_rank == rank:
+            continue
+        found.append({
+            "woeid": woeid,
+            "name": trend['name'],
+            "change": NEW if old_rank is None else MOVED,
+            "rank": rank,
+            "old_rank": old_rank,
+            "tweet_volume": trend.get('tweet_volume'),
+            "as_of": as_of
+        })
+    for name, old_rank in sorted(old.items(), key=lambda i: i[1]):
+        if name not in current:
+            found.append({
+                "woeid": woeid,
+                "name": name,
+                "change": DROPPED,
+                "rank": None,
+                "old_rank": old_rank,
+                "tweet_volume": None,
+                "as_of": as_of
+            })
+    return found
+
+
+def resolve_places(t, places):
+    """
+    Turns a list of WOEIDs, lat,lon pairs and place names into WOEIDs.
+    Names are matched against the trends catalogue, ignoring case.
+    """
+    woeids = []
+    catalogue = None
+    for place in places:
+        place = place.strip()
+        if not place:
+            continue
+        geo = re.match(r'^([0-9\-\.]+),([0-9\-\.]+)$', place)
+        if re.match(r'^\d+$', place):
+            woeids.append(int(place))
+        elif geo:
+            closest = t.trends_closest(*map(float, geo.groups()))
+            if not closest:
+                raise ValueError("no trends near %s" % place)
+            woeids.append(closest[0]['woeid'])
+        else:
+            if catalogue is None:
+                catalogue = t.trends_available()
+            matches = [r['woeid'] for r in catalogue
+                       if r['name'].lower() == place.lower()]
+            if not matches:
+                raise ValueError("no trends for a place called %s" % place)
+            woeids.extend(matches)
+    # keep the order but only poll each place once
+    seen = set()
+    return [w for w in woeids if not (w in seen or seen.add(w))]
+
+
+def collect(woeids, store, pool, write, workers=4, **twarc_args):
+    """
+    Fetches the trends for every WOEID concurrently and passes each change
+    since the last time to write(). Returns the number of changes.
+    """
+    scheduler = Scheduler(pool, workers=workers, **twarc_args)
+    lock = threading.Lock()
+    count = [0]
+
+    def locked_write(job, change):
+        with lock:
+            count[0] += 1
+            write(change)
+
+    def make_func(woeid):
+        def func(t):
+            try:
+                result = t.trends_place(woeid)
+            except requests.exceptions.HTTPError as e:
+                if e.response.status_code != 404:
+                    raise e
+                return
+            if not result:
+                return
+            trends = result[0]['trends']
+            as_of = result[0].get('as_of')
+            for change in changes(woeid, store.get(woeid), trends, as_of):
+                yield change
+            store.replace(woeid, trends, as_of)
+        return func
+
+    for woeid in woeids:
+        scheduler.submit(make_func(woeid), name=str(woeid),
+                         callback=locked_write)
+    scheduler.join()
+    scheduler.shutdown()
+    logging.info("%s trend changes in %s places", count[0], len(woeids))
+    return count[0]
+
+
+def watch(woeids, store, pool, write, interval=300, event=None, **kwargs):
+    """
+    Collects trend changes every interval seconds until the event is set.
+    """
+    while not (event and event.is_set()):
+        started = time.time()
+        collect(woeids, store, pool, write, **kwargs)
+        wait = max(0, interval - (time.time() - started))
+        if event:
+            event.wait(wait)
+        else:
+            time.sleep(wait)
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+"""
+Convert a file of ids, one per line, to a binary id file that twarc can
+hydrate or look up users from, or convert a binary id file back to text.
+
+Raw id files keep the ids in the order they were given. Compressed ones
+are sorted, without duplicates, and are usually a good deal smaller.
+
+Example usage:
+utils/binary_ids.py ids.txt ids.bin
+utils/binary_ids.py --compress ids.txt ids.bin
+utils/binary_ids.py --text ids.bin > ids.txt
+"""
+
+from __future__ import print_function
+
+import sys
+import argparse
+import fileinput
+
+from twarc.ids import IdWriter, read_ids
+
+parser = argparse.ArgumentParser("binary_ids")
+parser.add_argument("input", help="file of ids, or id file with --text")
+parser.add_argument("output", nargs="?", default=None,
+                    help="id file to write")
+parser.add_argument("--compress", action="store_true",
+                    help="sort, delta encode and compress the ids")
+parser.add_argument("--text", action="store_true",
+                    help="write the ids in an id file out as text")
+args = parser.parse_args()
+
+if args.text:
+    for id in read_ids(args.input):
+        print(id)
+    sys.exit()
+
+if not args.output:
+    parser.error("an output file is needed")
+
+writer = IdWriter(args.output, compress=args.compress)
+for line in fileinput.input(args.input, openhook=fileinput.hook_compressed):
+    line = line.strip()
+    if line:
+        writer.write(line)
+writer.close()
@@ -5,18 +5,28 @@ This program assumes that you are feeding it tweet JSON data for tweets
 that have been deleted. It will use the metadata and the API to
 analyze why each tweet appears to have been deleted.
 
+Tweets are read in chunks, and the users and tweets in each chunk are
+checked 100 at a time with users/lookup and statuses/lookup, concurrently
+over a pool of tokens. Only the users that users/lookup leaves out are
+looked up one at a time with users/show, to tell suspended users from
+deleted ones. If --cache is given the results are kept on disk, so they
+aren't looked up again on the next run.
+
 Note that lookups are based on user id, so may give different results than
 looking up a user by screen name.
 """
 
 import json
 import fileinput
+import itertools
 import collections
+import threading
 import requests
-import twarc
 import argparse
 import logging
 
+from twarc.scheduler import Scheduler, TokenPool, parse_tokens
+
 USER_OK = "USER_OK"
 USER_DELETED = "USER_DELETED"
 USER_PROTECTED = "USER_PROTECTED"
@@ -29,22 +39,40 @@ ORIGINAL_USER_DELETED = "ORIGINAL_USER_DELETED"
 ORIGINAL_USER_PROTECTED = "ORIGINAL_USER_PROTECTED"
 ORIGINAL_USER_SUSPENDED = "ORIGINAL_USER_SUSPENDED"
 
-t = twarc.Twarc()
+# used for anything the batched lookups couldn't settle
+t = None
+
+# an optional twarc.cache.Cache shared with other twarc lookups
+cache = None
 
 
-def main(files, enhance_tweet=False, print_results=True):
+def main(files, enhance_tweet=False, print_results=True, pool=None,
+         workers=4, chunk_size=10000):
+    global t
+    scheduler = Scheduler(pool or TokenPool([0]), workers=workers,
+                          cache=cache, trim_user=True,
+                          include_entities=False)
+    t = scheduler.twarc()
     counts = collections.Counter()
-    for count, line in enumerate(fileinput.input(files=files)):
-        if count % 10000 == 0:
-            logging.info("processed {:,} tweets".format(count))
-        tweet = json.loads(line)
-        result = examine(tweet)
-        if enhance_tweet:
-            tweet['delete_reason'] = result
-            print(json.dumps(tweet))
-        else:
-            print(tweet_url(tweet), result)
-        counts[result] += 1
+    lines = fileinput.input(files=files)
+    count = 0
+    while True:
+        chunk = [json.loads(line) for line in
+                 itertools.islice(lines, chunk_size)]
+        if not chunk:
+            break
+        check(chunk, scheduler)
+        for tweet in chunk:
+            result = examine(tweet)
+            if enhance_tweet:
+                tweet['delete_reason'] = result
+                print(json.dumps(tweet))
+            else:
+                print(tweet_url(tweet), result)
+            counts[result] += 1
+        count += len(chunk)
+        logging.info("processed {:,} tweets".format(count))
+    scheduler.shutdown()
     if print_results:
         for result, count in counts.most_common():
             print(result, count)
@@ -83,13 +111,97 @@ def examine(tweet):
 
 
 users = {}
+tweets = {}
+
+
+def check(chunk, scheduler):
+    """
+    Looks up the status of the users and tweets that examine() will need
+    for a list of tweets, so that it doesn't have to call the API itself.
+    Users are checked first since a tweet's own status only matters when
+    its user is OK.
+    """
+    tweet_users = {}
+    for tweet in chunk:
+        while tweet:
+            tweet_users[tweet['id_str']] = tweet['user']['id_str']
+            tweet = tweet.get('retweeted_status')
+    resolve(scheduler, users, "user_status", tweet_users.values(),
+            check_users)
+    resolve(scheduler, tweets, "tweet_status",
+            [i for i, u in tweet_users.items() if users.get(u) == USER_OK],
+            check_tweets)
+
+
+def resolve(scheduler, known, kind, ids, make_func):
+    """
+    Adds the status of each id that isn't already known, from the cache if
+    it's there or else by running make_func's jobs on 100 ids at a time.
+    """
+    ids = sorted(set(i for i in ids if i not in known))
+    if cache and ids:
+        cached = cache.get_many(kind, ids)
+        known.update(cached)
+        ids = [i for i in ids if i not in cached]
+    if not ids:
+        return
+
+    lock = threading.Lock()
+    found = {}
+
+    def save(job, item):
+        with lock:
+            found[item[0]] = item[1]
+
+    for i in range(0, len(ids), 100):
+        scheduler.submit(make_func(ids[i:i + 100]), name=kind,
+                         callback=save)
+    scheduler.join()
+    known.update(found)
+    if cache:
+        cache.put_many(kind, found)
+
+
+def check_users(user_ids):
+    def func(t):
+        seen = set()
+        try:
+            for user in t.user_lookup(user_ids=user_ids):
+                seen.add(user['id_str'])
+                if user['protected']:
+                    yield user['id_str'], USER_PROTECTED
+                else:
+                    yield user['id_str'], USER_OK
+        except requests.exceptions.HTTPError as e:
+            # none of the users could be found
+            if e.response.status_code != 404:
+                raise e
+        # users/lookup leaves out deleted and suspended users alike
+        for user_id in user_ids:
+            if user_id not in seen:
+                yield user_id, user_status(t, user_id)
+    return func
+
+
+def check_tweets(tweet_ids):
+    def func(t):
+        # only tweets by users that are OK are checked, so a missing tweet
+        # can only have been deleted
+        for tweet_id, tweet in t.lookup(tweet_ids, dedupe=False):
+            yield tweet_id, TWEET_OK if tweet else TWEET_DELETED
+    return func
 
 
 def get_user_status(tweet):
     user_id = tweet['user']['id_str']
-    if user_id in users:
-        return users[user_id]
+    if user_id not in users:
+        users[user_id] = user_status(t, user_id)
+        if cache:
+            cache.put("user_status", user_id, users[user_id])
+    return users[user_id]
 
+
+def user_status(t, user_id):
     url = "https://api.twitter.com/1.1/users/show.json"
     params = {"user_id": user_id}
 
@@ -113,18 +225,19 @@ def get_user_status(tweet):
             result = USER_SUSPENDED
         else:
             raise e
-
-    users[user_id] = result
     return result
 
 
-tweets = {}
-
-
 def get_tweet_status(tweet):
     id = tweet['id_str']
-    if id in tweets:
-        return tweets[id]
+    if id not in tweets:
+        tweets[id] = tweet_status(t, id)
+        if cache:
+            cache.put("tweet_status", id, tweets[id])
+    return tweets[id]
+
+
+def tweet_status(t, id):
     # USER_SUSPENDED: 403 and {"errors":[{"code":63,"message":"User has been suspended."}]}
     # USER_PROTECTED: 403 and {"errors":[{"code":179,"message":"Sorry, you are not authorized to see this status."}]}
     # TWEET_DELETED: 404 and {"errors":[{"code":144,"message":"No status found with that ID."}]}
@@ -149,8 +262,6 @@ def get_tweet_status(tweet):
             result = USER_PROTECTED
         else:
             raise e
-
-    tweets[id] = result
     return result
 
 
@@ -173,8 +284,23 @@ if __name__ == "__main__":
     parser.add_argument('--enhance', action='store_true',
                         help='Enhance tweet with delete_reason and output enhanced tweet.')
     parser.add_argument('--skip-results', action='store_true', help='Skip outputting delete reason summary')
+    parser.add_argument('--cache', help='cache lookups in this database file')
+    parser.add_argument('--cache-ttl', type=int, default=86400,
+                        help='seconds before a cached lookup expires')
+    parser.add_argument('--tokens', default='0',
+                        help='share a pool of token sets, e.g. 0-8 or 0,2,5')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='number of lookups to run at once')
+    parser.add_argument('--chunk-size', type=int, default=10000,
+                        help='number of tweets to check at a time')
     parser.add_argument('files', metavar='FILE', nargs='*', help='files to read, if empty, stdin is used')
     args = parser.parse_args()
 
+    if args.cache:
+        from twarc.cache import Cache
+        cache = Cache(args.cache, ttl=args.cache_ttl)
+
     main(args.files if len(args.files) > 0 else ('-',), enhance_tweet=args.enhance,
-         print_results=not args.skip_results and not args.enhance)
+         print_results=not args.skip_results and not args.enhance,
+         pool=TokenPool(parse_tokens(args.tokens)), workers=args.workers,
+         chunk_size=args.chunk_size)
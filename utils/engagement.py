@@ -0,0 +1,23 @@
+#!/usr/bin/env python
+"""
+Print the retweet, favorite, reply and quote counts collected by
+`twarc track` as CSV, one row per check of each tweet.
+
+Example usage:
+utils/engagement.py engagement > engagement.csv
+"""
+
+from __future__ import print_function
+
+import sys
+
+from twarc.engagement import columns, read_samples
+
+if len(sys.argv) != 2:
+    sys.exit("usage: engagement.py <track directory>")
+
+samples = read_samples(sys.argv[1])
+names = [name for name, code in columns]
+print(",".join(names))
+for row in zip(*[samples[name] for name in names]):
+    print(",".join(str(value) for value in row))
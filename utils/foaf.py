@@ -17,6 +17,7 @@ import re
 import sys
 import twarc
 import logging
+import collections
 import argparse
 import requests
 
@@ -42,20 +43,29 @@ def friendships(user_id, level=2):
     of a friend network (level=2), but you can expand this by settings the 
     level parameter to either another number. But beware, it could run for a 
     while!
+
+    The network is walked breadth first and each user's friends are only
+    fetched once, even if they are friends of several users. For large
+    crawls use the twarc graph command, which runs concurrently and can be
+    resumed.
     """
 
-    logging.info("getting friends for user %s", user_id)
-    level -= 1
-    try:
-        for friend_id in t.friend_ids(user_id):
-            yield (user_id, friend_id)
-            if level > 0:
-                yield from friendships(friend_id, level)
-    except requests.exceptions.HTTPError as e:
-        if e.response.status_code == 401:
-            logging.error("can't get friends for protected user %s", user_id)
-        else:
-            raise(e)
+    seen = set([user_id])
+    queue = collections.deque([(user_id, 1)])
+    while queue:
+        user_id, depth = queue.popleft()
+        logging.info("getting friends for user %s", user_id)
+        try:
+            for friend_id in t.friend_ids(user_id):
+                yield (user_id, friend_id)
+                if depth < level and friend_id not in seen:
+                    seen.add(friend_id)
+                    queue.append((friend_id, depth + 1))
+        except requests.exceptions.HTTPError as e:
+            if e.response.status_code == 401:
+                logging.error("can't get friends for protected user %s", user_id)
+            else:
+                raise(e)
 
 if re.match("^\d+$", args.user):
     seed_user_id = args.user
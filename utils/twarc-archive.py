@@ -24,8 +24,12 @@ another file which includes any new tweets since that tweet:
 
     /mnt/tweets/ferguson/tweets-0002.jsonl.gz
 
+The newest tweet id found for each search is also kept in archive.db in the
+directory, so it doesn't need to be read back out of the archive files.
+
 This functionality was initially part of twarc.py itself, but has been split out
-into a separate utility.
+into a separate utility. To keep many searches up to date on a schedule have a
+look at the `twarc poll` command, which writes archives in the same layout.
 
 """
 from __future__ import print_function
@@ -39,6 +43,8 @@ import twarc
 import logging
 import argparse
 
+from twarc.polling import QueryStore, Locked, lock
+
 archive_file_fmt = "tweets-%04i.jsonl.gz"
 archive_file_pat = "tweets-(\d+).jsonl.gz$"
 
@@ -83,18 +89,11 @@ def main():
         format="%(asctime)s %(levelname)s %(message)s"
     )
 
-    lockfile = os.path.join(args.archive_dir, '') + "lockfile"
-    if not os.path.exists(lockfile):
-        pid = os.getpid()
-        lockfile_handle = open(lockfile, "w")
-        lockfile_handle.write(str(pid))
-        lockfile_handle.close()
-    else:
-        old_pid = "unknown"
-        with open(lockfile, "r") as lockfile_handle:
-            old_pid = lockfile_handle.read()
-
-        sys.exit("Another twarc-archive.py process with pid " + old_pid + " is running. If the process is no longer active then it may have been interrupted. In that case remove the 'lockfile' in " + args.archive_dir + " and run the command again.")
+    # the lock is released when we exit, even if we crash
+    try:
+        lockfile = lock(os.path.join(args.archive_dir, "lockfile"))
+    except Locked:
+        sys.exit("Another process is already archiving to " + args.archive_dir)
 
     logging.info("logging search for %s to %s", args.search, args.archive_dir)
 
@@ -105,11 +104,13 @@ def main():
                     config=args.config,
                     tweet_mode=args.tweet_mode)
 
+    store = QueryStore(os.path.join(args.archive_dir, "archive.db"))
+    store.add(args.search, 0)
+    last_id = store.get(args.search)[0]
     last_archive = get_last_archive(args.archive_dir)
-    if last_archive:
+    if not last_id and last_archive:
+        # archives from before there was a store
         last_id = json.loads(next(gzip.open(last_archive, 'rt')))['id_str']
-    else:
-        last_id = None
 
     if args.twarc_command == "search":
         tweets = t.search(args.search, since_id=last_id)
@@ -126,8 +127,13 @@ def main():
     # we only create the file if there are new tweets to save
     # this prevents empty archive files
     fh = None
+    newest = None
+    count = 0
 
     for tweet in tweets:
+        if not newest or int(tweet["id_str"]) > int(newest):
+            newest = tweet["id_str"]
+        count += 1
         if not fh:
             fh = gzip.open(next_archive, "wt")
         logging.info("archived %s", tweet["id_str"])
@@ -139,8 +145,9 @@ def main():
     else:
         logging.info("no new tweets found for %s", args.search)
 
-    if os.path.exists(lockfile):
-        os.remove(lockfile)
+    store.update(args.search, newest or last_id, count)
+    store.close()
+    lockfile.close()
 
 def get_last_archive(archive_dir):
     count = 0
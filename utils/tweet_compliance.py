@@ -7,17 +7,21 @@ tweets.
 
 Also useful for splitting out available tweets from unavailable tweets.
 
-Example usage: python tweet_compliance.py test.txt > test.json 2> test_delete.txt
+Example usage: python tweet_compliance.py --tokens 0-3 test.txt
 
 For each tweet in a list of tweets or tweet ids provided by standard input or contained in files,
 looks up the current tweet state.
 
-If a tweet is not available and tweet ids are provided, the tweet id is
-output to standard error.
+The current version of each available tweet (i.e., the tweet retrieved from the API) is written to
+available-001.jsonl, available-002.jsonl, etc.
 
-If a tweet is not available and tweets are provided, the (deleted) tweet is output to standard error.
+If a tweet is not available and tweet ids are provided, the tweet id is written to
+unavailable-001.jsonl, etc. If tweets are provided, the (deleted) tweet is written instead.
 
-Otherwise, the current tweet (i.e., the tweet retrieved from the API) is returned to standard out.
+The input is read in chunks that are hydrated 100 tweets at a time, concurrently over a pool of
+tokens. After each chunk the position in the input and the output files is saved to a state file,
+so if the program is stopped, running it again with the same arguments carries on where it left off.
+The state file is removed once all of the input has been read, so the next run starts afresh.
 
 Ordering is not guaranteed.
 
@@ -25,55 +29,210 @@ Requires Twitter API keys provided in ~/.twarc or environment variables. (See tw
 """
 from __future__ import print_function
 
+import os
+import sys
 import json
+import time
+import codecs
+import argparse
 import fileinput
-import twarc
-import sys
+import itertools
+import threading
 import logging
 
-# Send logging to file instead of STDERR.
-logging.basicConfig(
-        filename="tweet_compliance.log",
-        level=logging.INFO,
-        format="%(asctime)s %(levelname)s %(message)s"
-    )
-
-t = twarc.Twarc()
-
-
-def process_tweets(tweets):
-    available_tweet_ids = set()
-    # Hydrate the tweets.
-    for tweet in t.hydrate(tweets.keys()):
-        # Keep track of the tweet ids of the tweets that are available.
-        available_tweet_ids.add(tweet['id_str'])
-        # Print available tweets to STDOUT.
-        print(json.dumps(tweet))
-
-    # Find the unavailable tweets.
-    for tweet_id, tweet in tweets.items():
-        if tweet_id not in available_tweet_ids:
-            # Print tweet or tweet id to STDERR
-            if tweets[tweet_id]:
-                print(json.dumps(tweets[tweet_id]), file=sys.stderr)
+from twarc.command import numbered_filepath
+from twarc.scheduler import Scheduler, TokenPool, parse_tokens
+
+
+class RotatingFile(object):
+    """
+    Writes lines to numbered files, starting a new one every split lines.
+    Its position can be saved and restored, which truncates away anything
+    written since the position was saved.
+    """
+
+    def __init__(self, path, split, position=None):
+        self.path = path
+        self.split = split
+        self.num, self.lines, size = position or (1, 0, 0)
+        filename = numbered_filepath(path, self.num)
+        if os.path.isfile(filename):
+            self.fh = codecs.open(filename, 'r+b', 'utf8')
+            self.fh.truncate(size)
+            self.fh.seek(size)
+        else:
+            self.fh = codecs.open(filename, 'wb', 'utf8')
+
+    def write(self, line):
+        if self.split and self.lines >= self.split:
+            self.fh.close()
+            self.num += 1
+            self.lines = 0
+            self.fh = codecs.open(numbered_filepath(self.path, self.num),
+                                  'wb', 'utf8')
+        self.fh.write(line + "\n")
+        self.lines += 1
+
+    def position(self):
+        self.fh.flush()
+        return [self.num, self.lines, self.fh.tell()]
+
+    def close(self):
+        self.fh.close()
+
+
+def load_state(path, files):
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as fh:
+        state = json.load(fh)
+    if state.get('files') != files:
+        sys.exit("%s is for %s, remove it to start again" % (
+            path, " ".join(state.get('files'))))
+    return state
+
+
+def save_state(path, state):
+    # write and rename so a crash can't leave half a state file behind
+    with open(path + ".tmp", "w") as fh:
+        json.dump(state, fh)
+    os.rename(path + ".tmp", path)
+
+
+def parse_line(line):
+    """
+    Returns (tweet_id, tweet) for a line that is a tweet id or tweet JSON.
+    """
+    if line.isdigit():
+        return line, None
+    tweet = json.loads(line)
+    return tweet['id_str'], tweet
+
+
+def process_chunk(scheduler, tweets, available, unavailable):
+    """
+    Hydrates a dictionary of tweet ids to the tweets they were read from,
+    or None for bare ids, 100 at a time and writes out the results. Returns
+    the number of tweets that were available, or raises the error of a
+    lookup that failed.
+    """
+    lock = threading.Lock()
+    found = [0]
+
+    def write(job, result):
+        tweet_id, tweet = result
+        with lock:
+            if tweet:
+                found[0] += 1
+                available.write(json.dumps(tweet))
+            elif tweets[tweet_id]:
+                unavailable.write(json.dumps(tweets[tweet_id]))
             else:
-                print(tweet_id, file=sys.stderr)
-
-tweets = {}
-for line in (line.rstrip('\n') for line in fileinput.input()):
-    # Add tweet or None to tweet map.
-    tweet_id = line
-    tweet = None
-    if not line.isdigit():
-        tweet = json.loads(line)
-        tweet_id = tweet['id_str']
-    tweets[tweet_id] = tweet
-
-    # When get to 100, process the tweets.
-    if len(tweets) == 100:
-        process_tweets(tweets)
-        tweets.clear()
-
-# Process any remaining tweets.
-if tweets:
-    process_tweets(tweets)
\ No newline at end of file
+                unavailable.write(tweet_id)
+
+    def make_func(ids):
+        def func(t):
+            return t.lookup(ids, dedupe=False)
+        return func
+
+    ids = list(tweets)
+    jobs = []
+    for i in range(0, len(ids), 100):
+        jobs.append(scheduler.submit(make_func(ids[i:i + 100]),
+                                     callback=write))
+    scheduler.join()
+    for job in jobs:
+        if job.status == "error":
+            raise job.error
+    return found[0]
+
+
+def main(files, pool, workers=4, chunk_size=10000, split=1000000,
+         available_path="available.jsonl",
+         unavailable_path="unavailable.jsonl",
+         state_path="tweet_compliance.state"):
+    state = load_state(state_path, files)
+    available = RotatingFile(available_path, split, state.get('available'))
+    unavailable = RotatingFile(unavailable_path, split,
+                               state.get('unavailable'))
+    done = state.get('lines', 0)
+    counts = state.get('counts', {"available": 0, "unavailable": 0})
+    if done:
+        logging.info("resuming after %s lines", done)
+
+    scheduler = Scheduler(pool, workers=workers)
+    fh = fileinput.FileInput(files=files)
+    lines = (line.rstrip('\n') for line in fh)
+    lines = itertools.islice(lines, done, None)
+    started = time.time()
+    processed = 0
+    try:
+        while True:
+            chunk = list(itertools.islice(lines, chunk_size))
+            if not chunk:
+                break
+            tweets = dict(parse_line(line) for line in chunk if line)
+            found = process_chunk(scheduler, tweets, available, unavailable)
+            counts["available"] += found
+            counts["unavailable"] += len(tweets) - found
+
+            done += len(chunk)
+            processed += len(chunk)
+            save_state(state_path, {
+                "files": files,
+                "lines": done,
+                "counts": counts,
+                "available": available.position(),
+                "unavailable": unavailable.position()
+            })
+
+            rate = processed / max(time.time() - started, 1)
+            msg = "%s lines, %s available, %s unavailable, %.0f lines/sec" % (
+                done, counts["available"], counts["unavailable"], rate)
+            logging.info(msg)
+            print(msg, file=sys.stderr)
+
+        # the next run with the same arguments should start over, not find
+        # there's nothing left to do
+        if os.path.isfile(state_path):
+            os.remove(state_path)
+        logging.info("finished after %s lines", done)
+    finally:
+        scheduler.shutdown()
+        fh.close()
+        available.close()
+        unavailable.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tokens', default='0',
+                        help='share a pool of token sets, e.g. 0-8 or 0,2,5')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='number of lookups to run at once')
+    parser.add_argument('--chunk-size', type=int, default=10000,
+                        help='number of lines to hydrate between checkpoints')
+    parser.add_argument('--split', type=int, default=1000000,
+                        help='lines per output file')
+    parser.add_argument('--available', default='available.jsonl',
+                        help='name of the files for available tweets')
+    parser.add_argument('--unavailable', default='unavailable.jsonl',
+                        help='name of the files for unavailable tweets')
+    parser.add_argument('--state', default='tweet_compliance.state',
+                        help='where to keep track of progress')
+    parser.add_argument('--log', default='tweet_compliance.log',
+                        help='log file')
+    parser.add_argument('files', metavar='FILE', nargs='*',
+                        help='files to read, if empty, stdin is used')
+    args = parser.parse_args()
+
+    # Send logging to file instead of STDERR.
+    logging.basicConfig(
+            filename=args.log,
+            level=logging.INFO,
+            format="%(asctime)s %(levelname)s %(message)s"
+        )
+
+    main(args.files or ['-'], TokenPool(parse_tokens(args.tokens)),
+         workers=args.workers, chunk_size=args.chunk_size, split=args.split,
+         available_path=args.available, unavailable_path=args.unavailable,
+         state_path=args.state)